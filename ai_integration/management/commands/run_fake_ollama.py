@@ -0,0 +1,54 @@
+"""
+Фиктивный сервер Ollama для нагрузочного тестирования без модели.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ai_integration.services.fake_ollama import FakeOllama, FakeOllamaServer
+
+
+class Command(BaseCommand):
+    help = 'Запускает детерминированную замену сервера Ollama с настраиваемой задержкой и долей ошибок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=11434)
+        parser.add_argument(
+            '--models', default=None,
+            help='Модели через запятую (по умолчанию — OLLAMA_DEFAULT_MODEL и OLLAMA_EMBEDDING_MODEL)'
+        )
+        parser.add_argument('--latency', type=float, default=0.0, help='Задержка каждого запроса, мс')
+        parser.add_argument('--token-latency', type=float, default=0.0, help='Задержка на токен ответа, мс')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Случайный разброс задержки, ±мс')
+        parser.add_argument('--load-latency', type=float, default=0.0, help='Задержка первого запроса к модели, мс')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Доля запросов с ответом 500 (0..1)')
+        parser.add_argument('--response-tokens', type=int, default=64, help='Длина ответа, токенов')
+        parser.add_argument('--embedding-dim', type=int, default=768)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        models = options['models'] or f"{settings.OLLAMA_DEFAULT_MODEL},{settings.OLLAMA_EMBEDDING_MODEL}"
+        fake = FakeOllama(
+            models=[name.strip() for name in models.split(',') if name.strip()],
+            latency_ms=options['latency'],
+            token_latency_ms=options['token_latency'],
+            jitter_ms=options['jitter'],
+            load_ms=options['load_latency'],
+            error_rate=options['error_rate'],
+            response_tokens=options['response_tokens'],
+            embedding_dim=options['embedding_dim'],
+            seed=options['seed'],
+        )
+        server = FakeOllamaServer((options['host'], options['port']), fake)
+
+        self.stdout.write(self.style.SUCCESS(f'Фиктивная Ollama на {server.base_url}: {", ".join(fake.models)}'))
+        self.stdout.write(f'Укажите OLLAMA_BASE_URL={server.base_url}; остановка — Ctrl+C')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            stats = fake.stats()
+            self.stdout.write(f"Запросов: {stats['requests']}, ошибок: {stats['errors']}")
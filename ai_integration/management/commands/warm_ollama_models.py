@@ -0,0 +1,30 @@
+"""
+Предзагрузка моделей Ollama (для скриптов развертывания).
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from ai_integration.services.ollama_service import get_ollama_service
+
+
+class Command(BaseCommand):
+    help = 'Загружает модели Ollama в память сервера и закрепляет их (keep_alive)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', help='Модели (по умолчанию — OLLAMA_PRELOAD_MODELS)')
+
+    def handle(self, *args, **options):
+        manager = get_ollama_service().models
+
+        started = time.perf_counter()
+        loaded = manager.sync_preload(options['models'] or None)
+        elapsed = time.perf_counter() - started
+
+        for model, ok in loaded.items():
+            if ok:
+                self.stdout.write(self.style.SUCCESS(f'{model}: загружена'))
+            else:
+                self.stdout.write(self.style.ERROR(f'{model}: не удалось загрузить'))
+        self.stdout.write(f'Готово за {elapsed:.2f} с')
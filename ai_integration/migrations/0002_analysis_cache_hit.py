@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-18 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai_integration", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aianalysis",
+            name="cache_hit",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="aianalysis",
+            name="cache_tier",
+            field=models.CharField(blank=True, default="", max_length=20),
+        ),
+        migrations.AddField(
+            model_name="aianalysis",
+            name="time_saved",
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="aianalysis",
+            name="tokens_saved",
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.0.14 on 2026-10-18 08:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ai_integration", "0002_analysis_cache_hit"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="aimodel",
+            name="model_type",
+            field=models.CharField(
+                choices=[
+                    ("text_analysis", "Text Analysis"),
+                    ("image_analysis", "Image Analysis"),
+                    ("document_analysis", "Document Analysis"),
+                    ("code_analysis", "Code Analysis"),
+                    ("translation", "Translation"),
+                    ("summarization", "Summarization"),
+                    ("embedding", "Embedding"),
+                ],
+                max_length=50,
+            ),
+        ),
+        migrations.AlterField(
+            model_name="aiprompttemplate",
+            name="model_type",
+            field=models.CharField(
+                choices=[
+                    ("text_analysis", "Text Analysis"),
+                    ("image_analysis", "Image Analysis"),
+                    ("document_analysis", "Document Analysis"),
+                    ("code_analysis", "Code Analysis"),
+                    ("translation", "Translation"),
+                    ("summarization", "Summarization"),
+                    ("embedding", "Embedding"),
+                ],
+                max_length=50,
+            ),
+        ),
+    ]
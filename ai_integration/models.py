@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 import json
+from datetime import timedelta
 
 
 class AIModel(models.Model):
@@ -14,6 +15,7 @@ class AIModel(models.Model):
         ('code_analysis', 'Code Analysis'),
         ('translation', 'Translation'),
         ('summarization', 'Summarization'),
+        ('embedding', 'Embedding'),
     ]
     
     name = models.CharField(max_length=100, unique=True)
@@ -71,6 +73,12 @@ class AIAnalysis(models.Model):
     processing_time = models.DurationField(null=True, blank=True)
     tokens_used = models.IntegerField(default=0)
     
+    # Ответ взят из кэша (ai_integration.services.response_cache)
+    cache_hit = models.BooleanField(default=False)
+    cache_tier = models.CharField(max_length=20, blank=True, default='')
+    tokens_saved = models.IntegerField(default=0)
+    time_saved = models.DurationField(null=True, blank=True)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -86,6 +94,15 @@ class AIAnalysis(models.Model):
     def __str__(self):
         return f"{self.analysis_type} for {self.user.username} - {self.status}"
     
+    def record_cache_hit(self, cache_info):
+        """Отмечает ответ из кэша: уровень, сэкономленные токены и время модели"""
+        if not cache_info or not cache_info.get('hit'):
+            return
+        self.cache_hit = True
+        self.cache_tier = cache_info.get('tier', '')
+        self.tokens_saved = cache_info.get('tokens_saved', 0)
+        self.time_saved = timedelta(milliseconds=cache_info.get('time_saved_ms', 0))
+    
     @property
     def duration_seconds(self):
         """Возвращает длительность обработки в секундах"""
@@ -0,0 +1,137 @@
+"""
+Выполнение анализа (AIAnalysis) вне HTTP запроса.
+
+View создает запись в статусе pending и ставит задачу Celery; задача
+вызывает run_analysis. Изменения статуса публикуются в группу channel layer
+analysis_group(id), клиент без WebSocket опрашивает /api/v1/ai/analysis/<id>/.
+"""
+
+import json
+import logging
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils import timezone
+
+from ai_integration.models import AIAnalysis
+from ai_integration.services.chunked_analysis import ChunkedAnalyzer
+from ai_integration.services.metrics import get_metrics_collector
+from ai_integration.services.ollama_service import OllamaService, get_ollama_service
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_group(analysis_id: int) -> str:
+    """Группа channel layer с событиями одного анализа"""
+    return f'ai_analysis_{analysis_id}'
+
+
+def analysis_state(analysis: AIAnalysis) -> Dict[str, Any]:
+    """Текущее состояние анализа для API и WebSocket"""
+    return {
+        'analysis_id': analysis.id,
+        'status': analysis.status,
+        'analysis_type': analysis.analysis_type,
+        'result': analysis.result or None,
+        'error': analysis.error_message,
+        'cache_hit': analysis.cache_hit,
+        'created_at': analysis.created_at.isoformat() if analysis.created_at else None,
+        'completed_at': analysis.completed_at.isoformat() if analysis.completed_at else None,
+        'file_name': analysis.file_item.name if analysis.file_item_id else None,
+    }
+
+
+def publish_analysis_state(analysis: AIAnalysis):
+    """Отправка состояния подписчикам; недоступный channel layer не прерывает анализ"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            analysis_group(analysis.id),
+            {'type': 'analysis.progress', 'analysis': analysis_state(analysis)}
+        )
+    except Exception as e:
+        logger.warning(f"Could not publish progress of analysis {analysis.id}: {e}")
+
+
+def set_analysis_status(analysis: AIAnalysis, status: str, error: Optional[str] = None):
+    analysis.status = status
+    if error is not None:
+        analysis.error_message = error
+    if status in ('completed', 'failed'):
+        analysis.completed_at = timezone.now()
+    analysis.save()
+    publish_analysis_state(analysis)
+
+
+def analyze(
+    analysis: AIAnalysis,
+    service: OllamaService,
+    analysis_type: str = 'general',
+    language: Optional[str] = None
+) -> Optional[Dict[str, Any]]:
+    """Вызов модели для анализа текста (input_data) или файла (file_item)"""
+    model = analysis.ai_model.name
+    if analysis.file_item_id:
+        # Файл целиком, по частям (map-reduce), без загрузки в память
+        file_item = analysis.file_item
+        is_code = bool(file_item.mime_type and 'code' in file_item.mime_type.lower())
+        return ChunkedAnalyzer(service).sync_analyze_file(
+            file_item.get_absolute_path(), 'code' if is_code else 'general', model, file_item.extension or 'auto'
+        )
+
+    if analysis_type == 'code':
+        return service.sync_analyze_code(analysis.input_data, language or 'python', model)
+    if analysis_type == 'document':
+        return service.sync_analyze_text(analysis.input_data, 'summary', model)
+    return service.sync_analyze_text(analysis.input_data, analysis_type, model)
+
+
+def run_analysis(
+    analysis_id: int,
+    analysis_type: str = 'general',
+    language: Optional[str] = None,
+    service: Optional[OllamaService] = None
+) -> Optional[AIAnalysis]:
+    """Выполняет анализ и сохраняет результат; None, если запись не найдена или отменена"""
+    try:
+        analysis = AIAnalysis.objects.select_related('ai_model', 'file_item').get(id=analysis_id)
+    except AIAnalysis.DoesNotExist:
+        logger.warning(f"Analysis {analysis_id} not found")
+        return None
+    if analysis.status == 'cancelled':
+        return None
+
+    set_analysis_status(analysis, 'processing')
+    started = time.monotonic()
+    try:
+        result = analyze(analysis, service or get_ollama_service(), analysis_type, language)
+    except Exception as e:
+        logger.error(f"Analysis {analysis_id} failed: {e}")
+        result = None
+        error = str(e)
+    else:
+        error = 'Failed to get response from AI service'
+
+    seconds = time.monotonic() - started
+    analysis.processing_time = timedelta(seconds=seconds)
+    if not result:
+        get_metrics_collector().record_usage(analysis.user_id, False, 0, seconds)
+        set_analysis_status(analysis, 'failed', error)
+        return analysis
+
+    # Токены, реально обработанные моделью; ответ из кэша их не расходует
+    cache = result.get('cache')
+    if not (cache and cache.get('hit')):
+        analysis.tokens_used = int(result.get('prompt_eval_count') or 0) + int(result.get('eval_count') or 0)
+    get_metrics_collector().record_usage(analysis.user_id, True, analysis.tokens_used, seconds)
+
+    analysis.output_data = json.dumps(result, ensure_ascii=False)
+    analysis.result = result
+    analysis.record_cache_hit(cache)
+    set_analysis_status(analysis, 'completed')
+    return analysis
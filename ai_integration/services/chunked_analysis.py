@@ -0,0 +1,276 @@
+"""
+Анализ длинных документов по частям (map-reduce).
+
+Файл читается блоками, TextChunker режет поток на части заданного размера
+в токенах с перекрытием по границам абзацев, предложений или слов.
+Части анализируются параллельно (не больше лимита модели в планировщике),
+краткие изложения по мере накопления сворачиваются в одно, поэтому память
+не зависит от размера файла.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+
+from .event_loop import get_service_loop, on_service_loop
+from .ollama_service import OllamaService, get_ollama_service
+from .scheduler import get_request_scheduler
+
+logger = logging.getLogger(__name__)
+
+MAP_PROMPT = (
+    "Это часть {index} длинного документа. Кратко изложи ее содержание, "
+    "сохранив ключевые факты, имена, даты и числа.\n\n{text}"
+)
+REDUCE_PROMPT = (
+    "Объедини краткие изложения последовательных частей документа в одно "
+    "связное изложение, сохранив ключевые факты.\n\n{text}"
+)
+
+# Границы, по которым режется текст (в порядке предпочтения)
+SEPARATORS = ('\n\n', '\n', '. ', ' ')
+
+# Счетчики Ollama, суммируемые по всем запросам анализа
+USAGE_FIELDS = ('prompt_eval_count', 'eval_count', 'total_duration')
+
+
+class TextChunker:
+    """Нарезка потока текста на части chunk_tokens токенов с перекрытием overlap_tokens"""
+
+    def __init__(
+        self,
+        chunk_tokens: Optional[int] = None,
+        overlap_tokens: Optional[int] = None,
+        chars_per_token: Optional[float] = None
+    ):
+        self.chars_per_token = chars_per_token or getattr(settings, 'OLLAMA_CHARS_PER_TOKEN', 3.0)
+        chunk_tokens = chunk_tokens or getattr(settings, 'OLLAMA_CHUNK_TOKENS', 2048)
+        if overlap_tokens is None:
+            overlap_tokens = getattr(settings, 'OLLAMA_CHUNK_OVERLAP_TOKENS', 128)
+        self.chunk_chars = max(4, int(chunk_tokens * self.chars_per_token))
+        # Перекрытие не больше четверти части, иначе нарезка почти не продвигается
+        self.overlap_chars = min(int(overlap_tokens * self.chars_per_token), self.chunk_chars // 4)
+
+    def estimate_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token + 0.5)
+
+    def _boundary(self, text: str) -> int:
+        """Конец части: последний разделитель во второй половине окна"""
+        for separator in SEPARATORS:
+            position = text.rfind(separator, self.chunk_chars // 2, self.chunk_chars)
+            if position != -1:
+                return position + len(separator)
+        return self.chunk_chars
+
+    def _overlap_start(self, text: str, end: int) -> int:
+        """Начало следующей части: overlap_chars до конца предыдущей, с начала слова"""
+        if not self.overlap_chars:
+            return end
+        start = end - self.overlap_chars
+        space = text.find(' ', start, end)
+        return space + 1 if space != -1 else start
+
+    def split(self, pieces: Iterable[str]) -> Iterator[str]:
+        """Части текста по мере поступления блоков (в памяти не больше части и блока)"""
+        buffer = ''
+        carried = 0  # длина перекрытия в начале буфера, уже отданного в прошлой части
+        for piece in pieces:
+            buffer += piece
+            while len(buffer) > self.chunk_chars:
+                end = self._boundary(buffer)
+                yield buffer[:end]
+                start = self._overlap_start(buffer, end)
+                buffer = buffer[start:]
+                carried = end - start
+        if buffer.strip() and len(buffer) > carried:
+            yield buffer
+
+
+def iter_file_chunks(path: str, chunker: TextChunker, read_size: int = 64 * 1024) -> Iterator[str]:
+    """Части текстового файла; файл читается блоками по read_size символов"""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        yield from chunker.split(iter(lambda: f.read(read_size), ''))
+
+
+class ChunkedAnalyzer:
+    """Map-reduce анализ: изложение каждой части, свертка изложений, итоговый анализ"""
+
+    def __init__(
+        self,
+        service: Optional[OllamaService] = None,
+        chunker: Optional[TextChunker] = None,
+        reduce_tokens: Optional[int] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.service = service or get_ollama_service()
+        self.chunker = chunker or TextChunker()
+        self.reduce_tokens = reduce_tokens or getattr(settings, 'OLLAMA_REDUCE_TOKENS', 3072)
+        self.concurrency = concurrency
+
+    @on_service_loop
+    async def analyze(
+        self,
+        chunks: Iterable[str],
+        analysis_type: str = 'general',
+        model: Optional[str] = None,
+        language: str = 'auto'
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Анализ текста, разбитого на части.
+        Документ из одной части анализируется одним запросом, как analyze_text / analyze_code.
+        """
+        model = model or self.service.default_model
+        iterator = iter(chunks)
+        try:
+            first = await asyncio.to_thread(next, iterator, None)
+            if first is None:
+                return None
+            second = await asyncio.to_thread(next, iterator, None)
+            if second is None:
+                return await self._final(first, analysis_type, model, language)
+
+            usage = dict.fromkeys(USAGE_FIELDS, 0)
+            notes, total, failed = await self._map(self._prepend([first, second], iterator), model, usage)
+        finally:
+            close = getattr(iterator, 'close', None)
+            try:
+                if close is not None:
+                    close()
+            except ValueError:
+                pass  # генератор еще читается в потоке после отмены
+
+        if not notes:
+            logger.error(f"Chunked analysis failed: none of {total} chunks were analyzed")
+            return None
+        result = await self._final(await self._collapse(notes, model, usage, final=True), analysis_type, model, language)
+        if result is None:
+            return None
+        for field in USAGE_FIELDS:
+            result[field] = result.get(field, 0) + usage[field]
+        result.update({'chunks': total, 'failed_chunks': failed})
+        return result
+
+    @staticmethod
+    async def _prepend(head: List[str], iterator: Iterator[str]):
+        for chunk in head:
+            yield chunk
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    async def _map(self, chunks, model: str, usage: Dict[str, int]):
+        """Изложения частей по порядку; в работе не больше concurrency частей"""
+        limit = self.concurrency or get_request_scheduler().limit(model)
+        pending = set()
+        ready: Dict[int, Optional[str]] = {}
+        notes: List[str] = []
+        next_index = 0
+        total = failed = 0
+
+        async def summarize(index: int, chunk: str):
+            return index, await self._generate(MAP_PROMPT.format(index=index + 1, text=chunk), model, usage)
+
+        async def absorb(done):
+            nonlocal next_index, failed, notes
+            for task in done:
+                index, note = task.result()
+                ready[index] = note
+            while next_index in ready:
+                note = ready.pop(next_index)
+                next_index += 1
+                if note is None:
+                    failed += 1
+                else:
+                    notes.append(note)
+            notes = await self._collapse(notes, model, usage)
+
+        try:
+            async for chunk in chunks:
+                if len(pending) >= limit:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    await absorb(done)
+                pending.add(asyncio.ensure_future(summarize(total, chunk)))
+                total += 1
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                await absorb(done)
+        finally:
+            for task in pending:
+                task.cancel()
+        return notes, total, failed
+
+    async def _collapse(self, notes: List[str], model: str, usage: Dict[str, int], final: bool = False):
+        """
+        Свертка изложений, превысивших reduce_tokens, в одно.
+        При final=True возвращается итоговый текст для анализа.
+        """
+        text = '\n\n'.join(notes)
+        if len(notes) > 1 and self.chunker.estimate_tokens(text) > self.reduce_tokens:
+            reduced = await self._generate(REDUCE_PROMPT.format(text=text), model, usage)
+            if reduced is not None:
+                notes = [reduced]
+                text = reduced
+        return text if final else notes
+
+    async def _generate(self, prompt: str, model: str, usage: Dict[str, int]) -> Optional[str]:
+        response = await self.service.generate(prompt, model)
+        if not response:
+            return None
+        for field in USAGE_FIELDS:
+            usage[field] += int(response.get(field) or 0)
+        return response.get('response', '')
+
+    async def _final(self, text: str, analysis_type: str, model: str, language: str) -> Optional[Dict[str, Any]]:
+        if analysis_type == 'code':
+            return await self.service.analyze_code(text, language, model)
+        return await self.service.analyze_text(text, analysis_type, model)
+
+    def sync_analyze_file(
+        self,
+        path: str,
+        analysis_type: str = 'general',
+        model: Optional[str] = None,
+        language: str = 'auto'
+    ) -> Optional[Dict[str, Any]]:
+        """Синхронный анализ текстового файла целиком"""
+        try:
+            return get_service_loop().run(
+                self.analyze(iter_file_chunks(path, self.chunker), analysis_type, model, language)
+            )
+        except Exception as e:
+            logger.error(f"Error in chunked analysis of {path}: {e}")
+            return None
+
+    def sync_analyze_files(
+        self,
+        paths: Dict[str, str],
+        analysis_type: str = 'general',
+        model: Optional[str] = None,
+        language: str = 'auto'
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Синхронный анализ нескольких файлов {ключ: путь} одновременно
+        (файлов в работе не больше лимита модели); ключи без результата пропускаются.
+        """
+        if not paths:
+            return {}
+        model = model or self.service.default_model
+
+        async def analyze_all():
+            semaphore = asyncio.Semaphore(self.concurrency or get_request_scheduler().limit(model))
+
+            async def analyze(key: str, path: str):
+                async with semaphore:
+                    try:
+                        return key, await self.analyze(iter_file_chunks(path, self.chunker), analysis_type, model, language)
+                    except Exception as e:
+                        logger.error(f"Error in chunked analysis of {path}: {e}")
+                        return key, None
+
+            return await asyncio.gather(*(analyze(key, path) for key, path in paths.items()))
+
+        return {key: result for key, result in get_service_loop().run(analyze_all()) if result}
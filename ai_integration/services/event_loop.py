@@ -0,0 +1,170 @@
+"""
+Долгоживущий event loop в отдельном потоке и общий пул HTTP соединений к Ollama.
+Все запросы к Ollama выполняются на этом loop, поэтому keep-alive соединения
+переиспользуются независимо от того, откуда вызван сервис (DRF view, Celery, consumer).
+"""
+
+import asyncio
+import atexit
+import functools
+import logging
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+import httpx
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Признак конца потока в iterate / iterate_sync
+_END = object()
+
+
+class ServiceLoop:
+    """Event loop в фоновом потоке вместе с httpx клиентом, привязанным к нему"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.loop = asyncio.new_event_loop()
+        self.client = httpx.AsyncClient(
+            timeout=getattr(settings, 'OLLAMA_TIMEOUT', 60),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, 'OLLAMA_POOL_MAX_CONNECTIONS', 20),
+                max_keepalive_connections=getattr(settings, 'OLLAMA_POOL_MAX_KEEPALIVE', 10),
+                keepalive_expiry=getattr(settings, 'OLLAMA_POOL_KEEPALIVE_EXPIRY', 30),
+            ),
+        )
+        self.thread = threading.Thread(target=self._run, name='ollama-service-loop', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def is_current(self) -> bool:
+        """Вызов выполняется в потоке этого loop"""
+        return threading.current_thread() is self.thread
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Синхронное выполнение корутины на loop (из любого потока, кроме самого loop)"""
+        if self.is_current:
+            raise RuntimeError("ServiceLoop.run() cannot be called from the service loop thread")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def call(self, coro: Awaitable) -> Any:
+        """Выполнение корутины на loop из другого event loop; отмена передается задаче"""
+        if self.is_current:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def iterate(self, agen: AsyncIterator) -> AsyncIterator:
+        """
+        Итерация async генератора, выполняемого на loop, из другого event loop.
+        Элементы передаются через очередь; при выходе потребителя генератор отменяется.
+        """
+        if self.is_current:
+            async for item in agen:
+                yield item
+            return
+
+        consumer_loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+
+        def deliver(item, error=None):
+            try:
+                consumer_loop.call_soon_threadsafe(items.put_nowait, (item, error))
+            except RuntimeError:
+                pass  # loop потребителя уже закрыт
+
+        future = asyncio.run_coroutine_threadsafe(self._produce(agen, deliver), self.loop)
+        try:
+            while True:
+                item, error = await items.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def iterate_sync(self, agen: AsyncIterator) -> Iterator:
+        """Синхронная итерация async генератора, выполняемого на loop"""
+        if self.is_current:
+            raise RuntimeError("ServiceLoop.iterate_sync() cannot be called from the service loop thread")
+
+        items: queue.Queue = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(
+            self._produce(agen, lambda item, error=None: items.put((item, error))), self.loop
+        )
+        try:
+            while True:
+                item, error = items.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    @staticmethod
+    async def _produce(agen: AsyncIterator, deliver: Callable):
+        try:
+            async for item in agen:
+                deliver(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            deliver(_END, e)
+        else:
+            deliver(_END)
+
+    def close(self):
+        """Закрытие соединений и остановка потока"""
+        if not self.loop.is_running() or self.is_current:
+            return
+        try:
+            self.run(self.client.aclose(), timeout=5)
+        except Exception as e:
+            logger.warning(f"Error closing Ollama HTTP client: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=5)
+
+
+# Один loop на процесс; после fork (Celery prefork) создается заново
+_service_loop: Optional[ServiceLoop] = None
+_service_loop_lock = threading.Lock()
+
+
+def get_service_loop() -> ServiceLoop:
+    """Получить фоновый loop текущего процесса"""
+    global _service_loop
+    if _service_loop is None or _service_loop.pid != os.getpid():
+        with _service_loop_lock:
+            if _service_loop is None or _service_loop.pid != os.getpid():
+                _service_loop = ServiceLoop()
+                logger.info(f"Started Ollama service loop in process {_service_loop.pid}")
+    return _service_loop
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий для процесса httpx клиент (используется только на фоновом loop)"""
+    return get_service_loop().client
+
+
+def on_service_loop(method):
+    """Декоратор async метода: тело выполняется на фоновом loop"""
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        return await get_service_loop().call(method(*args, **kwargs))
+    return wrapper
+
+
+@atexit.register
+def _close_service_loop():
+    if _service_loop is not None and _service_loop.pid == os.getpid():
+        _service_loop.close()
@@ -0,0 +1,318 @@
+"""
+Детерминированная замена сервера Ollama для нагрузочного тестирования.
+
+Реализует /api/tags, /api/generate (потоковый и обычный режим),
+/api/embeddings, /api/embed и /api/ps. Ответ зависит только от модели и
+запроса, поэтому прогоны архивации и поиска воспроизводимы без модели.
+Задержка (фиксированная, на токен, разброс) и доля ошибок настраиваются.
+
+Запуск: python manage.py run_fake_ollama --port 11434 --latency 200 --error-rate 0.05
+"""
+
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Словарь, из которого собираются ответы
+WORDS = (
+    'документ', 'архив', 'файл', 'отчет', 'договор', 'анализ', 'данные', 'проект', 'версия',
+    'раздел', 'итог', 'пользователь', 'категория', 'содержание', 'дата', 'сумма', 'список',
+    'система', 'запрос', 'результат', 'вывод', 'основной', 'краткий', 'важный', 'новый',
+)
+
+DEFAULT_MODELS = ('llama3.2:1b', 'nomic-embed-text')
+
+
+def _seed(*parts: Any) -> int:
+    digest = hashlib.sha256(json.dumps(parts, ensure_ascii=False, sort_keys=True).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def count_tokens(text: str) -> int:
+    """Оценка числа токенов (как у TextChunker: ~3 символа на токен)"""
+    return max(1, math.ceil(len(text) / 3)) if text else 0
+
+
+class FakeOllama:
+    """Ответы и состояние фиктивного сервера (без HTTP)"""
+
+    def __init__(
+        self,
+        models: Iterable[str] = DEFAULT_MODELS,
+        latency_ms: float = 0.0,
+        token_latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        load_ms: float = 0.0,
+        error_rate: float = 0.0,
+        response_tokens: int = 64,
+        embedding_dim: int = 768,
+        seed: int = 0
+    ):
+        self.models = list(models)
+        self.latency_ms = latency_ms
+        self.token_latency_ms = token_latency_ms
+        self.jitter_ms = jitter_ms
+        # Задержка первого запроса к модели (холодный старт)
+        self.load_ms = load_ms
+        self.error_rate = error_rate
+        self.response_tokens = response_tokens
+        self.embedding_dim = embedding_dim
+        # Ошибки и разброс задержки — из генератора с seed: при одинаковом порядке запросов прогоны совпадают
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._resident: Dict[str, datetime] = {}
+        self.requests = 0
+        self.errors = 0
+
+    def begin_request(self) -> bool:
+        """Учет запроса; True — запрос должен завершиться ошибкой (до начала ответа)"""
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+    def _jitter(self) -> float:
+        if not self.jitter_ms:
+            return 0.0
+        with self._lock:
+            return self._random.uniform(-self.jitter_ms, self.jitter_ms)
+
+    def _load(self, model: str, keep_alive: Any) -> float:
+        """Учет резидентности модели; возвращает задержку загрузки (мс)"""
+        with self._lock:
+            if keep_alive in (0, '0', '0s', '0m'):
+                self._resident.pop(model, None)
+                return 0.0
+            loaded = model in self._resident
+            self._resident[model] = datetime.now(timezone.utc) + timedelta(minutes=5)
+        return 0.0 if loaded else self.load_ms
+
+    @staticmethod
+    def sleep(ms: float):
+        if ms > 0:
+            time.sleep(ms / 1000)
+
+    def tags(self) -> Dict[str, Any]:
+        return {
+            'models': [
+                {
+                    'name': name,
+                    'model': name,
+                    'size': 1000000 * (index + 1),
+                    'digest': hashlib.sha256(name.encode('utf-8')).hexdigest(),
+                    'details': {'family': 'fake', 'format': 'gguf'},
+                }
+                for index, name in enumerate(self.models)
+            ]
+        }
+
+    def ps(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'models': [
+                    {'name': name, 'model': name, 'size_vram': 1000000, 'expires_at': expires.isoformat()}
+                    for name, expires in sorted(self._resident.items())
+                ]
+            }
+
+    def completion(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Токены ответа: зависят только от модели, запроса и options"""
+        options = options or {}
+        rng = random.Random(_seed(model, prompt, options))
+        length = int(options.get('num_predict') or self.response_tokens)
+        return [('' if index == 0 else ' ') + rng.choice(WORDS) for index in range(max(1, length))]
+
+    def embedding(self, model: str, text: str) -> List[float]:
+        """Нормированный вектор, зависящий только от модели и текста"""
+        rng = random.Random(_seed(model, text))
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def generate(self, payload: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """
+        Части ответа /api/generate; последняя — с done=True и статистикой.
+        Пустой prompt — загрузка или выгрузка модели (как у Ollama).
+        """
+        model = payload.get('model', '')
+        prompt = payload.get('prompt') or ''
+        stream = payload.get('stream', True)
+        started = time.monotonic()
+        load_ms = self._load(model, payload.get('keep_alive'))
+        self.sleep(load_ms + self.latency_ms + self._jitter())
+
+        tokens = self.completion(model, prompt, payload.get('options')) if prompt else []
+        if stream:
+            for token in tokens:
+                self.sleep(self.token_latency_ms)
+                yield {'model': model, 'created_at': self._now(), 'response': token, 'done': False}
+        else:
+            self.sleep(self.token_latency_ms * len(tokens))
+
+        total_ns = int((time.monotonic() - started) * 1e9)
+        yield {
+            'model': model,
+            'created_at': self._now(),
+            'response': '' if stream else ''.join(tokens),
+            'done': True,
+            'done_reason': 'stop' if prompt else 'load',
+            'total_duration': total_ns,
+            'load_duration': int(load_ms * 1e6),
+            'prompt_eval_count': count_tokens(prompt),
+            'eval_count': len(tokens),
+            'eval_duration': int(self.token_latency_ms * len(tokens) * 1e6),
+        }
+
+    def embeddings(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """/api/embeddings: один текст в поле prompt"""
+        model = payload.get('model', '')
+        prompt = payload.get('prompt') or ''
+        load_ms = self._load(model, payload.get('keep_alive'))
+        self.sleep(load_ms + self.latency_ms + self._jitter())
+        return {'embedding': self.embedding(model, prompt)}
+
+    def embed(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """/api/embed: список текстов в поле input"""
+        model = payload.get('model', '')
+        texts = payload.get('input') or []
+        if isinstance(texts, str):
+            texts = [texts] if texts else []
+        started = time.monotonic()
+        load_ms = self._load(model, payload.get('keep_alive'))
+        self.sleep(load_ms + self.latency_ms + self._jitter() + self.token_latency_ms * len(texts))
+        return {
+            'model': model,
+            'embeddings': [self.embedding(model, text) for text in texts],
+            'total_duration': int((time.monotonic() - started) * 1e9),
+            'load_duration': int(load_ms * 1e6),
+            'prompt_eval_count': sum(count_tokens(text) for text in texts),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'requests': self.requests, 'errors': self.errors, 'resident': sorted(self._resident)}
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """HTTP обработчик; состояние — в server.fake"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    @property
+    def fake(self) -> FakeOllama:
+        return self.server.fake
+
+    def _json(self, status: int, data: Dict[str, Any]):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _payload(self) -> Optional[Dict[str, Any]]:
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._json(400, {'error': 'invalid JSON body'})
+            return None
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._json(200, self.fake.tags())
+        elif self.path == '/api/ps':
+            self._json(200, self.fake.ps())
+        elif self.path in ('/', '/api/version'):
+            self._json(200, {'version': '0.0.0-fake'})
+        else:
+            self._json(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        payload = self._payload()
+        if payload is None:
+            return
+        routes = {'/api/generate': self._generate, '/api/embeddings': self._embeddings, '/api/embed': self._embed}
+        route = routes.get(self.path)
+        if route is None:
+            self._json(404, {'error': f'unknown path {self.path}'})
+            return
+        model = payload.get('model')
+        if model not in self.fake.models:
+            self._json(404, {'error': f"model '{model}' not found"})
+            return
+        if self.fake.begin_request():
+            self._json(500, {'error': 'injected failure'})
+            return
+        route(payload)
+
+    def _generate(self, payload: Dict[str, Any]):
+        chunks = self.fake.generate(payload)
+        if not payload.get('stream', True):
+            *_, last = chunks
+            self._json(200, last)
+            return
+
+        # NDJSON частями (chunked transfer encoding), как у Ollama
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                line = json.dumps(chunk, ensure_ascii=False).encode('utf-8') + b'\n'
+                self.wfile.write(f'{len(line):x}\r\n'.encode('ascii') + line + b'\r\n')
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент прервал поток
+            self.close_connection = True
+
+    def _embeddings(self, payload: Dict[str, Any]):
+        self._json(200, self.fake.embeddings(payload))
+
+    def _embed(self, payload: Dict[str, Any]):
+        self._json(200, self.fake.embed(payload))
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Многопоточный HTTP сервер фиктивной Ollama"""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], fake: FakeOllama):
+        self.fake = fake
+        super().__init__(address, FakeOllamaHandler)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> threading.Thread:
+        """Запуск в фоновом потоке (для тестов и бенчмарков внутри процесса)"""
+        thread = threading.Thread(target=self.serve_forever, name='fake-ollama', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,177 @@
+"""
+Состояние подключения к Ollama: кэшируемый результат проверки (TTL)
+и circuit breaker, который прекращает запросы к недоступному серверу.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен: сервер считается недоступным"""
+
+
+class CircuitBreaker:
+    """
+    closed — запросы проходят, считаются ошибки подряд;
+    open — после failure_threshold ошибок запросы сразу отклоняются;
+    half_open — через reset_timeout пропускается half_open_max_calls пробных запросов:
+    успех закрывает цепь, ошибка снова открывает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.rejected = 0
+        self.opened_count = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._advance()
+            return self._state
+
+    def _advance(self):
+        """open -> half_open по истечении reset_timeout (под блокировкой)"""
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("Circuit breaker half-open, probing backend")
+
+    def _open(self):
+        if self._state != self.OPEN:
+            self.opened_count += 1
+            logger.warning(
+                f"Circuit breaker opened after {self.consecutive_failures} consecutive failures: {self.last_error}"
+            )
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._half_open_calls = 0
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнить запрос сейчас"""
+        with self._lock:
+            self._advance()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self._state != self.CLOSED:
+                logger.info("Circuit breaker closed, backend recovered")
+            self._state = self.CLOSED
+            self._half_open_calls = 0
+
+    def record_failure(self, error: Any = None):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self._state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """Пробный запрос прерван без результата — освобождаем слот half_open"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls:
+                self._half_open_calls -= 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            retry_in = 0.0
+            if self._state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (self._clock() - self._opened_at))
+            return {
+                'state': self._state,
+                'consecutive_failures': self.consecutive_failures,
+                'failures': self.failures,
+                'successes': self.successes,
+                'rejected': self.rejected,
+                'opened_count': self.opened_count,
+                'retry_in_seconds': round(retry_in, 3),
+                'last_error': self.last_error,
+            }
+
+
+class HealthState:
+    """Последний известный статус сервера; считается актуальным ttl секунд"""
+
+    def __init__(self, ttl: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.healthy: Optional[bool] = None
+        self.checked_at: Optional[float] = None
+        self.checks = 0
+
+    def is_fresh(self) -> bool:
+        with self._lock:
+            return self.checked_at is not None and self._clock() - self.checked_at < self.ttl
+
+    def update(self, healthy: bool, probe: bool = False):
+        """Обновление по результату проверки или обычного запроса"""
+        with self._lock:
+            self.healthy = healthy
+            self.checked_at = self._clock()
+            if probe:
+                self.checks += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            age = None if self.checked_at is None else round(self._clock() - self.checked_at, 3)
+            return {'healthy': self.healthy, 'age_seconds': age, 'ttl_seconds': self.ttl, 'probes': self.checks}
+
+
+# Состояние общее для всех экземпляров OllamaService с одним base_url
+_connection_health: Dict[str, Tuple[HealthState, CircuitBreaker]] = {}
+_connection_health_lock = threading.Lock()
+
+
+def get_connection_health(base_url: str) -> Tuple[HealthState, CircuitBreaker]:
+    """Получить (HealthState, CircuitBreaker) для сервера"""
+    with _connection_health_lock:
+        if base_url not in _connection_health:
+            _connection_health[base_url] = (
+                HealthState(ttl=getattr(settings, 'OLLAMA_HEALTH_TTL', 30)),
+                CircuitBreaker(
+                    failure_threshold=getattr(settings, 'OLLAMA_BREAKER_FAILURE_THRESHOLD', 5),
+                    reset_timeout=getattr(settings, 'OLLAMA_BREAKER_RESET_TIMEOUT', 30),
+                    half_open_max_calls=getattr(settings, 'OLLAMA_BREAKER_HALF_OPEN_CALLS', 1),
+                ),
+            )
+        return _connection_health[base_url]
@@ -0,0 +1,359 @@
+"""
+Метрики вызовов Ollama.
+
+Каждый вызов OllamaService (генерация, потоковая генерация, embeddings)
+учитывается в памяти процесса: гистограмма задержек, токены запроса и ответа
+(prompt_eval_count / eval_count), ошибки и попадания в кэш. Анализы
+пользователей учитываются отдельно. Накопленное периодически записывается
+в AIModelPerformance и AIUsageStatistics (MetricsFlusher, OLLAMA_METRICS_FLUSH_INTERVAL).
+"""
+
+import atexit
+import bisect
+import logging
+import os
+import threading
+from datetime import date as date_type, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import DurationField, F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ai_integration.models import AIModel, AIModelPerformance, AIUsageStatistics
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы задержек (мс); последняя корзина — все, что больше
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram:
+    """Гистограмма задержек с фиксированными корзинами"""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other: 'LatencyHistogram'):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины, в которую попадает квантиль q"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return float(LATENCY_BUCKETS_MS[index]) if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': round(self.max_ms, 3),
+            'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf'], self.counts)),
+        }
+
+
+class CallStats:
+    """Вызовы одной модели одной операцией"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency = LatencyHistogram()
+
+    def merge(self, other: 'CallStats'):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.cache_hits += other.cache_hits
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.latency.merge(other.latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'cache_hits': self.cache_hits,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'latency': self.latency.snapshot(),
+        }
+
+
+class UsageStats:
+    """Анализы одного пользователя за день"""
+
+    def __init__(self):
+        self.requests = 0
+        self.successful = 0
+        self.failed = 0
+        self.tokens = 0
+        self.seconds = 0.0
+
+    def merge(self, other: 'UsageStats'):
+        self.requests += other.requests
+        self.successful += other.successful
+        self.failed += other.failed
+        self.tokens += other.tokens
+        self.seconds += other.seconds
+
+
+class MetricsCollector:
+    """
+    Агрегаты в памяти процесса.
+    _calls / _usage — еще не записанные в БД приращения, _totals — с момента запуска.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple[date_type, str, str], CallStats] = {}
+        self._usage: Dict[Tuple[date_type, int], UsageStats] = {}
+        self._totals: Dict[Tuple[str, str], CallStats] = {}
+
+    def record(
+        self,
+        model: str,
+        operation: str,
+        seconds: float,
+        success: bool = True,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        cache_hit: bool = False
+    ):
+        """Учет одного вызова модели (или ответа из кэша)"""
+        call = CallStats()
+        call.requests = 1
+        call.errors = 0 if success else 1
+        call.cache_hits = 1 if cache_hit else 0
+        call.prompt_tokens = prompt_tokens
+        call.completion_tokens = completion_tokens
+        call.latency.observe(seconds * 1000)
+
+        key = (timezone.localdate(), model, operation)
+        with self._lock:
+            self._calls.setdefault(key, CallStats()).merge(call)
+            self._totals.setdefault((model, operation), CallStats()).merge(call)
+
+    def record_usage(self, user_id: int, success: bool, tokens: int = 0, seconds: float = 0.0):
+        """Учет анализа, выполненного для пользователя"""
+        key = (timezone.localdate(), user_id)
+        with self._lock:
+            usage = self._usage.setdefault(key, UsageStats())
+            usage.requests += 1
+            usage.successful += 1 if success else 0
+            usage.failed += 0 if success else 1
+            usage.tokens += tokens
+            usage.seconds += seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Метрики процесса с момента запуска: {модель: {операция: ...}}"""
+        result: Dict[str, Dict[str, Any]] = {}
+        with self._lock:
+            for (model, operation), stats in sorted(self._totals.items()):
+                result.setdefault(model, {})[operation] = stats.snapshot()
+        return result
+
+    def _drain(self):
+        with self._lock:
+            calls, usage = self._calls, self._usage
+            self._calls, self._usage = {}, {}
+        return calls, usage
+
+    def _restore(self, calls, usage):
+        """Возврат не записанных приращений (запись будет повторена при следующем flush)"""
+        with self._lock:
+            for key, stats in calls.items():
+                self._calls.setdefault(key, CallStats()).merge(stats)
+            for key, stats in usage.items():
+                self._usage.setdefault(key, UsageStats()).merge(stats)
+
+    def flush(self) -> Dict[str, int]:
+        """Запись накопленных приращений в AIModelPerformance и AIUsageStatistics"""
+        calls, usage = self._drain()
+        if not calls and not usage:
+            return {'models': 0, 'users': 0}
+        try:
+            with transaction.atomic():
+                models = self._write_model_performance(calls)
+                self._write_usage(usage)
+        except Exception as e:
+            logger.error(f"Could not flush AI metrics: {e}")
+            self._restore(calls, usage)
+            return {'models': 0, 'users': 0}
+        return {'models': models, 'users': len(usage)}
+
+    @staticmethod
+    def _write_model_performance(calls: Dict[Tuple[date_type, str, str], CallStats]) -> int:
+        # Ответы из кэша не нагружают модель и в производительность модели не входят
+        per_model: Dict[Tuple[date_type, str], CallStats] = {}
+        operations: Dict[str, set] = {}
+        for (day, model, operation), stats in calls.items():
+            model_calls = stats.requests - stats.cache_hits
+            if model_calls <= 0:
+                continue
+            operations.setdefault(model, set()).add(operation)
+            merged = per_model.setdefault((day, model), CallStats())
+            merged.requests += model_calls
+            merged.errors += stats.errors
+            merged.prompt_tokens += stats.prompt_tokens
+            merged.completion_tokens += stats.completion_tokens
+            # Задержка ответов из кэша пренебрежимо мала, ее вклад в сумму не вычитаем
+            merged.latency.total_ms += stats.latency.total_ms
+        if not per_model:
+            return 0
+
+        names = {model for _, model in per_model}
+        ai_models = {ai_model.name: ai_model for ai_model in AIModel.objects.filter(name__in=names)}
+        for name in names - set(ai_models):
+            # Модель, которая только строит эмбеддинги, заводится как модель эмбеддингов
+            model_type = 'embedding' if all(op.startswith('embed') for op in operations[name]) else 'text_analysis'
+            ai_models[name], _ = AIModel.objects.get_or_create(name=name, defaults={'model_type': model_type})
+
+        existing = {
+            (row.date, row.ai_model_id): row
+            for row in AIModelPerformance.objects.select_for_update().filter(
+                ai_model__in=ai_models.values(), date__in={day for day, _ in per_model}
+            )
+        }
+        created, updated = [], []
+        for (day, model), stats in per_model.items():
+            ai_model = ai_models[model]
+            row = existing.get((day, ai_model.id))
+            if row is None:
+                row = AIModelPerformance(ai_model=ai_model, date=day, total_requests=0, successful_requests=0)
+                created.append(row)
+            else:
+                updated.append(row)
+
+            # Средние пересчитываются с весами: старое среднее * старое число запросов + новая сумма
+            previous = row.total_requests
+            total = previous + stats.requests
+            previous_ms = row.avg_response_time.total_seconds() * 1000 * previous if row.avg_response_time else 0.0
+            tokens = row.avg_tokens_per_request * previous + stats.prompt_tokens + stats.completion_tokens
+            errors = row.error_rate / 100 * previous + stats.errors
+
+            row.total_requests = total
+            row.successful_requests += stats.requests - stats.errors
+            row.avg_response_time = timedelta(milliseconds=(previous_ms + stats.latency.total_ms) / total)
+            row.avg_tokens_per_request = tokens / total
+            row.error_rate = 100 * errors / total
+
+        AIModelPerformance.objects.bulk_create(created)
+        AIModelPerformance.objects.bulk_update(
+            updated, ['total_requests', 'successful_requests', 'avg_response_time', 'avg_tokens_per_request', 'error_rate']
+        )
+        return len(per_model)
+
+    @staticmethod
+    def _write_usage(usage: Dict[Tuple[date_type, int], UsageStats]):
+        for (day, user_id), stats in usage.items():
+            updated = AIUsageStatistics.objects.filter(user_id=user_id, date=day).update(
+                total_requests=F('total_requests') + stats.requests,
+                successful_requests=F('successful_requests') + stats.successful,
+                failed_requests=F('failed_requests') + stats.failed,
+                total_tokens=F('total_tokens') + stats.tokens,
+                total_processing_time=Coalesce(
+                    F('total_processing_time'), Value(timedelta(0)), output_field=DurationField()
+                ) + timedelta(seconds=stats.seconds),
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                AIUsageStatistics.objects.create(
+                    user_id=user_id,
+                    date=day,
+                    total_requests=stats.requests,
+                    successful_requests=stats.successful,
+                    failed_requests=stats.failed,
+                    total_tokens=stats.tokens,
+                    total_processing_time=timedelta(seconds=stats.seconds),
+                )
+
+
+class MetricsFlusher:
+    """Фоновый поток, периодически записывающий метрики процесса в БД"""
+
+    def __init__(self, interval: float):
+        self.pid = os.getpid()
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='ai-metrics-flusher', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        try:
+            get_metrics_collector().flush()
+        finally:
+            # Поток живет долго — соединение с БД не держим между записями
+            connection.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Один сборщик на процесс; после fork создается заново, чтобы не записать приращения родителя дважды
+_metrics_collector: Optional[MetricsCollector] = None
+_metrics_flusher: Optional[MetricsFlusher] = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics_collector() -> MetricsCollector:
+    """Получить сборщик метрик текущего процесса"""
+    global _metrics_collector
+    if _metrics_collector is None or _metrics_collector.pid != os.getpid():
+        with _metrics_lock:
+            if _metrics_collector is None or _metrics_collector.pid != os.getpid():
+                _metrics_collector = MetricsCollector()
+    return _metrics_collector
+
+
+def start_metrics_flusher() -> Optional[MetricsFlusher]:
+    """
+    Запуск периодической записи метрик в текущем процессе
+    (вызывается из точек входа: WSGI, ASGI, воркер Celery).
+    """
+    global _metrics_flusher
+    interval = getattr(settings, 'OLLAMA_METRICS_FLUSH_INTERVAL', 60)
+    if interval <= 0:
+        return None
+    with _metrics_lock:
+        if _metrics_flusher is None or _metrics_flusher.pid != os.getpid():
+            _metrics_flusher = MetricsFlusher(interval)
+            logger.info(f"AI metrics are flushed every {interval} s in process {_metrics_flusher.pid}")
+    return _metrics_flusher
+
+
+@atexit.register
+def _flush_metrics_on_exit():
+    if _metrics_flusher is not None and _metrics_flusher.pid == os.getpid():
+        _metrics_flusher.stop()
+        _metrics_flusher.flush()
@@ -0,0 +1,275 @@
+"""
+Жизненный цикл моделей Ollama: предзагрузка, keep_alive и вытеснение.
+
+Модели из OLLAMA_PRELOAD_MODELS загружаются при старте воркера и
+закрепляются (keep_alive OLLAMA_PRELOAD_KEEP_ALIVE). Остальные запросы
+передают keep_alive OLLAMA_KEEP_ALIVE. Когда в памяти сервера больше
+OLLAMA_MAX_RESIDENT_MODELS моделей, выгружается незакрепленная модель
+с наименьшей частотой использования (счетчик с экспоненциальным затуханием).
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from django.conf import settings
+
+from .event_loop import get_http_client, get_service_loop, on_service_loop
+from .scheduler import get_request_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Загрузка модели дольше этого считается холодным стартом (мс)
+COLD_START_MS = 500
+
+
+class ModelUsage:
+    """Использование одной модели"""
+
+    def __init__(self, name: str, kind: str = 'generate'):
+        self.name = name
+        self.kind = kind  # generate | embed — каким запросом загружать и выгружать
+        self.uses = 0
+        self.score = 0.0
+        self.last_used: Optional[float] = None
+        self.cold_starts = 0
+        self.last_load_ms = 0.0
+        self.resident = False
+        self.size_vram = 0
+        self.expires_at: Optional[str] = None
+
+
+class ModelManager:
+    """Резидентность моделей на сервере Ollama"""
+
+    def __init__(
+        self,
+        base_url: str,
+        keep_alive: Any = '30m',
+        pinned_keep_alive: Any = -1,
+        pinned: Iterable[str] = (),
+        embedding_models: Iterable[str] = (),
+        max_resident: int = 2,
+        half_life: float = 600.0,
+        min_idle: float = 60.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.base_url = base_url
+        self.keep_alive = keep_alive
+        self.pinned_keep_alive = pinned_keep_alive
+        self.pinned = set(pinned)
+        self.max_resident = max_resident
+        self.half_life = half_life
+        # Только что использованные модели не выгружаются, чтобы не загружать их снова
+        self.min_idle = min_idle
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._models: Dict[str, ModelUsage] = {name: ModelUsage(name, 'embed') for name in embedding_models}
+        self._tasks = set()
+
+    @property
+    def client(self):
+        return get_http_client()
+
+    def _usage(self, model: str, kind: Optional[str] = None) -> ModelUsage:
+        usage = self._models.get(model)
+        if usage is None:
+            usage = self._models[model] = ModelUsage(model, kind or 'generate')
+        elif kind:
+            usage.kind = kind
+        return usage
+
+    def _decayed(self, usage: ModelUsage, now: float) -> float:
+        if usage.last_used is None:
+            return 0.0
+        return usage.score * 0.5 ** ((now - usage.last_used) / self.half_life)
+
+    def keep_alive_for(self, model: str) -> Any:
+        """Значение keep_alive для запроса к модели"""
+        return self.pinned_keep_alive if model in self.pinned else self.keep_alive
+
+    def record_use(self, model: str, load_duration: Optional[int] = None, kind: Optional[str] = None) -> bool:
+        """
+        Учет запроса к модели (load_duration из ответа Ollama, нс).
+        Возвращает True, если модель пришлось загружать — значит, нужно проверить лимит.
+        """
+        now = self._clock()
+        load_ms = (load_duration or 0) / 1e6
+        with self._lock:
+            usage = self._usage(model, kind)
+            usage.score = self._decayed(usage, now) + 1.0
+            usage.last_used = now
+            usage.uses += 1
+            loaded = not usage.resident or load_ms >= COLD_START_MS
+            if load_ms >= COLD_START_MS:
+                usage.cold_starts += 1
+                usage.last_load_ms = load_ms
+            usage.resident = True
+            return loaded
+
+    def schedule_enforce_limit(self):
+        """Проверка лимита в фоне (вызывается на фоновом loop после загрузки модели)"""
+        if not self.eviction_candidates():
+            return
+        task = asyncio.ensure_future(self.enforce_limit())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def eviction_candidates(self) -> List[str]:
+        """Модели сверх лимита, начиная с наименее используемых"""
+        if not self.max_resident:
+            return []
+        now = self._clock()
+        scheduler = get_request_scheduler()
+        with self._lock:
+            resident = [usage for usage in self._models.values() if usage.resident]
+            excess = len(resident) - self.max_resident
+            if excess <= 0:
+                return []
+            evictable = [
+                usage for usage in resident
+                if usage.name not in self.pinned
+                and not scheduler.active(usage.name)
+                and (usage.last_used is None or now - usage.last_used >= self.min_idle)
+            ]
+            evictable.sort(key=lambda usage: (self._decayed(usage, now), usage.last_used or 0.0))
+            return [usage.name for usage in evictable[:excess]]
+
+    def _request(self, model: str, keep_alive: Any):
+        """Пустой запрос к модели: загрузка (keep_alive > 0) или выгрузка (keep_alive = 0)"""
+        with self._lock:
+            kind = self._usage(model).kind
+        if kind == 'embed':
+            return self.client.post(f"{self.base_url}/api/embed", json={'model': model, 'input': '', 'keep_alive': keep_alive})
+        return self.client.post(f"{self.base_url}/api/generate", json={'model': model, 'keep_alive': keep_alive})
+
+    @on_service_loop
+    async def preload(self, models: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Загрузка и закрепление моделей (по умолчанию — из OLLAMA_PRELOAD_MODELS)"""
+        loaded = {}
+        for model in models if models is not None else sorted(self.pinned):
+            self.pinned.add(model)
+            try:
+                response = await self._request(model, self.pinned_keep_alive)
+                response.raise_for_status()
+                data = response.json()
+                self.record_use(model, data.get('load_duration'))
+                loaded[model] = True
+                logger.info(f"Preloaded Ollama model {model}")
+            except Exception as e:
+                loaded[model] = False
+                logger.warning(f"Could not preload Ollama model {model}: {e}")
+        return loaded
+
+    @on_service_loop
+    async def evict(self, model: str) -> bool:
+        """Выгрузка модели из памяти сервера"""
+        try:
+            response = await self._request(model, 0)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Could not unload Ollama model {model}: {e}")
+            return False
+        with self._lock:
+            self._usage(model).resident = False
+        logger.info(f"Unloaded rarely used Ollama model {model}")
+        return True
+
+    @on_service_loop
+    async def enforce_limit(self) -> List[str]:
+        """Выгрузка моделей сверх OLLAMA_MAX_RESIDENT_MODELS"""
+        evicted = []
+        if not self.max_resident:
+            return evicted
+        # Модели могли загрузить другие процессы — сверяемся с сервером
+        await self.refresh()
+        for model in self.eviction_candidates():
+            if await self.evict(model):
+                evicted.append(model)
+        return evicted
+
+    @on_service_loop
+    async def refresh(self) -> bool:
+        """Синхронизация списка загруженных моделей с сервером (/api/ps)"""
+        try:
+            response = await self.client.get(f"{self.base_url}/api/ps")
+            response.raise_for_status()
+            running = {item.get('name') or item.get('model'): item for item in response.json().get('models', [])}
+        except Exception as e:
+            logger.warning(f"Could not list running Ollama models: {e}")
+            return False
+
+        with self._lock:
+            for name in running:
+                self._usage(name)
+            for name, usage in self._models.items():
+                item = running.get(name)
+                usage.resident = item is not None
+                usage.size_vram = item.get('size_vram', 0) if item else 0
+                usage.expires_at = item.get('expires_at') if item else None
+        return True
+
+    def sync_preload(self, models: Optional[Iterable[str]] = None) -> Dict[str, bool]:
+        """Синхронная версия предзагрузки"""
+        try:
+            return get_service_loop().run(self.preload(models))
+        except Exception as e:
+            logger.error(f"Error in sync preload: {e}")
+            return {}
+
+    def sync_refresh(self) -> bool:
+        """Синхронная версия refresh"""
+        try:
+            return get_service_loop().run(self.refresh())
+        except Exception as e:
+            logger.error(f"Error in sync refresh: {e}")
+            return False
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Резидентность и частота использования моделей"""
+        now = self._clock()
+        with self._lock:
+            return [
+                {
+                    'name': usage.name,
+                    'resident': usage.resident,
+                    'pinned': usage.name in self.pinned,
+                    'keep_alive': self.keep_alive_for(usage.name),
+                    'uses': usage.uses,
+                    'score': round(self._decayed(usage, now), 3),
+                    'idle_seconds': None if usage.last_used is None else round(now - usage.last_used, 3),
+                    'cold_starts': usage.cold_starts,
+                    'last_load_ms': round(usage.last_load_ms, 3),
+                    'size_vram': usage.size_vram,
+                    'expires_at': usage.expires_at,
+                }
+                for usage in sorted(self._models.values(), key=lambda usage: usage.name)
+            ]
+
+
+# Менеджер общий для всех экземпляров OllamaService с одним base_url
+_model_managers: Dict[str, ModelManager] = {}
+_model_managers_lock = threading.Lock()
+
+
+def preload_model_names() -> List[str]:
+    """Модели для предзагрузки из OLLAMA_PRELOAD_MODELS"""
+    return [name.strip() for name in getattr(settings, 'OLLAMA_PRELOAD_MODELS', '').split(',') if name.strip()]
+
+
+def get_model_manager(base_url: str) -> ModelManager:
+    """Получить менеджер моделей сервера"""
+    with _model_managers_lock:
+        if base_url not in _model_managers:
+            _model_managers[base_url] = ModelManager(
+                base_url,
+                keep_alive=getattr(settings, 'OLLAMA_KEEP_ALIVE', '30m'),
+                pinned_keep_alive=getattr(settings, 'OLLAMA_PRELOAD_KEEP_ALIVE', -1),
+                pinned=preload_model_names(),
+                embedding_models=[getattr(settings, 'OLLAMA_EMBEDDING_MODEL', 'nomic-embed-text')],
+                max_resident=getattr(settings, 'OLLAMA_MAX_RESIDENT_MODELS', 2),
+                half_life=getattr(settings, 'OLLAMA_MODEL_USAGE_HALF_LIFE', 600),
+            )
+        return _model_managers[base_url]
@@ -3,29 +3,151 @@ import logging
 from django.conf import settings
 from celery import shared_task
 import json
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, AsyncIterator, Iterator
 import asyncio
+import hashlib
+import time
+
+from .event_loop import get_http_client, get_service_loop, on_service_loop
+from .health import CircuitOpenError, get_connection_health
+from .metrics import get_metrics_collector
+from .model_lifecycle import get_model_manager
+from .response_cache import get_response_cache, response_tokens
+from .scheduler import PRIORITY_INTERACTIVE, get_request_scheduler
 
 logger = logging.getLogger(__name__)
 
+# Шаблоны промптов для analyze_text / analyze_code
+ANALYSIS_PROMPTS = {
+    'general': "Проанализируй текст: кратко опиши содержание, основные темы и тональность.\n\n{text}",
+    'summary': "Составь краткое резюме документа: основная тема, ключевые факты и выводы.\n\n{text}",
+    'sentiment': "Определи тональность текста (положительная, нейтральная, отрицательная) и обоснуй.\n\n{text}",
+    'keywords': "Выдели ключевые слова и фразы текста списком.\n\n{text}",
+    'code': "Проанализируй код на языке {language}: назначение, структура, возможные ошибки и улучшения.\n\n{text}",
+}
+
+def generation_event(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Часть потоковой генерации для клиента: токен, на последней части — статистика"""
+    event = {'response': chunk.get('response', ''), 'done': bool(chunk.get('done'))}
+    if event['done']:
+        event.update({
+            'model': chunk.get('model', ''),
+            'total_duration': chunk.get('total_duration', 0),
+            'prompt_eval_count': chunk.get('prompt_eval_count', 0),
+            'eval_count': chunk.get('eval_count', 0),
+            'cached': 'cache' in chunk,
+        })
+    return event
+
+
 class OllamaService:
-    def __init__(self, base_url: Optional[str] = None):
+    def __init__(self, base_url: Optional[str] = None, priority: int = PRIORITY_INTERACTIVE):
         self.base_url = base_url or getattr(settings, 'OLLAMA_BASE_URL', 'http://localhost:11434')
         self.default_model = getattr(settings, 'OLLAMA_DEFAULT_MODEL', 'llama3.2:1b')
-        self.timeout = 30.0
-        self.client = httpx.AsyncClient(timeout=self.timeout)
+        self.embedding_model = getattr(settings, 'OLLAMA_EMBEDDING_MODEL', 'nomic-embed-text')
+        self.timeout = getattr(settings, 'OLLAMA_TIMEOUT', 60)
+        self.health, self.breaker = get_connection_health(self.base_url)
+        self.models = get_model_manager(self.base_url)
+        # Приоритет в очереди планировщика: PRIORITY_BATCH для фоновой обработки архива
+        self.priority = priority
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Общий пул keep-alive соединений процесса (запросы идут на фоновом loop)"""
+        return get_http_client()
+
+    @on_service_loop
+    async def check_connection(self, force: bool = False) -> bool:
+        """
+        Проверка подключения к Ollama.
+        Результат кэшируется на OLLAMA_HEALTH_TTL секунд; обычные запросы тоже его обновляют.
+        """
+        if not force and self.health.is_fresh():
+            return bool(self.health.healthy)
 
-    async def check_connection(self) -> bool:
-        """Проверка подключения к Ollama"""
         try:
             url = f"{self.base_url}/api/tags"
             response = await self.client.get(url)
             response.raise_for_status()
+            self.health.update(True, probe=True)
             return True
         except Exception as e:
             logger.error(f"Ollama connection failed: {e}")
+            self.health.update(False, probe=True)
             return False
 
+    async def _post(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POST к Ollama через планировщик: очередь модели с приоритетом и
+        single-flight — одинаковые одновременные запросы выполняются один раз.
+        """
+        if 'model' in payload and 'keep_alive' not in payload:
+            payload = {**payload, 'keep_alive': self.models.keep_alive_for(payload['model'])}
+        body = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+        key = hashlib.sha256(f"{self.base_url}{path}\n{body}".encode('utf-8')).hexdigest()
+        return await get_request_scheduler().run(
+            payload.get('model', ''), lambda: self._send(path, payload), self.priority, key=key
+        )
+
+    async def _send(self, path: str, payload: Dict[str, Any]) -> httpx.Response:
+        """
+        POST к Ollama через circuit breaker.
+        Ошибки соединения и ответы 5xx считаются отказами сервера, 4xx — нет.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Ollama at {self.base_url} is unavailable, circuit is open")
+
+        try:
+            response = await self.client.post(f"{self.base_url}{path}", json=payload)
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except Exception as e:
+            self.breaker.record_failure(e)
+            self.health.update(False)
+            raise
+
+        if response.status_code >= 500:
+            self.breaker.record_failure(f"HTTP {response.status_code} from {path}")
+            self.health.update(False)
+        else:
+            self.breaker.record_success()
+            self.health.update(True)
+        return response
+
+    def _record_call(
+        self,
+        model: str,
+        operation: str,
+        started: float,
+        response: Optional[Dict[str, Any]] = None,
+        success: bool = True,
+        cache_hit: bool = False
+    ):
+        """
+        Учет вызова модели в метриках (задержка, токены, ошибки).
+        После успешного запроса к серверу — учет использования модели и проверка лимита резидентных моделей.
+        """
+        response = response or {}
+        get_metrics_collector().record(
+            model,
+            operation,
+            time.monotonic() - started,
+            success=success,
+            prompt_tokens=0 if cache_hit else int(response.get('prompt_eval_count') or 0),
+            completion_tokens=0 if cache_hit else int(response.get('eval_count') or 0),
+            cache_hit=cache_hit,
+        )
+        if success and not cache_hit:
+            kind = 'embed' if operation.startswith('embed') else 'generate'
+            if self.models.record_use(model, response.get('load_duration'), kind):
+                self.models.schedule_enforce_limit()
+
+    def connection_metrics(self) -> Dict[str, Any]:
+        """Состояние circuit breaker и последней проверки подключения"""
+        return {'health': self.health.snapshot(), 'circuit_breaker': self.breaker.metrics()}
+
+    @on_service_loop
     async def get_available_models(self) -> List[Dict[str, Any]]:
         """Получить список доступных моделей"""
         try:
@@ -38,39 +160,272 @@ class OllamaService:
             logger.error(f"Error fetching models: {e}")
             return []
 
-    async def generate(self, prompt: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
-        """Генерация текста с помощью модели"""
-        if not await self.check_connection():
-            logger.error("Ollama service is not available")
-            return None
-            
-        url = f"{self.base_url}/api/generate"
+    @on_service_loop
+    async def generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Генерация текста с помощью модели (один HTTP запрос, доступность отслеживает circuit breaker).
+        Ответ из кэша помечается ключом 'cache' с уровнем и сэкономленными токенами.
+        """
+        model = model or self.default_model
+        cache = get_response_cache() if use_cache else None
+        embedding = None
+        started = time.monotonic()
+
+        if cache is not None:
+            cached = await cache.aget(model, prompt, options)
+            if cached is not None:
+                self._record_call(model, 'generate', started, cache_hit=True)
+                return self._cached_response(cached, 'exact')
+            if cache.semantic:
+                embedding = await self.get_text_embedding(prompt)
+                similar = await cache.aget_similar(model, options, embedding)
+                if similar is not None:
+                    self._record_call(model, 'generate', started, cache_hit=True)
+                    return self._cached_response(similar[0], 'semantic', similar[1])
+
         data = {
-            "model": model or self.default_model,
+            "model": model,
             "prompt": prompt,
             "stream": False
         }
+        if options:
+            data["options"] = options
         
         try:
-            response = await self.client.post(url, json=data)
+            response = await self._post("/api/generate", data)
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            self._record_call(model, 'generate', started, success=False)
+            return None
         except Exception as e:
             logger.error(f"Error generating text: {e}")
+            self._record_call(model, 'generate', started, success=False)
             return None
 
+        self._record_call(model, 'generate', started, result)
+        if cache is not None and result.get('done', True):
+            await cache.aset(model, prompt, options, result, embedding)
+        return result
+
+    def generate_stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Потоковая генерация: части ответа Ollama (NDJSON) по мере появления токенов.
+        Последняя часть содержит done=True и статистику генерации.
+        """
+        return get_service_loop().iterate(self._stream_generate(prompt, model, options, use_cache))
+
+    def sync_generate_stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        options: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True
+    ) -> Iterator[Dict[str, Any]]:
+        """Синхронная версия потоковой генерации (для WSGI)"""
+        return get_service_loop().iterate_sync(self._stream_generate(prompt, model, options, use_cache))
+
+    async def _stream_generate(
+        self,
+        prompt: str,
+        model: Optional[str],
+        options: Optional[Dict[str, Any]],
+        use_cache: bool
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Выполняется на фоновом loop; готовый ответ из кэша отдается одной частью"""
+        model = model or self.default_model
+        cache = get_response_cache() if use_cache else None
+        started = time.monotonic()
+        if cache is not None:
+            cached = await cache.aget(model, prompt, options)
+            if cached is not None:
+                self._record_call(model, 'generate_stream', started, cache_hit=True)
+                yield self._cached_response(cached, 'exact')
+                return
+
+        data = {
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.models.keep_alive_for(model)
+        }
+        if options:
+            data["options"] = options
+
+        # Слот модели занят на все время потока
+        async with get_request_scheduler().slot(model, self.priority):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(f"Ollama at {self.base_url} is unavailable, circuit is open")
+
+            connected = False
+            parts = []
+            try:
+                async with self.client.stream("POST", f"{self.base_url}/api/generate", json=data) as response:
+                    connected = True
+                    if response.status_code >= 500:
+                        self.breaker.record_failure(f"HTTP {response.status_code} from /api/generate")
+                        self.health.update(False)
+                    else:
+                        self.breaker.record_success()
+                        self.health.update(True)
+                    response.raise_for_status()
+
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json.loads(line)
+                        if chunk.get('error'):
+                            raise RuntimeError(f"Ollama stream error: {chunk['error']}")
+                        parts.append(chunk.get('response', ''))
+                        yield chunk
+                        if chunk.get('done'):
+                            self._record_call(model, 'generate_stream', started, chunk)
+                            if cache is not None:
+                                await cache.aset(model, prompt, options, {**chunk, 'response': ''.join(parts)})
+                            return
+            except asyncio.CancelledError:
+                if not connected:
+                    self.breaker.release()
+                raise
+            except Exception as e:
+                if not connected:
+                    self.breaker.record_failure(e)
+                    self.health.update(False)
+                self._record_call(model, 'generate_stream', started, success=False)
+                raise
+
+    @staticmethod
+    def _cached_response(entry: Dict[str, Any], tier: str, similarity: float = 1.0) -> Dict[str, Any]:
+        return {
+            **entry,
+            'cache': {
+                'hit': True,
+                'tier': tier,
+                'similarity': similarity,
+                'tokens_saved': response_tokens(entry),
+                'time_saved_ms': (entry.get('total_duration') or 0) / 1e6,
+            },
+        }
+
+    async def analyze_text(self, text: str, analysis_type: str = 'general', model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Анализ текста по шаблону ANALYSIS_PROMPTS"""
+        template = ANALYSIS_PROMPTS.get(analysis_type, ANALYSIS_PROMPTS['general'])
+        return self._analysis_result(await self.generate(template.format(text=text), model), analysis_type)
+
+    async def analyze_code(self, code: str, language: str = 'auto', model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Анализ исходного кода"""
+        prompt = ANALYSIS_PROMPTS['code'].format(text=code, language=language)
+        return self._analysis_result(await self.generate(prompt, model), 'code')
+
+    @staticmethod
+    def _analysis_result(response: Optional[Dict[str, Any]], analysis_type: str) -> Optional[Dict[str, Any]]:
+        if not response:
+            return None
+        result = {
+            'analysis_type': analysis_type,
+            'analysis': response.get('response', ''),
+            'model': response.get('model', ''),
+            'prompt_eval_count': response.get('prompt_eval_count', 0),
+            'eval_count': response.get('eval_count', 0),
+            'total_duration': response.get('total_duration', 0),
+        }
+        if 'cache' in response:
+            result['cache'] = response['cache']
+        return result
+
+    @on_service_loop
+    async def get_text_embedding(self, text: str, model: Optional[str] = None) -> Optional[List[float]]:
+        """Получить векторное представление текста"""
+        data = {
+            "model": model or self.embedding_model,
+            "prompt": text
+        }
+        started = time.monotonic()
+        
+        try:
+            response = await self._post("/api/embeddings", data)
+            response.raise_for_status()
+            result = response.json()
+            self._record_call(data['model'], 'embed', started, result)
+            return result.get('embedding')
+        except Exception as e:
+            logger.error(f"Error getting embedding: {e}")
+            self._record_call(data['model'], 'embed', started, success=False)
+            return None
+
+    @on_service_loop
+    async def get_text_embeddings(self, texts: List[str], model: Optional[str] = None) -> List[Optional[List[float]]]:
+        """
+        Векторные представления для списка текстов одним запросом (/api/embed).
+        Для старых версий Ollama без /api/embed — параллельные запросы к /api/embeddings.
+        """
+        if not texts:
+            return []
+
+        data = {
+            "model": model or self.embedding_model,
+            "input": texts
+        }
+        started = time.monotonic()
+
+        try:
+            response = await self._post("/api/embed", data)
+            if response.status_code == 404:
+                return await asyncio.gather(*(self.get_text_embedding(text, model) for text in texts))
+            response.raise_for_status()
+            result = response.json()
+            self._record_call(data['model'], 'embed_batch', started, result)
+            embeddings = result.get('embeddings') or []
+            if len(embeddings) != len(texts):
+                logger.error(f"Embedding batch size mismatch: sent {len(texts)}, got {len(embeddings)}")
+                return [None] * len(texts)
+            return embeddings
+        except Exception as e:
+            logger.error(f"Error getting batch embeddings: {e}")
+            self._record_call(data['model'], 'embed_batch', started, success=False)
+            return [None] * len(texts)
+
     def sync_generate(self, prompt: str, model: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """Синхронная версия генерации текста"""
         try:
-            return asyncio.run(self.generate(prompt, model))
+            return get_service_loop().run(self.generate(prompt, model))
         except Exception as e:
             logger.error(f"Error in sync generate: {e}")
             return None
 
+    def sync_analyze_text(self, text: str, analysis_type: str = 'general', model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Синхронная версия анализа текста"""
+        try:
+            return get_service_loop().run(self.analyze_text(text, analysis_type, model))
+        except Exception as e:
+            logger.error(f"Error in sync analyze_text: {e}")
+            return None
+
+    def sync_analyze_code(self, code: str, language: str = 'auto', model: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Синхронная версия анализа кода"""
+        try:
+            return get_service_loop().run(self.analyze_code(code, language, model))
+        except Exception as e:
+            logger.error(f"Error in sync analyze_code: {e}")
+            return None
+
     def sync_check_connection(self) -> bool:
         """Синхронная проверка подключения"""
         try:
-            return asyncio.run(self.check_connection())
+            return get_service_loop().run(self.check_connection())
         except Exception as e:
             logger.error(f"Error in sync check_connection: {e}")
             return False
@@ -78,7 +433,7 @@ class OllamaService:
     def sync_get_available_models(self) -> List[Dict[str, Any]]:
         """Синхронная версия получения списка моделей"""
         try:
-            return asyncio.run(self.get_available_models())
+            return get_service_loop().run(self.get_available_models())
         except Exception as e:
             logger.error(f"Error in sync get_available_models: {e}")
             return []
@@ -0,0 +1,342 @@
+"""
+Кэш ответов Ollama.
+
+Точный уровень: ключ — SHA-256 от (model, prompt, options), хранилище
+подключаемое: LRU с TTL в памяти процесса или кэш Django
+(FileBasedCache, django-redis), указанный в OLLAMA_RESPONSE_CACHE_ALIAS.
+Семантический уровень (опционально): поиск почти одинаковых промптов
+по embedding промпта среди недавних ответов той же модели и опций.
+
+OllamaService обращается к кэшу через aget/aget_similar/aset на фоновом
+event loop: хранилища с вводом-выводом (blocking = True) вызываются
+в отдельном потоке, чтобы не задерживать остальные запросы к Ollama.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def _options_digest(model: str, options: Optional[Dict[str, Any]]) -> str:
+    payload = json.dumps({'model': model, 'options': options or {}}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def response_cache_key(model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Ключ точного уровня кэша"""
+    digest = hashlib.sha256(_options_digest(model, options).encode('ascii') + prompt.encode('utf-8')).hexdigest()
+    return f'ai:response:{digest}'
+
+
+def response_tokens(response: Dict[str, Any]) -> int:
+    """Токены запроса и ответа по счетчикам Ollama"""
+    return int(response.get('prompt_eval_count') or 0) + int(response.get('eval_count') or 0)
+
+
+class MemoryResponseBackend:
+    """LRU в памяти процесса с ограничением времени жизни записей"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 1000, timeout: Optional[int] = None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries: 'OrderedDict[str, Tuple[Optional[float], Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, entry = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        expires_at = time.monotonic() + self.timeout if self.timeout else None
+        with self._lock:
+            self._entries[key] = (expires_at, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DjangoCacheResponseBackend:
+    """Кэш Django (файловый, Redis и т.п.), общий для процессов"""
+
+    # Сетевой или дисковый ввод-вывод
+    blocking = True
+
+    def __init__(self, alias: str = 'default', timeout: Optional[int] = None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.cache.get(key)
+        except Exception as e:
+            logger.warning(f"Response cache '{self.alias}' is unavailable: {e}")
+            return None
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        try:
+            self.cache.set(key, entry, self.timeout)
+        except Exception as e:
+            logger.warning(f"Could not write to response cache '{self.alias}': {e}")
+
+    def clear(self):
+        # Общий кэш не очищаем целиком: в нем могут быть чужие ключи
+        pass
+
+
+# Зарегистрированные хранилища (ключ — значение OLLAMA_RESPONSE_CACHE_BACKEND)
+RESPONSE_CACHE_BACKENDS = {
+    'memory': lambda: MemoryResponseBackend(
+        max_entries=getattr(settings, 'OLLAMA_RESPONSE_CACHE_SIZE', 1000),
+        timeout=getattr(settings, 'OLLAMA_RESPONSE_CACHE_TTL', None),
+    ),
+    'django': lambda: DjangoCacheResponseBackend(
+        alias=getattr(settings, 'OLLAMA_RESPONSE_CACHE_ALIAS', 'default'),
+        timeout=getattr(settings, 'OLLAMA_RESPONSE_CACHE_TTL', None),
+    ),
+}
+
+
+class SemanticResponseIndex:
+    """
+    Кольцевой буфер embeddings недавних промптов.
+    Поиск — косинусное сходство среди записей с той же моделью и опциями.
+    """
+
+    def __init__(self, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._namespaces = np.zeros(max_entries, dtype=np.int64)
+        self._keys = [None] * max_entries
+        self._next = 0
+        self._size = 0
+
+    @staticmethod
+    def _namespace(model: str, options: Optional[Dict[str, Any]]) -> int:
+        return int(_options_digest(model, options)[:15], 16)
+
+    @staticmethod
+    def _normalize(embedding: Iterable[float]) -> Optional[np.ndarray]:
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector)) if vector.size else 0.0
+        return vector / norm if norm else None
+
+    def add(self, model: str, options: Optional[Dict[str, Any]], embedding: Iterable[float], key: str):
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._next = self._size = 0
+            position = self._next
+            self._matrix[position] = vector
+            self._namespaces[position] = self._namespace(model, options)
+            self._keys[position] = key
+            self._next = (position + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def search(
+        self,
+        model: str,
+        options: Optional[Dict[str, Any]],
+        embedding: Iterable[float],
+        threshold: float
+    ) -> Optional[Tuple[str, float]]:
+        """(ключ точного уровня, сходство) ближайшего промпта не ниже порога"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if vector is None or self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                return None
+            scores = self._matrix[:self._size] @ vector
+            scores[self._namespaces[:self._size] != self._namespace(model, options)] = -np.inf
+            if not scores.size:
+                return None
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            return self._keys[best], float(scores[best])
+
+    def clear(self):
+        with self._lock:
+            self._matrix = None
+            self._next = self._size = 0
+
+
+class ResponseCache:
+    """Кэш ответов генерации со счетчиками попаданий и сэкономленных токенов"""
+
+    def __init__(self, backend, semantic_index: Optional[SemanticResponseIndex] = None, similarity: float = 0.97):
+        self.backend = backend
+        self.semantic_index = semantic_index
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self.time_saved_ms = 0.0
+
+    @property
+    def semantic(self) -> bool:
+        return self.semantic_index is not None
+
+    def get(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Точный уровень: сохраненный ответ Ollama или None"""
+        entry = self.backend.get(response_cache_key(model, prompt, options))
+        if entry is not None:
+            self._count_hit('exact', entry)
+        elif not self.semantic:
+            self._count_miss()
+        return entry
+
+    def get_similar(
+        self,
+        model: str,
+        options: Optional[Dict[str, Any]],
+        embedding: Optional[Iterable[float]]
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Семантический уровень: (ответ, сходство) для почти такого же промпта"""
+        found = None
+        if self.semantic and embedding is not None:
+            found = self.semantic_index.search(model, options, embedding, self.similarity)
+        entry = self.backend.get(found[0]) if found else None
+        if entry is None:
+            self._count_miss()
+            return None
+        self._count_hit('semantic', entry)
+        return entry, found[1]
+
+    def set(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]],
+        response: Dict[str, Any],
+        embedding: Optional[Iterable[float]] = None
+    ):
+        key = response_cache_key(model, prompt, options)
+        self.backend.set(key, response)
+        if self.semantic and embedding is not None:
+            self.semantic_index.add(model, options, embedding, key)
+
+    async def _run(self, function, *args):
+        """Вызов из event loop: блокирующее хранилище — в отдельном потоке"""
+        if getattr(self.backend, 'blocking', True):
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+    async def aget(self, model: str, prompt: str, options: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return await self._run(self.get, model, prompt, options)
+
+    async def aget_similar(
+        self,
+        model: str,
+        options: Optional[Dict[str, Any]],
+        embedding: Optional[Iterable[float]]
+    ) -> Optional[Tuple[Dict[str, Any], float]]:
+        return await self._run(self.get_similar, model, options, embedding)
+
+    async def aset(
+        self,
+        model: str,
+        prompt: str,
+        options: Optional[Dict[str, Any]],
+        response: Dict[str, Any],
+        embedding: Optional[Iterable[float]] = None
+    ):
+        await self._run(self.set, model, prompt, options, response, embedding)
+
+    def _count_hit(self, tier: str, entry: Dict[str, Any]):
+        with self._lock:
+            if tier == 'exact':
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+            self.tokens_saved += response_tokens(entry)
+            self.time_saved_ms += (entry.get('total_duration') or 0) / 1e6
+
+    def _count_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def clear(self):
+        self.backend.clear()
+        if self.semantic:
+            self.semantic_index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                'exact_hits': self.exact_hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'tokens_saved': self.tokens_saved,
+                'time_saved_ms': round(self.time_saved_ms, 3),
+                'semantic': self.semantic,
+            }
+
+
+# Глобальный экземпляр кэша
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Глобальный кэш ответов или None, если он отключен (OLLAMA_RESPONSE_CACHE_BACKEND='none')"""
+    global _response_cache
+    backend_name = getattr(settings, 'OLLAMA_RESPONSE_CACHE_BACKEND', 'memory')
+    if backend_name == 'none':
+        return None
+
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                try:
+                    backend = RESPONSE_CACHE_BACKENDS[backend_name]()
+                except KeyError:
+                    raise ValueError(f"Unknown response cache backend: {backend_name}")
+                semantic_index = None
+                if getattr(settings, 'OLLAMA_RESPONSE_CACHE_SEMANTIC', False):
+                    semantic_index = SemanticResponseIndex(getattr(settings, 'OLLAMA_RESPONSE_CACHE_SIZE', 1000))
+                _response_cache = ResponseCache(
+                    backend,
+                    semantic_index,
+                    similarity=getattr(settings, 'OLLAMA_RESPONSE_CACHE_SIMILARITY', 0.97),
+                )
+    return _response_cache
@@ -0,0 +1,215 @@
+"""
+Планировщик запросов к Ollama.
+
+- не больше N одновременных запросов на модель (остальные ждут в очереди);
+- очередь с приоритетами: интерактивные запросы пользователей обслуживаются
+  раньше пакетной обработки архива;
+- single-flight: одинаковые запросы, выполняющиеся одновременно,
+  разделяют один запрос к Ollama.
+
+Работает на фоновом loop сервиса (event_loop.get_service_loop).
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from django.conf import settings
+
+from .event_loop import get_service_loop
+
+logger = logging.getLogger(__name__)
+
+# Меньшее значение — выше приоритет
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+
+class ModelQueue:
+    """Ограничение параллельных запросов к одной модели с очередью по приоритету"""
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self.active = 0
+        self._waiters = []  # heap (priority, sequence, future)
+
+    @property
+    def depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int, sequence: int):
+        if self.active < self.limit and not self.depth:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, sequence, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Слот уже передан нам, но ожидание отменено — возвращаем его
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Освобождение слота: передается ожидающему с наивысшим приоритетом"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+
+class ModelStats:
+    """Счетчики очереди одной модели"""
+
+    def __init__(self, samples: int):
+        self.started = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.waits = deque(maxlen=samples)
+
+
+class RequestScheduler:
+    """Очереди по моделям и разделение одинаковых запросов"""
+
+    def __init__(self, default_limit: int = 2, limits: Optional[Dict[str, int]] = None, wait_samples: int = 1000):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+        self.wait_samples = wait_samples
+        self._queues: Dict[str, ModelQueue] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        self._inflight: Dict[str, list] = {}  # key -> [task, waiters]
+        self._sequence = itertools.count()
+        # Метрики читаются из других потоков (status view)
+        self._stats_lock = threading.Lock()
+
+    def limit(self, model: str) -> int:
+        """Сколько запросов к модели выполняется одновременно"""
+        return max(1, self.limits.get(model, self.default_limit))
+
+    def active(self, model: str) -> int:
+        """Сколько запросов к модели выполняется сейчас"""
+        queue = self._queues.get(model)
+        return queue.active if queue else 0
+
+    def _queue(self, model: str) -> ModelQueue:
+        if model not in self._queues:
+            self._queues[model] = ModelQueue(self.limit(model))
+            with self._stats_lock:
+                self._stats[model] = ModelStats(self.wait_samples)
+        return self._queues[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: int = PRIORITY_INTERACTIVE):
+        """Слот модели на время запроса (для потоковой генерации — на весь поток)"""
+        queue = self._queue(model)
+        stats = self._stats[model]
+        if queue.active >= queue.limit or queue.depth:
+            with self._stats_lock:
+                stats.max_depth = max(stats.max_depth, queue.depth + 1)
+
+        started_at = time.monotonic()
+        await queue.acquire(priority, next(self._sequence))
+        with self._stats_lock:
+            stats.started += 1
+            stats.waits.append(time.monotonic() - started_at)
+        try:
+            yield
+        finally:
+            queue.release()
+
+    async def run(
+        self,
+        model: str,
+        factory: Callable[[], Awaitable[Any]],
+        priority: int = PRIORITY_INTERACTIVE,
+        key: Optional[str] = None
+    ) -> Any:
+        """
+        Выполняет factory() в слоте модели.
+        Запросы с одинаковым key, пришедшие пока первый выполняется, получают его результат.
+        """
+        if key is None:
+            async with self.slot(model, priority):
+                return await factory()
+
+        flight = self._inflight.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(self._run_in_slot(model, factory, priority))
+            flight = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        else:
+            self._queue(model)
+            with self._stats_lock:
+                self._stats[model].coalesced += 1
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Последний ожидающий ушел — запрос больше никому не нужен
+            if flight[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    async def _run_in_slot(self, model: str, factory: Callable[[], Awaitable[Any]], priority: int) -> Any:
+        async with self.slot(model, priority):
+            return await factory()
+
+    def _forget(self, key: str, task: asyncio.Future):
+        flight = self._inflight.get(key)
+        if flight is not None and flight[0] is task:
+            del self._inflight[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Глубина очереди, занятые слоты и время ожидания по моделям"""
+        result = {}
+        with self._stats_lock:
+            for model, stats in self._stats.items():
+                queue = self._queues[model]
+                waits = sorted(stats.waits)
+                result[model] = {
+                    'limit': queue.limit,
+                    'active': queue.active,
+                    'queued': queue.depth,
+                    'max_queued': stats.max_depth,
+                    'started': stats.started,
+                    'coalesced': stats.coalesced,
+                    'wait_ms_mean': round(1000 * sum(waits) / len(waits), 3) if waits else 0.0,
+                    'wait_ms_p95': round(1000 * waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                    'wait_ms_max': round(1000 * waits[-1], 3) if waits else 0.0,
+                }
+        return result
+
+
+# Планировщик привязан к фоновому loop процесса и пересоздается вместе с ним
+_request_scheduler = None
+_request_scheduler_loop = None
+_request_scheduler_lock = threading.Lock()
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """Получить планировщик запросов фонового loop"""
+    global _request_scheduler, _request_scheduler_loop
+    service_loop = get_service_loop()
+    if _request_scheduler is None or _request_scheduler_loop is not service_loop:
+        with _request_scheduler_lock:
+            if _request_scheduler is None or _request_scheduler_loop is not service_loop:
+                _request_scheduler = RequestScheduler(
+                    default_limit=getattr(settings, 'OLLAMA_MAX_CONCURRENCY', 2),
+                    limits=getattr(settings, 'OLLAMA_MODEL_CONCURRENCY', {}),
+                )
+                _request_scheduler_loop = service_loop
+    return _request_scheduler
@@ -0,0 +1,2 @@
+# Модули с задачами Celery (autodiscover_tasks импортирует только пакет)
+from . import analysis_tasks  # noqa
@@ -1,15 +1,35 @@
 import unittest
 import asyncio
+import json
+import os
+import tempfile
+import httpx
+import threading
+import time
 from unittest.mock import patch, Mock, MagicMock
-from django.test import TestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
 
+from .services.analysis_jobs import analysis_group, run_analysis
+from .services.chunked_analysis import ChunkedAnalyzer, TextChunker, iter_file_chunks
+from .services.event_loop import get_service_loop
+from .services.fake_ollama import FakeOllama, FakeOllamaServer
+from .services.health import CircuitBreaker, HealthState
+from .services.metrics import LatencyHistogram, MetricsCollector
+from .services.model_lifecycle import ModelManager
 from .services.ollama_service import OllamaService
-from .models import AIModel, AIAnalysis
+from .services.response_cache import (
+    DjangoCacheResponseBackend, MemoryResponseBackend, ResponseCache, SemanticResponseIndex, get_response_cache,
+    response_cache_key
+)
+from .services.scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, RequestScheduler
+from .models import AIModel, AIAnalysis, AIModelPerformance, AIUsageStatistics
+from .views.ai_views import GenerateTextView, get_demo_user
 
 
 class AsyncTestCase(TestCase):
@@ -96,6 +116,887 @@ class OllamaServiceTest(AsyncTestCase):
         self.async_test(run_test())
 
 
+class OllamaEmbeddingTest(AsyncTestCase):
+    """Тесты пакетного получения embeddings"""
+    
+    def setUp(self):
+        super().setUp()
+        # Отдельный base_url — circuit breaker не зависит от других тестов
+        self.ollama_service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+    
+    @patch('httpx.AsyncClient.post')
+    def test_batch_embeddings(self, mock_post):
+        """Тест получения embeddings одним запросом"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'embeddings': [[1.0, 0.0], [0.0, 1.0]]}
+        mock_post.return_value = mock_response
+        
+        result = self.async_test(self.ollama_service.get_text_embeddings(['a', 'b']))
+        self.assertEqual(result, [[1.0, 0.0], [0.0, 1.0]])
+        mock_post.assert_called_once()
+        self.assertEqual(mock_post.call_args.kwargs['json']['input'], ['a', 'b'])
+    
+    @patch('httpx.AsyncClient.post')
+    def test_batch_embeddings_failure(self, mock_post):
+        """Тест ошибки пакетного запроса"""
+        mock_post.side_effect = Exception("Connection error")
+        
+        result = self.async_test(self.ollama_service.get_text_embeddings(['a', 'b']))
+        self.assertEqual(result, [None, None])
+
+
+class FakeClock:
+    """Управляемые часы для тестов таймаутов"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class CircuitBreakerTest(SimpleTestCase):
+    """Тесты circuit breaker и TTL состояния подключения"""
+    
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=10, clock=self.clock)
+    
+    def test_opens_after_consecutive_failures(self):
+        """Тест открытия цепи после N ошибок подряд"""
+        self.breaker.record_failure('boom')
+        self.breaker.record_success()
+        for _ in range(2):
+            self.breaker.record_failure('boom')
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        
+        self.breaker.record_failure('boom')
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        
+        metrics = self.breaker.metrics()
+        self.assertEqual(metrics['rejected'], 1)
+        self.assertEqual(metrics['opened_count'], 1)
+        self.assertEqual(metrics['retry_in_seconds'], 10)
+    
+    def test_half_open_probe(self):
+        """Тест пробных запросов после reset_timeout"""
+        for _ in range(3):
+            self.breaker.record_failure('boom')
+        
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        
+        # Неудачная проба снова открывает цепь
+        self.breaker.record_failure('still down')
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        
+        self.clock.now = 25
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+    
+    def test_health_state_ttl(self):
+        """Тест актуальности результата проверки"""
+        health = HealthState(ttl=5, clock=self.clock)
+        self.assertFalse(health.is_fresh())
+        health.update(True, probe=True)
+        self.assertTrue(health.is_fresh())
+        self.clock.now = 5
+        self.assertFalse(health.is_fresh())
+
+
+@override_settings(OLLAMA_BREAKER_FAILURE_THRESHOLD=2, OLLAMA_HEALTH_TTL=60)
+class OllamaGenerateTest(AsyncTestCase):
+    """Тесты генерации без предварительной проверки подключения"""
+    
+    def setUp(self):
+        super().setUp()
+        # Отдельный base_url — отдельное состояние circuit breaker
+        self.ollama_service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+        get_response_cache().clear()
+    
+    @patch('httpx.AsyncClient.get')
+    @patch('httpx.AsyncClient.post')
+    def test_generate_is_single_request(self, mock_post, mock_get):
+        """Тест: генерация — ровно один HTTP запрос"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {'response': 'ok'}
+        mock_post.return_value = mock_response
+        
+        result = self.async_test(self.ollama_service.generate('Привет'))
+        self.assertEqual(result, {'response': 'ok'})
+        mock_post.assert_called_once()
+        mock_get.assert_not_called()
+        
+        # Успешный запрос обновляет состояние подключения — проверка не нужна
+        self.assertTrue(self.async_test(self.ollama_service.check_connection()))
+        mock_get.assert_not_called()
+    
+    @patch('httpx.AsyncClient.post')
+    def test_generate_fails_fast_when_circuit_open(self, mock_post):
+        """Тест отказа без запроса при открытой цепи"""
+        mock_post.side_effect = httpx.ConnectError('Connection refused')
+        
+        for _ in range(2):
+            self.assertIsNone(self.async_test(self.ollama_service.generate('Привет')))
+        self.assertEqual(mock_post.call_count, 2)
+        
+        self.assertIsNone(self.async_test(self.ollama_service.generate('Привет')))
+        self.assertEqual(mock_post.call_count, 2)
+        
+        metrics = self.ollama_service.connection_metrics()
+        self.assertEqual(metrics['circuit_breaker']['state'], 'open')
+        self.assertFalse(metrics['health']['healthy'])
+    
+    @patch('httpx.AsyncClient.post')
+    def test_client_errors_do_not_open_circuit(self, mock_post):
+        """Тест: ответы 4xx не считаются отказом сервера"""
+        mock_response = Mock()
+        mock_response.status_code = 404
+        mock_response.raise_for_status.side_effect = Exception('model not found')
+        mock_post.return_value = mock_response
+        
+        for _ in range(3):
+            self.assertIsNone(self.async_test(self.ollama_service.generate('Привет', 'missing')))
+        self.assertEqual(self.ollama_service.breaker.state, 'closed')
+
+
+class ModelManagerTest(SimpleTestCase):
+    """Тесты предзагрузки, keep_alive и вытеснения моделей"""
+    
+    def setUp(self):
+        self.requests = []
+        self.running = []
+        
+        def handler(request):
+            payload = json.loads(request.content) if request.content else {}
+            self.requests.append((request.url.path, payload))
+            if request.url.path == '/api/ps':
+                return httpx.Response(200, json={'models': [{'name': name, 'size_vram': 100} for name in self.running]})
+            if payload.get('keep_alive') == 0:
+                self.running.remove(payload['model'])
+            elif payload.get('model') not in self.running:
+                self.running.append(payload['model'])
+            return httpx.Response(200, json={'model': payload['model'], 'response': 'ok', 'done': True, 'load_duration': 2_000_000_000})
+        
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        for target in ('ollama_service', 'model_lifecycle'):
+            patcher = patch(f'ai_integration.services.{target}.get_http_client', return_value=self.client)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        
+        self.clock = FakeClock()
+        base_url = f'http://ollama-{self._testMethodName}:11434'
+        self.manager = ModelManager(
+            base_url, keep_alive='5m', pinned_keep_alive=-1, pinned=['llama'], embedding_models=['embed'],
+            max_resident=2, half_life=60, min_idle=10, clock=self.clock
+        )
+        self.service = OllamaService(base_url=base_url)
+        self.service.models = self.manager
+    
+    def test_preload_pins_models(self):
+        """Тест: предзагрузка закрепляет модели, embedding модель грузится через /api/embed"""
+        self.assertEqual(self.manager.sync_preload(['llama', 'embed']), {'llama': True, 'embed': True})
+        self.assertEqual(self.requests[0], ('/api/generate', {'model': 'llama', 'keep_alive': -1}))
+        self.assertEqual(self.requests[1], ('/api/embed', {'model': 'embed', 'input': '', 'keep_alive': -1}))
+        
+        snapshot = {item['name']: item for item in self.manager.snapshot()}
+        self.assertTrue(snapshot['llama']['resident'] and snapshot['llama']['pinned'])
+        self.assertEqual(snapshot['llama']['cold_starts'], 1)
+        self.assertEqual(snapshot['llama']['last_load_ms'], 2000)
+    
+    def test_requests_send_keep_alive(self):
+        """Тест: запросы передают keep_alive модели"""
+        self.service.sync_generate('Привет', 'llama')
+        self.service.sync_generate('Привет', 'mistral')
+        keep_alive = {payload['model']: payload['keep_alive'] for path, payload in self.requests if path == '/api/generate'}
+        self.assertEqual(keep_alive, {'llama': -1, 'mistral': '5m'})
+    
+    def test_evicts_least_used_model(self):
+        """Тест: сверх лимита выгружается редко используемая незакрепленная модель"""
+        for model in ['llama', 'mistral', 'mistral', 'mistral']:
+            self.manager.record_use(model)
+        self.clock.now = 5
+        self.manager.record_use('qwen')
+        self.running = ['llama', 'mistral', 'qwen']
+        
+        # Все модели использовались недавно — выгружать нечего
+        self.assertEqual(self.manager.eviction_candidates(), [])
+        
+        # mistral используется чаще qwen, llama закреплена
+        self.clock.now = 100
+        self.assertEqual(self.manager.eviction_candidates(), ['qwen'])
+        
+        self.assertEqual(get_service_loop().run(self.manager.enforce_limit()), ['qwen'])
+        self.assertIn(('/api/generate', {'model': 'qwen', 'keep_alive': 0}), self.requests)
+        resident = {item['name'] for item in self.manager.snapshot() if item['resident']}
+        self.assertEqual(resident, {'llama', 'mistral'})
+    
+    def test_refresh_tracks_server_state(self):
+        """Тест: резидентность сверяется с /api/ps"""
+        self.manager.record_use('mistral')
+        self.running = ['llama']
+        self.assertTrue(self.manager.sync_refresh())
+        snapshot = {item['name']: item for item in self.manager.snapshot()}
+        self.assertTrue(snapshot['llama']['resident'])
+        self.assertFalse(snapshot['mistral']['resident'])
+        self.assertEqual(snapshot['llama']['size_vram'], 100)
+
+
+class ServiceLoopTest(SimpleTestCase):
+    """Тесты общего event loop и пула соединений"""
+    
+    def setUp(self):
+        self.ollama_service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+    
+    def test_shared_loop_and_client(self):
+        """Тест: один loop и один httpx клиент на процесс"""
+        other = OllamaService()
+        self.assertIs(self.ollama_service.client, other.client)
+        self.assertIs(get_service_loop(), get_service_loop())
+        self.assertTrue(get_service_loop().thread.is_alive())
+    
+    @patch('httpx.AsyncClient.get')
+    def test_sync_calls_run_on_service_loop(self, mock_get):
+        """Тест: синхронные вызовы выполняются на фоновом loop без asyncio.run"""
+        threads = []
+        
+        async def fake_get(*args, **kwargs):
+            threads.append(threading.current_thread())
+            response = Mock()
+            response.json.return_value = {'models': [{'name': 'llama3.2:1b'}]}
+            return response
+        
+        mock_get.side_effect = fake_get
+        with patch('asyncio.run') as mock_run:
+            self.assertEqual(self.ollama_service.sync_get_available_models(), [{'name': 'llama3.2:1b'}])
+            self.assertEqual(self.ollama_service.sync_get_available_models(), [{'name': 'llama3.2:1b'}])
+            mock_run.assert_not_called()
+        self.assertEqual(threads, [get_service_loop().thread] * 2)
+        
+        # Из другого event loop вызов тоже переходит на фоновый loop
+        asyncio.run(self.ollama_service.get_available_models())
+        self.assertEqual(threads[-1], get_service_loop().thread)
+
+
+class ResponseCacheTest(AsyncTestCase):
+    """Тесты кэша ответов Ollama"""
+    
+    def setUp(self):
+        super().setUp()
+        self.ollama_service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+        self.cache = ResponseCache(MemoryResponseBackend(max_entries=10))
+        patcher = patch('ai_integration.services.ollama_service.get_response_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def mock_generate_response(self, mock_post):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'response': 'ok', 'done': True, 'eval_count': 30, 'prompt_eval_count': 12, 'total_duration': 2_000_000_000
+        }
+        mock_post.return_value = mock_response
+    
+    def test_cache_key(self):
+        """Тест ключа: модель, промпт и опции"""
+        key = response_cache_key('llama', 'Привет', {'temperature': 0, 'top_k': 5})
+        self.assertEqual(key, response_cache_key('llama', 'Привет', {'top_k': 5, 'temperature': 0}))
+        self.assertNotEqual(key, response_cache_key('llama', 'Привет', {'temperature': 1}))
+        self.assertNotEqual(key, response_cache_key('mistral', 'Привет', {'temperature': 0, 'top_k': 5}))
+    
+    def test_memory_backend_lru_and_ttl(self):
+        """Тест вытеснения и времени жизни записей"""
+        backend = MemoryResponseBackend(max_entries=2)
+        backend.set('a', {'n': 1})
+        backend.set('b', {'n': 2})
+        backend.get('a')
+        backend.set('c', {'n': 3})
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('a'), {'n': 1})
+        
+        expiring = MemoryResponseBackend(timeout=10)
+        expiring.set('a', {'n': 1})
+        with patch('time.monotonic', return_value=time.monotonic() + 11):
+            self.assertIsNone(expiring.get('a'))
+    
+    @patch('httpx.AsyncClient.post')
+    def test_repeated_prompt_served_from_cache(self, mock_post):
+        """Тест: повторный промпт не обращается к модели"""
+        self.mock_generate_response(mock_post)
+        
+        first = self.async_test(self.ollama_service.generate('Привет', 'llama'))
+        second = self.async_test(self.ollama_service.generate('Привет', 'llama'))
+        mock_post.assert_called_once()
+        self.assertNotIn('cache', first)
+        self.assertEqual(second['response'], 'ok')
+        self.assertEqual(second['cache']['tier'], 'exact')
+        self.assertEqual(second['cache']['tokens_saved'], 42)
+        
+        # Другие опции — другой ключ
+        self.async_test(self.ollama_service.generate('Привет', 'llama', options={'temperature': 0.9}))
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(self.cache.stats()['exact_hits'], 1)
+    
+    @patch('httpx.AsyncClient.post')
+    def test_semantic_tier(self, mock_post):
+        """Тест поиска почти одинакового промпта по embedding"""
+        self.cache.semantic_index = SemanticResponseIndex(max_entries=4)
+        embeddings = {'Привет, мир': [1.0, 0.0, 0.1], 'Привет мир!': [1.0, 0.0, 0.12], 'Пока': [0.0, 1.0, 0.0]}
+        
+        async def fake_embedding(text, model=None):
+            return embeddings[text]
+        
+        self.mock_generate_response(mock_post)
+        with patch.object(self.ollama_service, 'get_text_embedding', side_effect=fake_embedding):
+            self.async_test(self.ollama_service.generate('Привет, мир', 'llama'))
+            similar = self.async_test(self.ollama_service.generate('Привет мир!', 'llama'))
+            self.async_test(self.ollama_service.generate('Пока', 'llama'))
+        
+        self.assertEqual(similar['cache']['tier'], 'semantic')
+        self.assertGreater(similar['cache']['similarity'], 0.97)
+        self.assertEqual(mock_post.call_count, 2)
+    
+    @patch('httpx.AsyncClient.post')
+    def test_shared_backend_is_used_off_the_service_loop(self, mock_post):
+        """Тест: кэш Django читается и пишется не в потоке фонового event loop"""
+        self.mock_generate_response(mock_post)
+        backend = DjangoCacheResponseBackend()
+        self.cache.backend = backend
+        threads = []
+        
+        def remember_thread(function):
+            def call(*args):
+                threads.append(threading.current_thread())
+                return function(*args)
+            return call
+        
+        with patch.object(backend, 'get', side_effect=remember_thread(backend.get)), \
+                patch.object(backend, 'set', side_effect=remember_thread(backend.set)):
+            self.async_test(self.ollama_service.generate('Привет', 'llama'))
+            second = self.async_test(self.ollama_service.generate('Привет', 'llama'))
+        
+        self.assertEqual(second['cache']['tier'], 'exact')
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(get_service_loop().thread, threads)
+    
+    def test_cache_hit_recorded_in_analysis(self):
+        """Тест сохранения попадания в AIAnalysis"""
+        analysis = AIAnalysis()
+        analysis.record_cache_hit({'hit': True, 'tier': 'exact', 'tokens_saved': 42, 'time_saved_ms': 2000.0})
+        self.assertTrue(analysis.cache_hit)
+        self.assertEqual(analysis.tokens_saved, 42)
+        self.assertEqual(analysis.time_saved.total_seconds(), 2.0)
+        
+        empty = AIAnalysis()
+        empty.record_cache_hit(None)
+        self.assertFalse(empty.cache_hit)
+
+
+class OllamaStreamTest(SimpleTestCase):
+    """Тесты потоковой генерации"""
+    
+    CHUNKS = [
+        {'model': 'llama', 'response': 'При', 'done': False},
+        {'model': 'llama', 'response': 'вет', 'done': False},
+        {'model': 'llama', 'response': '', 'done': True, 'eval_count': 2, 'prompt_eval_count': 3, 'total_duration': 10},
+    ]
+    
+    def setUp(self):
+        self.requests = []
+        
+        def handler(request):
+            self.requests.append(json.loads(request.content))
+            body = ''.join(json.dumps(chunk) + '\n' for chunk in self.CHUNKS)
+            return httpx.Response(200, content=body.encode('utf-8'))
+        
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        self.cache = ResponseCache(MemoryResponseBackend(max_entries=10))
+        for target, value in [('get_http_client', self.client), ('get_response_cache', self.cache)]:
+            patcher = patch(f'ai_integration.services.ollama_service.{target}', return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.ollama_service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+    
+    def test_async_stream_from_other_loop(self):
+        """Тест разбора NDJSON потока в async генераторе"""
+        async def collect():
+            return [chunk async for chunk in self.ollama_service.generate_stream('Привет', 'llama')]
+        
+        chunks = asyncio.run(collect())
+        self.assertEqual([chunk['response'] for chunk in chunks], ['При', 'вет', ''])
+        self.assertTrue(chunks[-1]['done'])
+        self.assertTrue(self.requests[0]['stream'])
+    
+    def test_sync_stream_and_cache(self):
+        """Тест синхронного потока; полный ответ попадает в кэш"""
+        chunks = list(self.ollama_service.sync_generate_stream('Привет', 'llama'))
+        self.assertEqual(len(chunks), 3)
+        
+        cached = list(self.ollama_service.sync_generate_stream('Привет', 'llama'))
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(cached[0]['response'], 'Привет')
+        self.assertEqual(cached[0]['cache']['tokens_saved'], 5)
+    
+    def test_generate_view_streams_ndjson(self):
+        """Тест потокового ответа /api/v1/ai/generate/"""
+        with patch('ai_integration.views.ai_views.get_ollama_service', return_value=self.ollama_service):
+            request = APIRequestFactory().post('/api/v1/ai/generate/', {'prompt': 'Привет', 'stream': True}, format='json')
+            response = GenerateTextView.as_view()(request)
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([line['response'] for line in lines], ['При', 'вет', ''])
+        self.assertEqual(lines[-1]['eval_count'], 2)
+        self.assertFalse(lines[-1]['cached'])
+    
+    def test_stream_error_is_reported(self):
+        """Тест ошибки Ollama в потоке"""
+        self.CHUNKS = [{'error': 'model not found'}]
+        with self.assertRaises(RuntimeError):
+            list(self.ollama_service.sync_generate_stream('Привет', 'missing'))
+
+
+class RequestSchedulerTest(SimpleTestCase):
+    """Тесты планировщика запросов к Ollama"""
+    
+    def test_limit_per_model(self):
+        """Тест: не больше limit одновременных запросов к модели"""
+        scheduler = RequestScheduler(default_limit=2, limits={'small': 1})
+        running = {'llama': 0, 'small': 0}
+        peak = {'llama': 0, 'small': 0}
+        
+        async def work(model):
+            async with scheduler.slot(model):
+                running[model] += 1
+                peak[model] = max(peak[model], running[model])
+                await asyncio.sleep(0.01)
+                running[model] -= 1
+        
+        async def main():
+            await asyncio.gather(*(work(model) for model in ['llama'] * 5 + ['small'] * 3))
+        
+        asyncio.run(main())
+        self.assertEqual(peak, {'llama': 2, 'small': 1})
+        metrics = scheduler.metrics()
+        self.assertEqual(metrics['llama']['started'], 5)
+        self.assertEqual(metrics['llama']['active'], 0)
+        self.assertEqual(metrics['llama']['max_queued'], 3)
+        self.assertGreater(metrics['small']['wait_ms_max'], 0)
+    
+    def test_interactive_requests_go_first(self):
+        """Тест: интерактивные запросы обслуживаются раньше пакетных"""
+        scheduler = RequestScheduler(default_limit=1)
+        order = []
+        
+        async def work(name, priority):
+            async with scheduler.slot('llama', priority):
+                order.append(name)
+                await asyncio.sleep(0.001)
+        
+        async def main():
+            first = asyncio.ensure_future(work('first', PRIORITY_BATCH))
+            await asyncio.sleep(0)
+            waiting = [asyncio.ensure_future(work(f'batch{i}', PRIORITY_BATCH)) for i in range(3)]
+            waiting.append(asyncio.ensure_future(work('user', PRIORITY_INTERACTIVE)))
+            await asyncio.gather(first, *waiting)
+        
+        asyncio.run(main())
+        self.assertEqual(order, ['first', 'user', 'batch0', 'batch1', 'batch2'])
+    
+    def test_cancelled_waiter_does_not_leak_slot(self):
+        """Тест: отмена ожидающего запроса не занимает слот"""
+        scheduler = RequestScheduler(default_limit=1)
+        
+        async def hold(delay):
+            async with scheduler.slot('llama'):
+                await asyncio.sleep(delay)
+        
+        async def main():
+            first = asyncio.ensure_future(hold(0.01))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(hold(0))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await first
+            await asyncio.wait_for(hold(0), timeout=1)
+        
+        asyncio.run(main())
+        self.assertEqual(scheduler.metrics()['llama']['active'], 0)
+        self.assertEqual(scheduler.metrics()['llama']['queued'], 0)
+    
+    def test_single_flight(self):
+        """Тест: одинаковые одновременные запросы выполняются один раз"""
+        scheduler = RequestScheduler()
+        calls = []
+        
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'response': 'ok'}
+        
+        async def main():
+            same = [scheduler.run('llama', factory, key='a') for _ in range(5)]
+            return await asyncio.gather(*same, scheduler.run('llama', factory, key='b'))
+        
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 2)
+        self.assertTrue(all(result == {'response': 'ok'} for result in results))
+        self.assertEqual(scheduler.metrics()['llama']['coalesced'], 4)
+        
+        # После завершения запрос с тем же ключом выполняется заново
+        asyncio.run(scheduler.run('llama', factory, key='a'))
+        self.assertEqual(len(calls), 3)
+    
+    def test_single_flight_survives_one_cancelled_caller(self):
+        """Тест: отмена одного из ожидающих не отменяет общий запрос"""
+        scheduler = RequestScheduler()
+        calls = []
+        
+        async def factory():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 'ok'
+        
+        async def main():
+            first = asyncio.ensure_future(scheduler.run('llama', factory, key='a'))
+            second = asyncio.ensure_future(scheduler.run('llama', factory, key='a'))
+            await asyncio.sleep(0)
+            first.cancel()
+            return await second
+        
+        self.assertEqual(asyncio.run(main()), 'ok')
+        self.assertEqual(len(calls), 1)
+    
+    def test_service_coalesces_identical_requests(self):
+        """Тест: одинаковые запросы OllamaService — один HTTP запрос"""
+        requests = []
+        
+        async def handler(request):
+            requests.append(json.loads(request.content))
+            await asyncio.sleep(0.02)
+            return httpx.Response(200, json={'model': 'llama', 'response': 'ok', 'done': True})
+        
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+        
+        async def main():
+            return await asyncio.gather(*(service.generate('Привет', 'llama', use_cache=False) for _ in range(4)))
+        
+        with patch('ai_integration.services.ollama_service.get_http_client', return_value=client):
+            results = asyncio.run(main())
+        self.assertEqual(len(requests), 1)
+        self.assertEqual([result['response'] for result in results], ['ok'] * 4)
+
+
+class ChunkedAnalysisTest(SimpleTestCase):
+    """Тесты анализа длинных документов по частям"""
+    
+    TEXT = '\n\n'.join(
+        ' '.join(f'слово{paragraph}_{word}.' for word in range(40)) for paragraph in range(30)
+    )
+    
+    def setUp(self):
+        self.chunker = TextChunker(chunk_tokens=100, overlap_tokens=10, chars_per_token=4)
+        self.requests = []
+        self.active = 0
+        self.peak = 0
+        
+        async def handler(request):
+            payload = json.loads(request.content)
+            self.requests.append(payload['prompt'])
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0.005)
+            self.active -= 1
+            return httpx.Response(200, json={
+                'model': 'llama', 'response': f'изложение {len(self.requests)}', 'done': True,
+                'prompt_eval_count': 10, 'eval_count': 2
+            })
+        
+        self.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        patcher = patch('ai_integration.services.ollama_service.get_http_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+    
+    def test_chunks_are_bounded_and_overlap(self):
+        """Тест: части не больше лимита, перекрываются и покрывают весь текст"""
+        chunks = list(self.chunker.split([self.TEXT]))
+        self.assertGreater(len(chunks), 10)
+        self.assertTrue(all(len(chunk) <= self.chunker.chunk_chars for chunk in chunks))
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertIn(current.split(' ', 1)[0], previous[-self.chunker.overlap_chars:])
+        words = set(self.TEXT.split())
+        self.assertEqual(set(' '.join(chunks).split()), words)
+    
+    def test_file_is_read_incrementally(self):
+        """Тест: блоки чтения не влияют на нарезку"""
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', encoding='utf-8', delete=False) as f:
+            f.write(self.TEXT)
+        self.addCleanup(os.remove, f.name)
+        
+        self.assertEqual(
+            list(iter_file_chunks(f.name, self.chunker, read_size=97)),
+            list(self.chunker.split([self.TEXT]))
+        )
+    
+    def test_map_reduce(self):
+        """Тест: части анализируются параллельно в пределах лимита, токены суммируются"""
+        analyzer = ChunkedAnalyzer(self.service, self.chunker, reduce_tokens=20, concurrency=3)
+        chunks = list(self.chunker.split([self.TEXT]))
+        
+        result = asyncio.run(analyzer.analyze(iter(chunks), 'summary', 'llama'))
+        
+        self.assertEqual(result['chunks'], len(chunks))
+        self.assertEqual(result['failed_chunks'], 0)
+        self.assertLessEqual(self.peak, 3)
+        self.assertGreater(self.peak, 1)
+        map_calls = [prompt for prompt in self.requests if prompt.startswith('Это часть')]
+        self.assertEqual(len(map_calls), len(chunks))
+        self.assertTrue(any(prompt.startswith('Объедини') for prompt in self.requests))
+        self.assertTrue(self.requests[-1].startswith('Составь краткое резюме'))
+        self.assertEqual(result['prompt_eval_count'], 10 * len(self.requests))
+        self.assertEqual(result['eval_count'], 2 * len(self.requests))
+    
+    def test_short_document_is_single_request(self):
+        """Тест: документ из одной части — один запрос без map-reduce"""
+        result = asyncio.run(ChunkedAnalyzer(self.service, self.chunker).analyze(['Короткий текст'], 'general', 'llama'))
+        self.assertEqual(len(self.requests), 1)
+        self.assertEqual(result['analysis'], 'изложение 1')
+        self.assertNotIn('chunks', result)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class AnalysisJobTest(APITestCase):
+    """Тесты анализа в режиме задания (Celery)"""
+    
+    RESULT = {'analysis_type': 'general', 'analysis': 'Нейтральный текст', 'model': 'llama'}
+    
+    def setUp(self):
+        self.service = Mock()
+        self.service.default_model = 'llama'
+        self.service.sync_analyze_text.return_value = self.RESULT
+        patcher = patch('ai_integration.services.analysis_jobs.get_ollama_service', return_value=self.service)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    @patch('ai_integration.views.ai_views.analyze_text_async.delay')
+    def test_text_analysis_is_queued(self, mock_delay):
+        """Тест: POST ставит анализ в очередь и сразу отвечает 202"""
+        with patch('ai_integration.views.ai_views.get_ollama_service', return_value=self.service):
+            response = self.client.post('/api/v1/ai/analyze/text/', {'text': 'Привет', 'analysis_type': 'sentiment'}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        analysis_id = response.data['analysis_id']
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(response.data['channel_group'], analysis_group(analysis_id))
+        mock_delay.assert_called_once_with(analysis_id, 'sentiment', 'python')
+        self.service.sync_analyze_text.assert_not_called()
+        
+        # Опрос до и после выполнения задачи
+        self.assertEqual(self.client.get(response.data['status_url']).data['status'], 'pending')
+        run_analysis(analysis_id, 'sentiment')
+        state = self.client.get(response.data['status_url']).data
+        self.assertEqual(state['status'], 'completed')
+        self.assertEqual(state['result'], self.RESULT)
+        self.service.sync_analyze_text.assert_called_once_with('Привет', 'sentiment', 'llama')
+    
+    def test_sync_mode(self):
+        """Тест: async=false — анализ внутри запроса"""
+        with patch('ai_integration.views.ai_views.get_ollama_service', return_value=self.service):
+            response = self.client.post('/api/v1/ai/analyze/text/', {'text': 'Привет', 'async': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['result'], self.RESULT)
+    
+    @patch('ai_integration.views.ai_views.analyze_text_async.delay', side_effect=ConnectionError('broker is down'))
+    def test_queue_unavailable(self, mock_delay):
+        """Тест: ошибка постановки в очередь — 503 и анализ помечен неудачным"""
+        with patch('ai_integration.views.ai_views.get_ollama_service', return_value=self.service):
+            response = self.client.post('/api/v1/ai/analyze/text/', {'text': 'Привет'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(AIAnalysis.objects.get(id=response.data['analysis_id']).status, 'failed')
+    
+    def test_progress_is_published(self):
+        """Тест: смена статуса отправляется в группу channel layer"""
+        analysis = AIAnalysis.objects.create(
+            user=get_demo_user(),
+            ai_model=AIModel.objects.create(name='llama', model_type='text_analysis'),
+            analysis_type='text',
+            input_data='Привет'
+        )
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(analysis_group(analysis.id), channel)
+        
+        self.service.sync_analyze_text.return_value = None
+        run_analysis(analysis.id)
+        
+        events = [async_to_sync(channel_layer.receive)(channel)['analysis'] for _ in range(2)]
+        self.assertEqual([event['status'] for event in events], ['processing', 'failed'])
+        self.assertEqual(events[-1]['error'], 'Failed to get response from AI service')
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MetricsCollectorTest(TestCase):
+    """Тесты метрик вызовов Ollama и их записи в БД"""
+    
+    def setUp(self):
+        self.collector = MetricsCollector()
+        for target in ('ollama_service', 'analysis_jobs'):
+            patcher = patch(f'ai_integration.services.{target}.get_metrics_collector', return_value=self.collector)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_latency_histogram(self):
+        """Тест: квантили по корзинам гистограммы"""
+        histogram = LatencyHistogram()
+        for ms in [10] * 90 + [700] * 9 + [90000]:
+            histogram.observe(ms)
+        self.assertEqual(histogram.quantile(0.5), 50.0)
+        self.assertEqual(histogram.quantile(0.95), 1000.0)
+        self.assertEqual(histogram.quantile(1.0), 90000.0)
+        self.assertEqual(histogram.snapshot()['buckets']['inf'], 1)
+    
+    def test_service_calls_are_recorded(self):
+        """Тест: генерация учитывает токены, ошибки и ответы из кэша"""
+        replies = [
+            httpx.Response(200, json={'model': 'llama', 'response': 'ok', 'done': True, 'prompt_eval_count': 7, 'eval_count': 3}),
+            httpx.Response(500, json={'error': 'boom'}),
+        ]
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: replies.pop(0)))
+        with patch('ai_integration.services.ollama_service.get_http_client', return_value=client):
+            service = OllamaService(base_url=f'http://ollama-{self._testMethodName}:11434')
+            prompt = f'prompt {self._testMethodName}'
+            self.assertIsNotNone(service.sync_generate(prompt, 'llama'))
+            self.assertIsNotNone(service.sync_generate(prompt, 'llama'))
+            self.assertIsNone(service.sync_generate(f'{prompt} 2', 'llama'))
+        
+        stats = self.collector.snapshot()['llama']['generate']
+        self.assertEqual((stats['requests'], stats['errors'], stats['cache_hits']), (3, 1, 1))
+        self.assertEqual((stats['prompt_tokens'], stats['completion_tokens']), (7, 3))
+        self.assertEqual(stats['latency']['count'], 3)
+    
+    def test_flush_upserts_daily_rows(self):
+        """Тест: повторная запись дополняет строки дня, средние взвешиваются"""
+        user = User.objects.create_user('metrics', password='x')
+        self.collector.record('llama', 'generate', 1.0, prompt_tokens=10, completion_tokens=10)
+        self.collector.record('llama', 'generate', 0.001, cache_hit=True)
+        self.collector.record_usage(user.id, True, 20, 1.5)
+        self.assertEqual(self.collector.flush(), {'models': 1, 'users': 1})
+        
+        self.collector.record('llama', 'generate', 3.0, success=False)
+        self.collector.record('llama', 'embed', 2.0, prompt_tokens=4)
+        self.collector.record_usage(user.id, False, 0, 0.5)
+        self.collector.flush()
+        self.assertEqual(self.collector.flush(), {'models': 0, 'users': 0})
+        
+        performance = AIModelPerformance.objects.get(ai_model__name='llama')
+        self.assertEqual(performance.total_requests, 3)
+        self.assertEqual(performance.successful_requests, 2)
+        self.assertAlmostEqual(performance.avg_response_time.total_seconds(), 2.0, places=3)
+        self.assertAlmostEqual(performance.avg_tokens_per_request, 8.0)
+        self.assertAlmostEqual(performance.error_rate, 100 / 3)
+        
+        usage = AIUsageStatistics.objects.get(user=user)
+        self.assertEqual((usage.total_requests, usage.successful_requests, usage.failed_requests), (2, 1, 1))
+        self.assertEqual(usage.total_tokens, 20)
+        self.assertEqual(usage.total_processing_time.total_seconds(), 2.0)
+    
+    def test_flush_failure_keeps_deltas(self):
+        """Тест: при ошибке записи приращения сохраняются до следующей попытки"""
+        self.collector.record('llama', 'generate', 1.0)
+        with patch('ai_integration.services.metrics.AIModelPerformance.objects.bulk_create', side_effect=RuntimeError('db')):
+            self.assertEqual(self.collector.flush(), {'models': 0, 'users': 0})
+        self.assertEqual(self.collector.flush(), {'models': 1, 'users': 0})
+        self.assertEqual(AIModelPerformance.objects.get(ai_model__name='llama').total_requests, 1)
+    
+    def test_flush_derives_model_type_from_operations(self):
+        """Тест: модель, которая только строит эмбеддинги, создается с типом embedding"""
+        self.collector.record('nomic-embed-text', 'embed', 0.1, prompt_tokens=4)
+        self.collector.record('nomic-embed-text', 'embed_batch', 0.2, prompt_tokens=8)
+        self.collector.record('llama', 'generate', 1.0)
+        self.collector.record('llama', 'embed', 0.1)
+        self.collector.flush()
+    
+        self.assertEqual(AIModel.objects.get(name='nomic-embed-text').model_type, 'embedding')
+        self.assertEqual(AIModel.objects.get(name='llama').model_type, 'text_analysis')
+    
+    def test_run_analysis_records_usage(self):
+        """Тест: анализ сохраняет время обработки и токены и учитывается в статистике пользователя"""
+        service = Mock()
+        service.sync_analyze_text.return_value = {'analysis': 'ok', 'prompt_eval_count': 12, 'eval_count': 5}
+        analysis = AIAnalysis.objects.create(
+            user=get_demo_user(),
+            ai_model=AIModel.objects.create(name='llama', model_type='text_analysis'),
+            analysis_type='text',
+            input_data='Привет'
+        )
+        run_analysis(analysis.id, service=service)
+        
+        analysis.refresh_from_db()
+        self.assertEqual(analysis.tokens_used, 17)
+        self.assertIsNotNone(analysis.processing_time)
+        self.collector.flush()
+        usage = AIUsageStatistics.objects.get(user=analysis.user)
+        self.assertEqual((usage.total_requests, usage.total_tokens), (1, 17))
+
+
+class FakeOllamaTest(SimpleTestCase):
+    """Тесты фиктивного сервера Ollama (через настоящий HTTP)"""
+    
+    def start(self, **kwargs) -> OllamaService:
+        self.fake = FakeOllama(models=['llama', 'embed'], embedding_dim=8, response_tokens=5, **kwargs)
+        server = FakeOllamaServer(('127.0.0.1', 0), self.fake)
+        server.start()
+        self.addCleanup(server.stop)
+        service = OllamaService(base_url=server.base_url)
+        service.embedding_model = 'embed'
+        return service
+    
+    def test_generate_is_deterministic(self):
+        """Тест: одинаковый запрос — одинаковый ответ, обычный и потоковый режимы совпадают"""
+        service = self.start()
+        first = get_service_loop().run(service.generate('Привет', 'llama', use_cache=False))
+        second = get_service_loop().run(service.generate('Привет', 'llama', use_cache=False))
+        self.assertEqual(first['response'], second['response'])
+        self.assertEqual(first['eval_count'], 5)
+        self.assertNotEqual(first['response'], service.sync_generate('Другой запрос', 'llama')['response'])
+        
+        chunks = list(service.sync_generate_stream('Привет', 'llama', use_cache=False))
+        self.assertTrue(chunks[-1]['done'])
+        self.assertEqual(''.join(chunk['response'] for chunk in chunks), first['response'])
+        self.assertEqual([model['name'] for model in service.sync_get_available_models()], ['llama', 'embed'])
+    
+    def test_embeddings(self):
+        """Тест: векторы детерминированы и нормированы, /api/embed совпадает с /api/embeddings"""
+        service = self.start()
+        single = get_service_loop().run(service.get_text_embedding('текст'))
+        batch = get_service_loop().run(service.get_text_embeddings(['текст', 'другой']))
+        self.assertEqual(len(single), 8)
+        self.assertAlmostEqual(sum(value * value for value in single), 1.0)
+        self.assertEqual(batch[0], single)
+        self.assertNotEqual(batch[1], single)
+    
+    def test_error_and_latency_injection(self):
+        """Тест: доля ошибок и задержка применяются к запросам"""
+        service = self.start(error_rate=1.0)
+        self.assertIsNone(get_service_loop().run(service.generate('Привет', 'llama', use_cache=False)))
+        self.assertEqual(self.fake.stats()['errors'], 1)
+        
+        service = self.start(latency_ms=50)
+        started = time.monotonic()
+        self.assertIsNotNone(get_service_loop().run(service.generate('Привет', 'llama', use_cache=False)))
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+
 class AIModelTest(TestCase):
     """Тесты для модели AI"""
     
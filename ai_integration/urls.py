@@ -6,6 +6,7 @@ from .views.ai_views import (
     FileAnalysisView,
     SmartSearchView,
     AnalysisHistoryView,
+    AnalysisDetailView,
     GenerateTextView
 )
 
@@ -24,6 +25,7 @@ urlpatterns = [
     
     # History and management
     path('history/', AnalysisHistoryView.as_view(), name='analysis-history'),
+    path('analysis/<int:analysis_id>/', AnalysisDetailView.as_view(), name='analysis-detail'),
     
     # Text generation
     path('generate/', GenerateTextView.as_view(), name='generate-text'),
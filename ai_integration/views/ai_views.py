@@ -5,11 +5,22 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 import json
 import logging
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.models import User
 
 from ai_integration.models import AIModel, AIAnalysis
-from ai_integration.services.ollama_service import get_ollama_service
+from ai_integration.services.analysis_jobs import (
+    analysis_group, analysis_state, run_analysis, set_analysis_status
+)
+from ai_integration.services.metrics import get_metrics_collector
+from ai_integration.services.ollama_service import generation_event, get_ollama_service
+from ai_integration.services.response_cache import get_response_cache
+from ai_integration.services.scheduler import get_request_scheduler
+from ai_integration.tasks.analysis_tasks import analyze_file_async, analyze_text_async
 from filemanager.models import FileItem
 
 logger = logging.getLogger(__name__)
@@ -28,6 +39,35 @@ def get_demo_user():
     return user
 
 
+def is_async_request(request):
+    """Режим задания: параметр async запроса, по умолчанию OLLAMA_ANALYSIS_ASYNC"""
+    value = request.data.get('async')
+    if value is None:
+        return getattr(settings, 'OLLAMA_ANALYSIS_ASYNC', True)
+    return str(value).lower() in ('1', 'true')
+
+
+def enqueue_analysis(analysis, task, *args):
+    """Постановка анализа в очередь Celery; ответ 202 с id и адресом для опроса"""
+    try:
+        task.delay(analysis.id, *args)
+    except Exception as e:
+        logger.error(f"Could not queue analysis {analysis.id}: {e}")
+        set_analysis_status(analysis, 'failed', f'Could not queue analysis: {e}')
+        return Response({
+            'analysis_id': analysis.id,
+            'error': 'Analysis queue is unavailable'
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    
+    analysis.refresh_from_db(fields=['status'])
+    return Response({
+        'analysis_id': analysis.id,
+        'status': analysis.status,
+        'status_url': reverse('ai_integration:analysis-detail', args=[analysis.id]),
+        'channel_group': analysis_group(analysis.id)
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 class OllamaStatusView(APIView):
     """Проверка статуса Ollama сервера"""
     permission_classes = [AllowAny]  # Temporarily allow access without auth for testing
@@ -36,13 +76,21 @@ class OllamaStatusView(APIView):
         """Проверить подключение к Ollama"""
         service = get_ollama_service()
         is_connected = service.sync_check_connection()
+        cache = get_response_cache()
         models = service.sync_get_available_models() if is_connected else []
+        if is_connected:
+            service.models.sync_refresh()
         
         return Response({
             'connected': is_connected,
             'available_models': models,
             'default_model': service.default_model,
-            'base_url': service.base_url
+            'base_url': service.base_url,
+            **service.connection_metrics(),
+            'response_cache': cache.stats() if cache else None,
+            'scheduler': get_request_scheduler().metrics(),
+            'resident_models': service.models.snapshot(),
+            'metrics': get_metrics_collector().snapshot()
         })
 
 
@@ -76,49 +124,28 @@ class TextAnalysisView(APIView):
                 ai_model=ai_model,
                 analysis_type='text',
                 input_data=text,
-                status='processing'
+                status='pending'
             )
-            
-            # Выполняем анализ
-            if analysis_type == 'code':
-                language = request.data.get('language', 'python')
-                result = service.sync_analyze_code(text, language)
-            elif analysis_type == 'document':
-                result = service.sync_analyze_text(text, 'summary')
-            else:
-                result = service.sync_analyze_text(text, analysis_type)
-            
-            # Обновляем результат
-            if result:
-                analysis.output_data = json.dumps(result, ensure_ascii=False)
-                analysis.result = result
-                analysis.status = 'completed'
-                analysis.completed_at = timezone.now()
-                analysis.save()
-                
-                return Response({
-                    'analysis_id': analysis.id,
-                    'result': result,
-                    'status': 'completed'
-                })
-            else:
-                analysis.status = 'failed'
-                analysis.error_message = 'Failed to get response from AI service'
-                analysis.save()
-                return Response({
-                    'error': 'Failed to analyze text'
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
         except Exception as e:
-            # Обновляем статус ошибки
-            if 'analysis' in locals():
-                analysis.status = 'failed'
-                analysis.error_message = str(e)
-                analysis.save()
-            
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        language = request.data.get('language', 'python')
+        if is_async_request(request):
+            return enqueue_analysis(analysis, analyze_text_async, analysis_type, language)
+        
+        # Синхронный режим: анализ внутри запроса
+        analysis = run_analysis(analysis.id, analysis_type, language, service)
+        if analysis.status == 'completed':
+            return Response({
+                'analysis_id': analysis.id,
+                'result': analysis.result,
+                'status': 'completed'
+            })
+        return Response({
+            'error': analysis.error_message or 'Failed to analyze text'
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 class FileAnalysisView(APIView):
@@ -152,41 +179,18 @@ class FileAnalysisView(APIView):
                 file_item=file_item,
                 analysis_type='file_analysis',
                 input_data=f"File: {file_item.name}",
-                status='processing'
+                status='pending'
             )
             
-            # Выполняем анализ файла
-            try:
-                with open(file_item.full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                
-                # Ограничиваем размер для анализа
-                if len(content) > 10000:
-                    content = content[:10000] + "\n... (content truncated)"
-                
-                if file_item.mime_type and 'code' in file_item.mime_type.lower():
-                    result = service.sync_analyze_code(content, file_item.extension or 'auto')
-                else:
-                    result = service.sync_analyze_text(content, 'general')
-                
-            except Exception as e:
-                result = None
-                logger.error(f"Error reading file {file_item.full_path}: {e}")
+            if is_async_request(request):
+                return enqueue_analysis(analysis, analyze_file_async)
             
-            if result:
-                analysis.output_data = json.dumps(result, ensure_ascii=False)
-                analysis.result = result
-                analysis.status = 'completed'
-                analysis.completed_at = timezone.now()
-            else:
-                analysis.status = 'failed'
-                analysis.error_message = 'Failed to analyze file'
-            
-            analysis.save()
+            # Синхронный режим: анализ внутри запроса
+            analysis = run_analysis(analysis.id, service=service)
             
             return Response({
                 'analysis_id': analysis.id,
-                'result': result,
+                'result': analysis.result or None,
                 'status': analysis.status,
                 'file_name': file_item.name
             })
@@ -199,6 +203,20 @@ class FileAnalysisView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class AnalysisDetailView(APIView):
+    """Состояние анализа (опрос для клиентов без WebSocket)"""
+    permission_classes = [AllowAny]  # Temporarily allow access without auth for testing
+    
+    def get(self, request, analysis_id):
+        """Получить статус и результат анализа"""
+        try:
+            analysis = AIAnalysis.objects.select_related('file_item').get(id=analysis_id, user=get_demo_user())
+        except AIAnalysis.DoesNotExist:
+            return Response({'error': 'Analysis not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(analysis_state(analysis))
+
+
 class SmartSearchView(APIView):
     """Умный поиск через ИИ"""
     permission_classes = [AllowAny]  # Temporarily allow access without auth for testing
@@ -292,6 +310,9 @@ class GenerateTextView(APIView):
         
         service = get_ollama_service()
         
+        if str(request.data.get('stream', '')).lower() in ('1', 'true'):
+            return self.stream_response(request, service, prompt, model)
+        
         try:
             result = service.sync_generate(prompt, model)
             
@@ -301,7 +322,8 @@ class GenerateTextView(APIView):
                     'response': result.get('response', ''),
                     'model': result.get('model', ''),
                     'created_at': result.get('created_at', ''),
-                    'total_duration': result.get('total_duration', 0)
+                    'total_duration': result.get('total_duration', 0),
+                    'cached': 'cache' in result
                 })
             else:
                 return Response({
@@ -312,3 +334,35 @@ class GenerateTextView(APIView):
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def stream_response(self, request, service, prompt, model):
+        """
+        Потоковый ответ NDJSON: одна строка JSON на часть генерации.
+        Под ASGI — async итератор (без потока на запрос), под WSGI — синхронный.
+        """
+        def encode(event):
+            return (json.dumps(event, ensure_ascii=False) + '\n').encode('utf-8')
+        
+        def error_event(error):
+            logger.error(f"Streaming generation failed: {error}")
+            return encode({'error': str(error), 'done': True})
+        
+        if isinstance(request._request, ASGIRequest):
+            async def content():
+                try:
+                    async for chunk in service.generate_stream(prompt, model):
+                        yield encode(generation_event(chunk))
+                except Exception as e:
+                    yield error_event(e)
+        else:
+            def content():
+                try:
+                    for chunk in service.sync_generate_stream(prompt, model):
+                        yield encode(generation_event(chunk))
+                except Exception as e:
+                    yield error_event(e)
+        
+        response = StreamingHttpResponse(content(), content_type='application/x-ndjson')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
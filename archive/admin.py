@@ -11,7 +11,7 @@ from django.db.models import Count
 from .models import (
     RetentionPolicy, ArchiveCategory, ArchivedDocument, 
     ArchiveActivity, AIAnalysisResult, ArchivePermission,
-    AutoArchivingRule, ArchivingJob, ComplianceRule,
+    AutoArchivingRule, ArchivingJob, ArchivingJobError, ComplianceRule,
     DocumentEmbedding, ArchiveAnalytics
 )
 
@@ -123,6 +123,13 @@ class AutoArchivingRuleAdmin(admin.ModelAdmin):
     disable_rules.short_description = 'Деактивировать правила'
 
 
+class ArchivingJobErrorInline(admin.TabularInline):
+    model = ArchivingJobError
+    extra = 0
+    can_delete = False
+    readonly_fields = ['file_path', 'message', 'created_at']
+
+
 @admin.register(ArchivingJob)
 class ArchivingJobAdmin(admin.ModelAdmin):
     list_display = ['id', 'job_type', 'status', 'created_by', 'total_files', 'processed_files', 'failed_files', 'created_at']
@@ -130,6 +137,7 @@ class ArchivingJobAdmin(admin.ModelAdmin):
     search_fields = ['id', 'created_by__username']
     readonly_fields = ['id', 'created_at', 'completed_at']
     date_hierarchy = 'created_at'
+    inlines = [ArchivingJobErrorInline]
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('created_by', 'auto_rule')
@@ -0,0 +1,127 @@
+"""
+Кэш векторных представлений, адресуемый содержимым.
+
+Ключ — (SHA-256 содержимого, embedding_model, embedding_version), поэтому
+идентичные файлы и повторная обработка документа не обращаются к модели.
+Первый уровень — LRU в памяти процесса, второй (опционально) — кэш Django
+(FileBasedCache, django-redis и т.п.), указанный в ARCHIVE_EMBEDDING_CACHE_ALIAS.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+
+def embedding_cache_key(digest: str, model: str, version: str) -> str:
+    return f'archive:embedding:{model}:{version}:{digest}'
+
+
+class EmbeddingCache:
+    """Двухуровневый кэш embeddings со счетчиками попаданий"""
+
+    def __init__(self, max_entries: int = 10000, shared_alias: Optional[str] = None, shared_timeout: Optional[int] = None):
+        self.max_entries = max_entries
+        self.shared_alias = shared_alias
+        self.shared_timeout = shared_timeout
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    @property
+    def shared(self):
+        """Кэш второго уровня или None, если он не настроен"""
+        if not self.shared_alias:
+            return None
+        return caches[self.shared_alias]
+
+    def get(self, digest: str, model: str, version: str) -> Optional[Dict[str, Any]]:
+        """Запись кэша ({'vector': bytes, 'keywords': [...]}) или None"""
+        if not digest:
+            return None
+        key = embedding_cache_key(digest, model, version)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+
+        entry = None
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared embedding cache is unavailable: {e}")
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def set(self, digest: str, model: str, version: str, entry: Dict[str, Any]):
+        """Сохраняет запись в оба уровня кэша"""
+        if not digest:
+            return
+        key = embedding_cache_key(digest, model, version)
+
+        with self._lock:
+            self._remember(key, entry)
+
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry, self.shared_timeout)
+            except Exception as e:
+                logger.warning(f"Could not write to shared embedding cache: {e}")
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        with self._lock:
+            hits = self.memory_hits + self.shared_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'memory_hits': self.memory_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'shared_backend': self.shared_alias or None,
+            }
+
+
+# Глобальный экземпляр кэша
+_embedding_cache = None
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Получить глобальный экземпляр кэша embeddings"""
+    global _embedding_cache
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            max_entries=getattr(settings, 'ARCHIVE_EMBEDDING_CACHE_SIZE', 10000),
+            shared_alias=getattr(settings, 'ARCHIVE_EMBEDDING_CACHE_ALIAS', None) or None,
+            shared_timeout=getattr(settings, 'ARCHIVE_EMBEDDING_CACHE_TIMEOUT', None),
+        )
+    return _embedding_cache
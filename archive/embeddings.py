@@ -0,0 +1,228 @@
+"""
+Пакетное построение векторных представлений архивных документов.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from archive.embedding_cache import EmbeddingCache, get_embedding_cache
+from archive.models import ArchivedDocument, DocumentEmbedding
+from archive.search import get_lexical_index, get_vector_index
+from archive.search.codec import pack_vector, unpack_vector
+from archive.search.lexical import document_terms
+from archive.search.text import extract_keywords
+from ai_integration.services.ollama_service import OllamaService
+from ai_integration.services.scheduler import PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = {
+    '.txt', '.md', '.rst', '.csv', '.json', '.xml', '.yaml', '.yml', '.html', '.htm', '.log',
+    '.py', '.js', '.ts', '.css', '.java', '.cpp', '.c', '.php', '.rb', '.go', '.sql',
+}
+
+
+def is_text_file(file_item) -> bool:
+    """Файл с текстовым содержимым (по MIME типу или расширению)"""
+    return bool(file_item.is_text or file_item.extension in TEXT_EXTENSIONS)
+
+
+def read_file_text(document: ArchivedDocument, limit: int) -> str:
+    """Текстовое содержимое файла документа (не более limit символов)"""
+    file_item = document.original_file
+    if not is_text_file(file_item):
+        return ''
+
+    try:
+        file_path = file_item.get_absolute_path()
+        if not os.path.exists(file_path):
+            return ''
+        # В UTF-8 символ занимает до 4 байт
+        with open(file_path, 'rb') as f:
+            return f.read(limit * 4).decode('utf-8', errors='ignore')[:limit]
+    except Exception as e:
+        logger.warning(f"Could not read text of {file_item.name}: {e}")
+        return ''
+
+
+def describe_document(document: ArchivedDocument) -> str:
+    """Текст для документов без текстового содержимого: имя файла и теги"""
+    return '\n'.join(part for part in [document.original_file.name, ' '.join(document.tags or [])] if part)
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class DocumentEmbeddingPipeline:
+    """
+    Построение embeddings пакетами: параллельное извлечение текста,
+    один запрос к модели на пакет и один bulk_create на пакет.
+    Векторы берутся из кэша по checksum документа, если они уже считались.
+    """
+
+    def __init__(
+        self,
+        ai_service: Optional[OllamaService] = None,
+        batch_size: Optional[int] = None,
+        extraction_workers: Optional[int] = None,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        self.ai_service = ai_service or OllamaService(priority=PRIORITY_BATCH)
+        self.batch_size = batch_size or getattr(settings, 'ARCHIVE_EMBEDDING_BATCH_SIZE', 64)
+        self.extraction_workers = extraction_workers or getattr(settings, 'ARCHIVE_TEXT_EXTRACTION_WORKERS', 8)
+        self.text_limit = getattr(settings, 'ARCHIVE_EMBEDDING_TEXT_LIMIT', 8000)
+        self.embedding_version = getattr(settings, 'ARCHIVE_EMBEDDING_VERSION', '1.0')
+        self.cache = cache or get_embedding_cache()
+
+    async def embed_documents(self, documents: List[ArchivedDocument]) -> int:
+        """Создает embeddings для документов, возвращает количество сохраненных"""
+        created = 0
+        for start in range(0, len(documents), self.batch_size):
+            batch = documents[start:start + self.batch_size]
+            try:
+                created += await self.embed_batch(batch)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} documents failed: {e}")
+        return created
+
+    def _cached(self, digest: str) -> Optional[Dict]:
+        return self.cache.get(digest, self.ai_service.embedding_model, self.embedding_version)
+
+    def _remember(self, digest: str, entry: Dict):
+        self.cache.set(digest, self.ai_service.embedding_model, self.embedding_version, entry)
+
+    async def embed_batch(self, documents: List[ArchivedDocument]) -> int:
+        """Обработка одного пакета документов"""
+        content_entries = [self._cached(document.checksum) for document in documents]
+        metadata_texts = [json.dumps(document.metadata, ensure_ascii=False, default=str) for document in documents]
+        metadata_digests = [text_digest(text) for text in metadata_texts]
+        metadata_entries = [self._cached(digest) for digest in metadata_digests]
+
+        # Текст извлекаем только для документов, которых нет в кэше
+        semaphore = asyncio.Semaphore(self.extraction_workers)
+
+        async def extract(document):
+            async with semaphore:
+                return await asyncio.to_thread(read_file_text, document, self.text_limit)
+
+        missing = [position for position, entry in enumerate(content_entries) if entry is None]
+        file_texts = dict(zip(missing, await asyncio.gather(*(extract(documents[position]) for position in missing))))
+
+        # Один запрос к модели на все недостающие векторы пакета (одинаковые тексты — один раз)
+        inputs: Dict[str, int] = {}
+        content_inputs = {}
+        for position in missing:
+            text = file_texts[position] or describe_document(documents[position])
+            content_inputs[position] = inputs.setdefault(text, len(inputs))
+        metadata_inputs = {}
+        for position, entry in enumerate(metadata_entries):
+            if entry is None:
+                metadata_inputs[position] = inputs.setdefault(metadata_texts[position], len(inputs))
+
+        vectors = await self.ai_service.get_text_embeddings(list(inputs)) if inputs else []
+        input_texts = list(inputs)
+
+        for position, input_number in content_inputs.items():
+            vector = vectors[input_number]
+            if vector is None:
+                continue
+            entry = {
+                'vector': pack_vector(vector),
+                'keywords': extract_keywords(input_texts[input_number]),
+                'text': file_texts[position],
+            }
+            content_entries[position] = entry
+            # По checksum кэшируем только векторы содержимого файла
+            if file_texts[position]:
+                self._remember(documents[position].checksum, entry)
+
+        for position, input_number in metadata_inputs.items():
+            vector = vectors[input_number]
+            if vector is None:
+                continue
+            metadata_entries[position] = {'vector': pack_vector(vector)}
+            self._remember(metadata_digests[position], metadata_entries[position])
+
+        embeddings = []
+        for document, content_entry, metadata_entry in zip(documents, content_entries, metadata_entries):
+            if content_entry is None:
+                logger.warning(f"No embedding returned for document {document.id}")
+                continue
+
+            embedding = DocumentEmbedding(
+                document=document,
+                keywords=list(content_entry['keywords']),
+                content_text=content_entry.get('text', ''),
+                embedding_model=self.ai_service.embedding_model,
+                embedding_version=self.embedding_version
+            )
+            embedding.set_content_vector(unpack_vector(content_entry['vector']))
+            embedding.set_metadata_vector(unpack_vector(metadata_entry['vector']) if metadata_entry else None)
+            embeddings.append(embedding)
+
+        if embeddings:
+            await sync_to_async(self.save_embeddings)(embeddings)
+        return len(embeddings)
+
+    def save_embeddings(self, embeddings: List[DocumentEmbedding]):
+        """Сохраняет пакет одним запросом и обновляет поисковые индексы"""
+        DocumentEmbedding.objects.bulk_create(
+            embeddings,
+            update_conflicts=True,
+            unique_fields=['document'],
+            update_fields=[
+                'content_embedding', 'metadata_embedding', 'content_vector', 'metadata_vector',
+                'keywords', 'content_text', 'embedding_model', 'embedding_version', 'updated_at',
+                # Новый вектор — соседи будут пересчитаны инкрементально
+                'related_documents', 'similarity_score'
+            ]
+        )
+
+        # bulk_create не отправляет post_save, поэтому индексы обновляем сами
+        lexical_index = get_lexical_index(sync=False)
+        if lexical_index.is_built:
+            # Имена файлов пакета одним запросом, а не по запросу на документ
+            names = dict(ArchivedDocument.objects.filter(
+                id__in=[embedding.document_id for embedding in embeddings]
+            ).values_list('id', 'original_file__name'))
+            document_terms_list = [
+                (
+                    embedding.document_id,
+                    document_terms(
+                        names.get(embedding.document_id), embedding.document.tags,
+                        embedding.keywords, embedding.content_text
+                    )
+                )
+                for embedding in embeddings
+            ]
+
+            def add_to_lexical_index():
+                for document_id, terms in document_terms_list:
+                    lexical_index.add(document_id, terms)
+
+            transaction.on_commit(add_to_lexical_index)
+
+        index = get_vector_index(sync=False)
+        if not index.is_built:
+            return
+
+        vectors = [
+            (embedding.document_id, embedding.get_content_vector())
+            for embedding in embeddings
+            if embedding.document.status == 'archived'
+        ]
+
+        def add_to_index():
+            for document_id, vector in vectors:
+                index.add(document_id, vector)
+
+        transaction.on_commit(add_to_index)
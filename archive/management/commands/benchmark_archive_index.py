@@ -0,0 +1,59 @@
+"""
+Замер recall@k и задержки IVF индекса относительно точного поиска.
+"""
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from archive.search import IVFIndex, VectorIndex
+from archive.search.benchmark import recall_at_k, sample_queries
+from archive.search.index import collect_vectors
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает IVF индекс с точным поиском (recall@k, задержка)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Размер выдачи')
+        parser.add_argument('--queries', type=int, default=200, help='Количество запросов')
+        parser.add_argument('--nlist', type=int, default=0, help='Количество списков IVF (0 — автоматически)')
+        parser.add_argument('--nprobe', default='1,2,4,8,16,32', help='Значения nprobe через запятую')
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Использовать N синтетических векторов вместо базы'
+        )
+        parser.add_argument('--dimension', type=int, default=768, help='Размерность синтетических векторов')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            rng = np.random.default_rng(0)
+            vectors = rng.normal(size=(options['synthetic'], options['dimension'])).astype(np.float32)
+            items = list(enumerate(vectors, start=1))
+        else:
+            items = list(VectorIndex.iter_database_vectors())
+
+        matrix, _, _ = collect_vectors(items)
+        if matrix.shape[0] == 0:
+            self.stdout.write(self.style.ERROR('Нет векторов для замера'))
+            return
+
+        exact = VectorIndex()
+        exact.build(items)
+        ivf = IVFIndex(nlist=options['nlist'])
+        ivf.build(items)
+
+        queries = sample_queries(matrix, options['queries'])
+        k = options['k']
+
+        baseline = recall_at_k(exact, exact, queries, k)
+        self.stdout.write(
+            f'Документов: {len(exact)}, списков IVF: {ivf.list_count}, '
+            f'точный поиск: {baseline["latency_ms_mean"]:.3f} мс'
+        )
+
+        for nprobe in [int(value) for value in options['nprobe'].split(',') if value]:
+            result = recall_at_k(ivf, exact, queries, k, nprobe=nprobe)
+            self.stdout.write(
+                f'nprobe={nprobe:<4} recall@{k}={result["recall"]:.3f} '
+                f'mean={result["latency_ms_mean"]:.3f} мс p95={result["latency_ms_p95"]:.3f} мс'
+            )
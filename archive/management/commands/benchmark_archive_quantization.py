@@ -0,0 +1,81 @@
+"""
+Сравнение памяти и recall@k сжатых индексов (int8, PQ) с точным поиском.
+"""
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from archive.search import QuantizedIndex, VectorIndex
+from archive.search.benchmark import recall_at_k, sample_queries
+from archive.search.index import collect_vectors
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает int8 и PQ индексы с точным поиском (память, recall@k, задержка)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=10, help='Размер выдачи')
+        parser.add_argument('--queries', type=int, default=200, help='Количество запросов')
+        parser.add_argument('--subspaces', default='48,96', help='Количество подпространств PQ через запятую')
+        parser.add_argument('--rerank', default='1,4,10', help='Множители кандидатов для пересчета через запятую')
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Использовать N синтетических векторов вместо базы'
+        )
+        parser.add_argument('--dimension', type=int, default=768, help='Размерность синтетических векторов')
+
+    def handle(self, *args, **options):
+        if options['synthetic']:
+            rng = np.random.default_rng(0)
+            vectors = rng.normal(size=(options['synthetic'], options['dimension'])).astype(np.float32)
+            items = list(enumerate(vectors, start=1))
+        else:
+            items = list(VectorIndex.iter_database_vectors())
+
+        matrix, ids, _ = collect_vectors(items)
+        if matrix.shape[0] == 0:
+            self.stdout.write(self.style.ERROR('Нет векторов для замера'))
+            return
+
+        exact = VectorIndex()
+        exact.build(items)
+        queries = sample_queries(matrix, options['queries'])
+        k = options['k']
+
+        # Точные векторы для пересчета берутся из памяти, а не из базы
+        stored = dict(zip(ids.tolist(), matrix))
+
+        def load_vectors(document_ids):
+            return {document_id: stored[document_id] for document_id in document_ids if document_id in stored}
+
+        baseline = recall_at_k(exact, exact, queries, k)
+        self.stdout.write(
+            f'Документов: {len(exact)}, точный индекс: {exact.memory_bytes} байт, '
+            f'поиск {baseline["latency_ms_mean"]:.3f} мс'
+        )
+
+        configurations = [('int8', None)] + [
+            ('pq', int(value)) for value in options['subspaces'].split(',') if value
+        ]
+        rerank_factors = [int(value) for value in options['rerank'].split(',') if value]
+
+        for method, subspaces in configurations:
+            index = QuantizedIndex(
+                method=method, subspaces=subspaces or 96, min_train=1, vector_loader=load_vectors
+            )
+            index.build(items)
+            label = method if subspaces is None else f'{method}-{index.quantizer.code_size}'
+            savings = exact.memory_bytes / max(index.memory_bytes, 1)
+            self.stdout.write(f'{label}: {index.memory_bytes} байт (в {savings:.1f} раз меньше)')
+
+            adc = recall_at_k(index, exact, queries, k, rerank=False)
+            self.stdout.write(
+                f'  без пересчета  recall@{k}={adc["recall"]:.3f} mean={adc["latency_ms_mean"]:.3f} мс'
+            )
+            for factor in rerank_factors:
+                index.rerank_factor = factor
+                result = recall_at_k(index, exact, queries, k)
+                self.stdout.write(
+                    f'  пересчет x{factor:<4} recall@{k}={result["recall"]:.3f} '
+                    f'mean={result["latency_ms_mean"]:.3f} мс p95={result["latency_ms_p95"]:.3f} мс'
+                )
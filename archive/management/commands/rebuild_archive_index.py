@@ -0,0 +1,36 @@
+"""
+Перестройка и сохранение векторного индекса архива.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from archive.search import IVFIndex, create_vector_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает векторный индекс архива и сохраняет его на диск'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', default='ivf', help='Тип индекса (exact, ivf)')
+        parser.add_argument('--nlist', type=int, help='Количество списков IVF (0 — автоматически)')
+        parser.add_argument('--output', help='Каталог для файлов индекса')
+
+    def handle(self, *args, **options):
+        index = create_vector_index(options['backend'])
+        if options['nlist'] is not None and isinstance(index, IVFIndex):
+            index.nlist = options['nlist']
+
+        started = time.perf_counter()
+        index.build(index.iter_database_vectors())
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'Индекс построен: {len(index)} документов за {elapsed:.2f} с')
+
+        if not isinstance(index, IVFIndex):
+            self.stdout.write(self.style.WARNING('Точный индекс не сохраняется на диск'))
+            return
+
+        path = index.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(f'Индекс ({index.list_count} списков) сохранен в {path}'))
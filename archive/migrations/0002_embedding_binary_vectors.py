@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentembedding",
+            name="content_vector",
+            field=models.BinaryField(
+                blank=True,
+                help_text="Упакованный вектор содержимого документа",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="documentembedding",
+            name="metadata_vector",
+            field=models.BinaryField(
+                blank=True, help_text="Упакованный вектор метаданных", null=True
+            ),
+        ),
+        migrations.AlterField(
+            model_name="documentembedding",
+            name="content_embedding",
+            field=models.JSONField(
+                blank=True,
+                help_text="Векторное представление содержимого документа",
+                null=True,
+            ),
+        ),
+    ]
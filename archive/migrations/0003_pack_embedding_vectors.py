@@ -0,0 +1,105 @@
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# Формат векторов на момент миграции (archive.search.codec, версия 1):
+# заголовок magic, версия, код типа, размерность и значения little-endian.
+# Скопирован сюда, чтобы миграция не зависела от дальнейших изменений кодека.
+VECTOR_HEADER = struct.Struct("<2sBBI")
+VECTOR_MAGIC = b"EV"
+VECTOR_FORMAT_VERSION = 1
+VECTOR_DTYPES = {
+    "float32": (1, np.dtype("<f4")),
+    "float16": (2, np.dtype("<f2")),
+}
+
+
+def pack_vector(vector, dtype):
+    """Упаковывает вектор в bytes с заголовком"""
+    code, numpy_dtype = VECTOR_DTYPES[dtype]
+    array = np.asarray(vector, dtype=numpy_dtype).ravel()
+    return VECTOR_HEADER.pack(VECTOR_MAGIC, VECTOR_FORMAT_VERSION, code, array.shape[0]) + array.tobytes()
+
+
+def unpack_vector(data):
+    """Распаковывает вектор из bytes"""
+    _, _, code, dimension = VECTOR_HEADER.unpack_from(data)
+    numpy_dtype = next(numpy_dtype for known, numpy_dtype in VECTOR_DTYPES.values() if known == code)
+    return np.frombuffer(data, dtype=numpy_dtype, count=dimension, offset=VECTOR_HEADER.size)
+
+
+def pack_json_vectors(apps, schema_editor):
+    """Переносит векторы из JSON полей в бинарные"""
+    DocumentEmbedding = apps.get_model("archive", "DocumentEmbedding")
+    dtype = getattr(settings, "ARCHIVE_EMBEDDING_DTYPE", "float32")
+
+    queryset = DocumentEmbedding.objects.filter(content_vector__isnull=True).only(
+        "id", "content_embedding", "metadata_embedding"
+    )
+    batch = []
+    for embedding in queryset.iterator(chunk_size=BATCH_SIZE):
+        if embedding.content_embedding is not None:
+            embedding.content_vector = pack_vector(embedding.content_embedding, dtype)
+            embedding.content_embedding = None
+        if embedding.metadata_embedding is not None:
+            embedding.metadata_vector = pack_vector(embedding.metadata_embedding, dtype)
+            embedding.metadata_embedding = None
+        batch.append(embedding)
+
+        if len(batch) >= BATCH_SIZE:
+            DocumentEmbedding.objects.bulk_update(
+                batch,
+                ["content_vector", "content_embedding", "metadata_vector", "metadata_embedding"],
+            )
+            batch = []
+
+    if batch:
+        DocumentEmbedding.objects.bulk_update(
+            batch,
+            ["content_vector", "content_embedding", "metadata_vector", "metadata_embedding"],
+        )
+
+
+def unpack_binary_vectors(apps, schema_editor):
+    """Обратное преобразование: бинарные векторы в JSON списки"""
+    DocumentEmbedding = apps.get_model("archive", "DocumentEmbedding")
+
+    queryset = DocumentEmbedding.objects.filter(content_vector__isnull=False).only(
+        "id", "content_vector", "metadata_vector"
+    )
+    batch = []
+    for embedding in queryset.iterator(chunk_size=BATCH_SIZE):
+        embedding.content_embedding = unpack_vector(embedding.content_vector).astype(float).tolist()
+        embedding.content_vector = None
+        if embedding.metadata_vector is not None:
+            embedding.metadata_embedding = unpack_vector(embedding.metadata_vector).astype(float).tolist()
+            embedding.metadata_vector = None
+        batch.append(embedding)
+
+        if len(batch) >= BATCH_SIZE:
+            DocumentEmbedding.objects.bulk_update(
+                batch,
+                ["content_vector", "content_embedding", "metadata_vector", "metadata_embedding"],
+            )
+            batch = []
+
+    if batch:
+        DocumentEmbedding.objects.bulk_update(
+            batch,
+            ["content_vector", "content_embedding", "metadata_vector", "metadata_embedding"],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0002_embedding_binary_vectors"),
+    ]
+
+    operations = [
+        migrations.RunPython(pack_json_vectors, unpack_binary_vectors),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0003_pack_embedding_vectors"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="documentembedding",
+            name="content_text",
+            field=models.TextField(blank=True, default=""),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.14 on 2026-10-18 07:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("archive", "0004_document_embedding_content_text"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivingJobError",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("file_path", models.TextField(blank=True)),
+                ("message", models.TextField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="errors",
+                        to="archive.archivingjob",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ошибка задания архивирования",
+                "verbose_name_plural": "Ошибки заданий архивирования",
+                "ordering": ["id"],
+            },
+        ),
+    ]
@@ -1,6 +1,10 @@
 import os
 import hashlib
 import json
+from typing import Optional
+
+import numpy as np
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -8,6 +12,8 @@ from django.core.validators import RegexValidator
 from django.core.exceptions import ValidationError
 import uuid
 
+from archive.search.codec import pack_vector, unpack_vector
+
 
 class RetentionPolicy(models.Model):
     """Политики хранения документов"""
@@ -212,13 +218,15 @@ class ArchivedDocument(models.Model):
         return f"Archive: {self.original_file.name} ({self.category.name})"
     
     def save(self, *args, **kwargs):
-        # Автоматический расчет даты окончания хранения
+        self.assign_retention_date()
+        super().save(*args, **kwargs)
+    
+    def assign_retention_date(self):
+        """Автоматический расчет даты окончания хранения (save не вызывается при bulk_create)"""
         if not self.retention_date and self.category.retention_policy:
             self.retention_date = self.category.retention_policy.calculate_retention_date(
                 self.archived_at or timezone.now()
             )
-        
-        super().save(*args, **kwargs)
     
     @property
     def is_expired(self):
@@ -363,17 +371,28 @@ class DocumentEmbedding(models.Model):
         related_name='embedding'
     )
     
-    # Векторное представление контента
+    # Векторное представление контента (устаревший JSON формат)
     content_embedding = models.JSONField(
-        help_text="Векторное представление содержимого документа"
+        help_text="Векторное представление содержимого документа",
+        null=True, blank=True
     )
     
-    # Векторное представление метаданных
+    # Векторное представление метаданных (устаревший JSON формат)
     metadata_embedding = models.JSONField(
         help_text="Векторное представление метаданных",
         null=True, blank=True
     )
     
+    # Бинарное представление векторов: заголовок + упакованные float32/float16
+    content_vector = models.BinaryField(
+        null=True, blank=True,
+        help_text="Упакованный вектор содержимого документа"
+    )
+    metadata_vector = models.BinaryField(
+        null=True, blank=True,
+        help_text="Упакованный вектор метаданных"
+    )
+    
     # Информация о модели ИИ
     embedding_model = models.CharField(
         max_length=100, 
@@ -385,6 +404,9 @@ class DocumentEmbedding(models.Model):
     keywords = models.JSONField(default=list, blank=True)
     topics = models.JSONField(default=list, blank=True)
     
+    # Извлеченный текст (для полнотекстового поиска)
+    content_text = models.TextField(blank=True, default='')
+    
     # Семантические связи с другими документами
     similarity_score = models.FloatField(null=True, blank=True)
     related_documents = models.JSONField(default=list, blank=True)
@@ -402,6 +424,51 @@ class DocumentEmbedding(models.Model):
     
     def __str__(self):
         return f"Embedding: {self.document.original_file.name}"
+    
+    def save(self, *args, **kwargs):
+        # Векторы, переданные списком, переводим в бинарный формат
+        if kwargs.get('update_fields') is None:
+            self.pack_json_vectors()
+        
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def storage_dtype() -> str:
+        """Тип хранения векторов (float32 или float16)"""
+        return getattr(settings, 'ARCHIVE_EMBEDDING_DTYPE', 'float32')
+    
+    def pack_json_vectors(self):
+        """Переносит векторы из JSON полей в бинарные"""
+        if self.content_embedding is not None:
+            self.set_content_vector(self.content_embedding)
+        if self.metadata_embedding is not None:
+            self.set_metadata_vector(self.metadata_embedding)
+    
+    def get_content_vector(self) -> Optional[np.ndarray]:
+        """Вектор содержимого как NumPy массив (без копирования для бинарного формата)"""
+        if self.content_vector is not None:
+            return unpack_vector(self.content_vector)
+        if self.content_embedding:
+            return np.asarray(self.content_embedding, dtype=np.float32)
+        return None
+    
+    def set_content_vector(self, vector):
+        """Сохраняет вектор содержимого в бинарном формате"""
+        self.content_vector = pack_vector(vector, self.storage_dtype()) if vector is not None else None
+        self.content_embedding = None
+    
+    def get_metadata_vector(self) -> Optional[np.ndarray]:
+        """Вектор метаданных как NumPy массив (без копирования для бинарного формата)"""
+        if self.metadata_vector is not None:
+            return unpack_vector(self.metadata_vector)
+        if self.metadata_embedding:
+            return np.asarray(self.metadata_embedding, dtype=np.float32)
+        return None
+    
+    def set_metadata_vector(self, vector):
+        """Сохраняет вектор метаданных в бинарном формате"""
+        self.metadata_vector = pack_vector(vector, self.storage_dtype()) if vector is not None else None
+        self.metadata_embedding = None
 
 
 class AIAnalysisResult(models.Model):
@@ -621,11 +688,32 @@ class ArchivingJob(models.Model):
         return (self.processed_files / self.total_files) * 100
     
     def update_progress(self, processed=0, successful=0, failed=0):
-        """Обновление прогресса выполнения"""
+        """Обновление прогресса выполнения (атомарные приращения: задание обновляют несколько обработчиков)"""
+        ArchivingJob.objects.filter(pk=self.pk).update(
+            processed_files=models.F('processed_files') + processed,
+            successful_files=models.F('successful_files') + successful,
+            failed_files=models.F('failed_files') + failed
+        )
         self.processed_files += processed
         self.successful_files += successful
         self.failed_files += failed
-        self.save(update_fields=['processed_files', 'successful_files', 'failed_files'])
+
+
+class ArchivingJobError(models.Model):
+    """Ошибки заданий архивирования (только добавление)"""
+    
+    job = models.ForeignKey(ArchivingJob, on_delete=models.CASCADE, related_name='errors')
+    file_path = models.TextField(blank=True)
+    message = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Ошибка задания архивирования"
+        verbose_name_plural = "Ошибки заданий архивирования"
+    
+    def __str__(self):
+        return f"Job {self.job_id}: {self.message}"
 
 
 class ArchiveAnalytics(models.Model):
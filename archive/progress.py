@@ -0,0 +1,150 @@
+"""
+Ход выполнения заданий архивирования.
+
+Счетчики обработанных файлов копятся в памяти и записываются атомарными
+приращениями F() раз в ARCHIVE_JOB_PROGRESS_INTERVAL секунд или
+ARCHIVE_JOB_PROGRESS_EVERY файлов; ошибки добавляются в ArchivingJobError
+пакетами. Каждая запись публикуется в группу channel layer
+archiving_job_group(id), клиент без WebSocket опрашивает /api/v1/archive/jobs/<id>/.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from archive.models import ArchivingJob, ArchivingJobError
+
+logger = logging.getLogger(__name__)
+
+
+def archiving_job_group(job_id) -> str:
+    """Группа channel layer с событиями одного задания"""
+    return f'archiving_job_{job_id}'
+
+
+def archiving_job_state(job: ArchivingJob) -> Dict[str, Any]:
+    """Текущее состояние задания для API и WebSocket"""
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'total_files': job.total_files,
+        'processed_files': job.processed_files,
+        'successful_files': job.successful_files,
+        'failed_files': job.failed_files,
+        'progress_percentage': job.progress_percentage,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'completed_at': job.completed_at.isoformat() if job.completed_at else None,
+    }
+
+
+def publish_archiving_job_state(job: ArchivingJob, errors: Optional[List[str]] = None):
+    """Отправка состояния подписчикам; недоступный channel layer не прерывает задание"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            archiving_job_group(job.id),
+            {'type': 'archiving.progress', 'job': archiving_job_state(job), 'errors': errors or []}
+        )
+    except Exception as e:
+        logger.warning(f"Could not publish progress of archiving job {job.id}: {e}")
+
+
+class JobProgressReporter:
+    """Накопление хода задания с периодической записью в БД и публикацией"""
+
+    def __init__(self, job: ArchivingJob, interval: Optional[float] = None, every: Optional[int] = None):
+        self.job = job
+        if interval is None:
+            interval = getattr(settings, 'ARCHIVE_JOB_PROGRESS_INTERVAL', 2.0)
+        self.interval = interval
+        self.every = every or getattr(settings, 'ARCHIVE_JOB_PROGRESS_EVERY', 100)
+        self._lock = threading.Lock()
+        self._processed = 0
+        self._successful = 0
+        self._failed = 0
+        self._errors: List[Tuple[str, str]] = []
+        self._flushed_at = time.monotonic()
+
+    def add(self, processed: int = 0, successful: int = 0, failed: int = 0):
+        with self._lock:
+            self._processed += processed
+            self._successful += successful
+            self._failed += failed
+
+    def error(self, message: str, file_path: str = ''):
+        """Ошибка по файлу или заданию; счетчики не меняет"""
+        with self._lock:
+            self._errors.append((file_path, message))
+
+    def due(self) -> bool:
+        """Пора записывать: набралось every файлов или прошло interval секунд"""
+        with self._lock:
+            pending = self._processed or self._errors
+            return bool(pending) and (
+                self._processed >= self.every or time.monotonic() - self._flushed_at >= self.interval
+            )
+
+    def _drain(self) -> Tuple[int, int, int, List[Tuple[str, str]]]:
+        with self._lock:
+            drained = self._processed, self._successful, self._failed, self._errors
+            self._processed = self._successful = self._failed = 0
+            self._errors = []
+            self._flushed_at = time.monotonic()
+            return drained
+
+    def _restore(self, processed: int, successful: int, failed: int, errors: List[Tuple[str, str]]):
+        with self._lock:
+            self._processed += processed
+            self._successful += successful
+            self._failed += failed
+            self._errors = errors + self._errors
+
+    def flush(self) -> bool:
+        """Записывает накопленное одним UPDATE и одним bulk_create; False, если записывать нечего"""
+        processed, successful, failed, errors = self._drain()
+        if not processed and not errors:
+            return False
+        try:
+            with transaction.atomic():
+                if processed:
+                    self.job.update_progress(processed=processed, successful=successful, failed=failed)
+                ArchivingJobError.objects.bulk_create([
+                    ArchivingJobError(job_id=self.job.id, file_path=file_path, message=message)
+                    for file_path, message in errors
+                ])
+        except Exception as e:
+            # Не записанное попадет в следующую запись
+            logger.warning(f"Could not save progress of archiving job {self.job.id}: {e}")
+            self._restore(processed, successful, failed, errors)
+            return False
+        publish_archiving_job_state(self.job, [message for _, message in errors])
+        return True
+
+    def start(self):
+        self.job.status = 'running'
+        self.job.started_at = timezone.now()
+        self.job.save(update_fields=['status', 'started_at'])
+        publish_archiving_job_state(self.job)
+
+    def finish(self, status: str, results: Optional[Dict[str, Any]] = None):
+        """Остаток хода задания и итог; счетчики не перезаписываются"""
+        self.flush()
+        self.job.status = status
+        self.job.completed_at = timezone.now()
+        if results is not None:
+            self.job.results = results
+        ArchivingJob.objects.filter(pk=self.job.pk).update(
+            status=self.job.status,
+            completed_at=self.job.completed_at,
+            results=self.job.results
+        )
+        publish_archiving_job_state(self.job)
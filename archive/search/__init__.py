@@ -0,0 +1,22 @@
+# Поисковые индексы архива
+from .backends import VECTOR_BACKENDS, create_vector_index, get_vector_index
+from .index import BaseVectorIndex, VectorIndex, normalize_vector
+from .ivf import IVFIndex
+from .lexical import LexicalIndex, get_lexical_index, reciprocal_rank_fusion
+from .quantization import ProductQuantizer, QuantizedIndex, ScalarQuantizer
+
+__all__ = [
+    'VECTOR_BACKENDS',
+    'BaseVectorIndex',
+    'IVFIndex',
+    'LexicalIndex',
+    'ProductQuantizer',
+    'QuantizedIndex',
+    'ScalarQuantizer',
+    'VectorIndex',
+    'create_vector_index',
+    'get_lexical_index',
+    'get_vector_index',
+    'normalize_vector',
+    'reciprocal_rank_fusion',
+]
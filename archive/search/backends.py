@@ -0,0 +1,69 @@
+"""
+Выбор реализации векторного индекса для ArchiveSearchService.
+"""
+
+import threading
+
+from django.conf import settings
+
+from .index import BaseVectorIndex, VectorIndex
+from .ivf import IVFIndex
+from .quantization import QuantizedIndex
+
+
+def _create_exact_index() -> BaseVectorIndex:
+    return VectorIndex(dimension=getattr(settings, 'ARCHIVE_VECTOR_DIMENSION', None))
+
+
+def _create_ivf_index() -> BaseVectorIndex:
+    return IVFIndex(
+        dimension=getattr(settings, 'ARCHIVE_VECTOR_DIMENSION', None),
+        nlist=getattr(settings, 'ARCHIVE_IVF_NLIST', 0),
+        nprobe=getattr(settings, 'ARCHIVE_IVF_NPROBE', 8),
+    )
+
+
+def _create_quantized_index(method: str) -> BaseVectorIndex:
+    return QuantizedIndex(
+        dimension=getattr(settings, 'ARCHIVE_VECTOR_DIMENSION', None),
+        method=method,
+        subspaces=getattr(settings, 'ARCHIVE_PQ_SUBSPACES', 96),
+        rerank_factor=getattr(settings, 'ARCHIVE_QUANTIZATION_RERANK', 4),
+        min_train=getattr(settings, 'ARCHIVE_QUANTIZATION_MIN_TRAIN', 1024),
+    )
+
+
+# Зарегистрированные реализации индекса (ключ — значение ARCHIVE_VECTOR_BACKEND)
+VECTOR_BACKENDS = {
+    'exact': _create_exact_index,
+    'ivf': _create_ivf_index,
+    'int8': lambda: _create_quantized_index('int8'),
+    'pq': lambda: _create_quantized_index('pq'),
+}
+
+
+def create_vector_index(backend: str = None) -> BaseVectorIndex:
+    """Создает пустой индекс указанного (или настроенного) типа"""
+    backend = backend or getattr(settings, 'ARCHIVE_VECTOR_BACKEND', 'exact')
+    try:
+        factory = VECTOR_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown vector index backend: {backend}")
+    return factory()
+
+
+# Глобальный экземпляр индекса (один на процесс)
+_vector_index = None
+_vector_index_lock = threading.Lock()
+
+
+def get_vector_index(sync: bool = True) -> BaseVectorIndex:
+    """Получить глобальный экземпляр векторного индекса"""
+    global _vector_index
+    if _vector_index is None:
+        with _vector_index_lock:
+            if _vector_index is None:
+                _vector_index = create_vector_index()
+    if sync:
+        _vector_index.ensure_synced()
+    return _vector_index
@@ -0,0 +1,48 @@
+"""
+Оценка качества и скорости приближенных индексов относительно точного поиска.
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .index import BaseVectorIndex, VectorIndex
+
+
+def sample_queries(matrix: np.ndarray, count: int, noise: float = 0.05, seed: Optional[int] = 0) -> np.ndarray:
+    """Запросы — случайные векторы коллекции с небольшим шумом"""
+    rng = np.random.default_rng(seed)
+    picked = np.asarray(matrix[rng.choice(matrix.shape[0], min(count, matrix.shape[0]), replace=False)])
+    return (picked + rng.normal(scale=noise, size=picked.shape)).astype(np.float32)
+
+
+def recall_at_k(
+    index: BaseVectorIndex,
+    reference: VectorIndex,
+    queries: Iterable[np.ndarray],
+    k: int = 10,
+    **search_options
+) -> Dict[str, float]:
+    """
+    Доля точных top-k результатов, найденных индексом, и задержка поиска.
+    search_options передаются в index.search (например, nprobe).
+    """
+    recalls: List[float] = []
+    latencies: List[float] = []
+
+    for query in queries:
+        expected = {document_id for document_id, _ in reference.search(query, k)}
+        started = time.perf_counter()
+        found = index.search(query, k, **search_options)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+        if expected:
+            recalls.append(len(expected & {document_id for document_id, _ in found}) / len(expected))
+
+    latencies_array = np.asarray(latencies) if latencies else np.zeros(1)
+    return {
+        'recall': float(np.mean(recalls)) if recalls else 0.0,
+        'latency_ms_mean': float(latencies_array.mean()),
+        'latency_ms_p95': float(np.percentile(latencies_array, 95)),
+    }
@@ -0,0 +1,77 @@
+"""
+K-means кластеризация для векторных индексов (IVF, квантование).
+"""
+
+from typing import Optional
+
+import numpy as np
+
+ASSIGN_BLOCK_SIZE = 8192
+
+
+def assign_clusters(vectors: np.ndarray, centroids: np.ndarray, metric: str = 'cosine') -> np.ndarray:
+    """Номер ближайшего центроида для каждого вектора (блоками, чтобы ограничить память)"""
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    if metric == 'l2':
+        centroid_norms = (centroids * centroids).sum(axis=1)
+
+    for start in range(0, vectors.shape[0], ASSIGN_BLOCK_SIZE):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_SIZE], dtype=np.float32)
+        products = block @ centroids.T
+        if metric == 'l2':
+            # argmin ||x - c||^2 = argmin (||c||^2 - 2 x·c)
+            assignments[start:start + block.shape[0]] = np.argmin(centroid_norms - 2 * products, axis=1)
+        else:
+            assignments[start:start + block.shape[0]] = np.argmax(products, axis=1)
+    return assignments
+
+
+def train_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    iterations: int = 15,
+    sample_size: int = 65536,
+    metric: str = 'cosine',
+    seed: Optional[int] = 0
+) -> np.ndarray:
+    """
+    Обучение центроидов k-means (Lloyd) на случайной выборке.
+    Для metric='cosine' центроиды нормализуются (сферический k-means).
+    """
+    rng = np.random.default_rng(seed)
+    total = vectors.shape[0]
+    if total == 0:
+        raise ValueError("Cannot train k-means on an empty set")
+
+    if total > sample_size:
+        sample = np.asarray(vectors[np.sort(rng.choice(total, sample_size, replace=False))], dtype=np.float32)
+    else:
+        sample = np.asarray(vectors, dtype=np.float32)
+
+    n_clusters = max(1, min(n_clusters, sample.shape[0]))
+    centroids = sample[rng.choice(sample.shape[0], n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = assign_clusters(sample, centroids, metric)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Суммы по кластерам через сортировку и reduceat (без np.add.at)
+        order = np.argsort(assignments, kind='stable')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        non_empty = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[non_empty] = np.add.reduceat(sample[order], starts[non_empty], axis=0)
+
+        if metric == 'l2':
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        else:
+            norms = np.linalg.norm(sums[non_empty], axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids[non_empty] = sums[non_empty] / norms
+
+        # Пустые кластеры переинициализируем случайными точками
+        empty = np.flatnonzero(~non_empty)
+        if empty.size:
+            centroids[empty] = sample[rng.choice(sample.shape[0], empty.size, replace=False)]
+
+    return centroids.astype(np.float32)
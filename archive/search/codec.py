@@ -0,0 +1,68 @@
+"""
+Компактное бинарное представление векторов для хранения в БД.
+
+Формат: 8-байтовый заголовок (magic, версия, код типа, размерность)
+и следом упакованные значения float32 или float16 (little-endian).
+"""
+
+import struct
+from typing import Iterable, Optional, Union
+
+import numpy as np
+
+VECTOR_MAGIC = b'EV'
+VECTOR_FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<2sBBI')
+
+DTYPE_CODES = {
+    'float32': 1,
+    'float16': 2,
+}
+_CODE_DTYPES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+
+HEADER_SIZE = _HEADER.size
+
+
+def pack_vector(vector: Iterable[float], dtype: str = 'float32') -> bytes:
+    """Упаковывает вектор в bytes с заголовком"""
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+
+    code = DTYPE_CODES[dtype]
+    array = np.asarray(vector, dtype=_CODE_DTYPES[code]).ravel()
+    header = _HEADER.pack(VECTOR_MAGIC, VECTOR_FORMAT_VERSION, code, array.shape[0])
+    return header + array.tobytes()
+
+
+def unpack_vector(data: Optional[Union[bytes, memoryview]]) -> Optional[np.ndarray]:
+    """
+    Распаковывает вектор без копирования данных.
+    Возвращает read-only массив поверх исходного буфера.
+    """
+    if data is None:
+        return None
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Vector payload is too short")
+
+    magic, version, code, dimension = _HEADER.unpack_from(data)
+    if magic != VECTOR_MAGIC or version != VECTOR_FORMAT_VERSION:
+        raise ValueError("Unknown vector format")
+    if code not in _CODE_DTYPES:
+        raise ValueError(f"Unknown vector dtype code: {code}")
+
+    dtype = _CODE_DTYPES[code]
+    if len(data) != HEADER_SIZE + dimension * dtype.itemsize:
+        raise ValueError("Vector payload size does not match header")
+
+    return np.frombuffer(data, dtype=dtype, count=dimension, offset=HEADER_SIZE)
+
+
+def vector_dimension(data: Optional[Union[bytes, memoryview]]) -> Optional[int]:
+    """Размерность упакованного вектора (читается только заголовок)"""
+    if data is None or len(data) < HEADER_SIZE:
+        return None
+    return _HEADER.unpack_from(data)[3]
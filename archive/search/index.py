@@ -0,0 +1,398 @@
+"""
+Процессный векторный индекс для семантического поиска по архиву.
+Хранит L2-нормализованные embeddings в непрерывной float32 матрице
+и параллельный массив id документов.
+"""
+
+import logging
+import threading
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .codec import unpack_vector
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_vector(vector) -> Optional[np.ndarray]:
+    """L2-нормализация вектора (float32). Возвращает None для пустых и нулевых векторов"""
+    array = np.asarray(vector, dtype=np.float32).ravel()
+    if array.size == 0:
+        return None
+
+    norm = float(np.linalg.norm(array))
+    if norm == 0.0 or not np.isfinite(norm):
+        return None
+    return array / norm
+
+
+def _stored_vector(packed, legacy):
+    """Вектор из бинарного поля, с откатом на устаревший JSON формат"""
+    if packed is not None:
+        return unpack_vector(packed)
+    return legacy
+
+
+def collect_vectors(
+    items: Iterable[Tuple[int, Iterable[float]]],
+    dimension: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, Optional[int]]:
+    """Нормализует пары (document_id, vector) в матрицу и массив id"""
+    ids = []
+    rows = []
+
+    for document_id, vector in items:
+        normalized = normalize_vector(vector) if vector is not None else None
+        if normalized is None:
+            continue
+        if dimension is None:
+            dimension = int(normalized.shape[0])
+        if normalized.shape[0] != dimension:
+            continue
+        ids.append(document_id)
+        rows.append(normalized)
+
+    if not rows:
+        return np.empty((0, dimension or 0), dtype=np.float32), np.empty(0, dtype=np.int64), dimension
+    return np.vstack(rows), np.asarray(ids, dtype=np.int64), dimension
+
+
+def allowed_mask(ids: np.ndarray, allowed_ids: np.ndarray) -> np.ndarray:
+    """Битовая маска строк, id которых входят в отсортированный массив allowed_ids"""
+    if allowed_ids.shape[0] == 0:
+        return np.zeros(ids.shape[0], dtype=bool)
+    positions = np.searchsorted(allowed_ids, ids)
+    positions[positions == allowed_ids.shape[0]] = 0
+    return allowed_ids[positions] == ids
+
+
+def top_k(scores: np.ndarray, ids: np.ndarray, k: int, threshold: Optional[float] = None) -> List[Tuple[int, float]]:
+    """Выбор k лучших результатов через argpartition"""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return []
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+    top = top[np.argsort(-scores[top], kind='stable')]
+
+    results = []
+    for position in top:
+        score = float(scores[position])
+        if threshold is not None and score < threshold:
+            break
+        results.append((int(ids[position]), score))
+    return results
+
+
+class BaseVectorIndex:
+    """Базовый класс векторных индексов: синхронизация с БД и общий интерфейс"""
+
+    def __init__(self, dimension: Optional[int] = None):
+        self._lock = threading.RLock()
+        self.dimension = dimension
+        self.is_built = False
+        self.last_synced = None
+
+    def build(self, items: Iterable[Tuple[int, Iterable[float]]]):
+        raise NotImplementedError
+
+    def add(self, document_id: int, vector: Iterable[float]) -> bool:
+        raise NotImplementedError
+
+    def remove(self, document_id: int) -> bool:
+        raise NotImplementedError
+
+    def document_ids(self) -> np.ndarray:
+        """id документов в индексе"""
+        raise NotImplementedError
+
+    def search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        raise NotImplementedError
+
+    def iter_search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None,
+        shard_size: int = 50000
+    ) -> Iterator[Tuple[int, int, List[Tuple[int, float]]]]:
+        """
+        Поиск с промежуточными результатами: (номер шарда, число шардов, текущий top-k).
+        По умолчанию — один шард с итоговым результатом.
+        """
+        yield 1, 1, self.search(query, k, threshold, allowed_ids)
+
+    @staticmethod
+    def iter_database_vectors():
+        """Векторы всех архивных документов из DocumentEmbedding"""
+        from archive.models import DocumentEmbedding
+
+        rows = DocumentEmbedding.objects.filter(
+            document__status='archived'
+        ).values_list(
+            'document_id', 'content_vector', 'content_embedding'
+        ).iterator(chunk_size=2000)
+
+        for document_id, packed, legacy in rows:
+            yield document_id, _stored_vector(packed, legacy)
+
+    def load_from_database(self):
+        """Полная загрузка индекса из DocumentEmbedding"""
+        started_at = timezone.now()
+        self.build(self.iter_database_vectors())
+        self.last_synced = started_at
+
+    def refresh_from_database(self):
+        """Инкрементальная синхронизация с изменениями, сделанными другими процессами"""
+        from archive.models import DocumentEmbedding
+
+        started_at = timezone.now()
+        changed = DocumentEmbedding.objects.filter(
+            updated_at__gte=self.last_synced
+        ).values_list('document_id', 'content_vector', 'content_embedding', 'document__status')
+
+        for document_id, packed, legacy, status in changed.iterator(chunk_size=2000):
+            if status == 'archived':
+                self.add(document_id, _stored_vector(packed, legacy))
+            else:
+                self.remove(document_id)
+
+        # Удаленные в других процессах документы в выборку изменений не попадают — сверяем id
+        current = np.fromiter(
+            DocumentEmbedding.objects.filter(document__status='archived').values_list(
+                'document_id', flat=True
+            ).iterator(chunk_size=10000),
+            dtype=np.int64
+        )
+        for document_id in np.setdiff1d(self.document_ids(), current):
+            self.remove(int(document_id))
+        self.last_synced = started_at
+
+    def ensure_synced(self):
+        """Строит индекс при первом обращении и периодически подтягивает изменения"""
+        with self._lock:
+            if not self.is_built:
+                self.load_from_database()
+                return
+
+            refresh_interval = getattr(settings, 'ARCHIVE_VECTOR_INDEX_REFRESH_SECONDS', 60)
+            if self.last_synced and timezone.now() - self.last_synced >= timedelta(seconds=refresh_interval):
+                self.refresh_from_database()
+
+
+class VectorIndex(BaseVectorIndex):
+    """Точный (brute-force) векторный индекс документов архива"""
+
+    def __init__(self, dimension: Optional[int] = None, initial_capacity: int = 1024):
+        super().__init__(dimension)
+        self._initial_capacity = initial_capacity
+        self._reset_storage()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._positions
+
+    def document_ids(self) -> np.ndarray:
+        with self._lock:
+            return self._ids[:self._size].copy()
+
+    # Представление строк матрицы; переопределяется сжатыми индексами
+    def _row_shape(self) -> Tuple[int, np.dtype]:
+        return self.dimension or 0, np.float32
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        return vectors
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        return rows @ query
+
+    @property
+    def memory_bytes(self) -> int:
+        """Объем памяти под векторы и id документов"""
+        return self._matrix[:self._size].nbytes + self._ids[:self._size].nbytes
+
+    def _reset_storage(self, capacity: int = 0):
+        width, dtype = self._row_shape()
+        self._size = 0
+        self._capacity = capacity
+        self._matrix = np.empty((capacity, width), dtype=dtype)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._positions: Dict[int, int] = {}
+
+    def _ensure_capacity(self, required: int):
+        """Амортизированное расширение буферов (удвоение емкости)"""
+        if required <= self._capacity:
+            return
+
+        capacity = max(self._initial_capacity, self._capacity * 2, required)
+        width, dtype = self._row_shape()
+        matrix = np.empty((capacity, width), dtype=dtype)
+        ids = np.empty(capacity, dtype=np.int64)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+
+        self._matrix = matrix
+        self._ids = ids
+        self._capacity = capacity
+
+    def _accepts(self, vector: np.ndarray) -> bool:
+        if self.dimension is None:
+            self.dimension = int(vector.shape[0])
+            self._reset_storage()
+        if vector.shape[0] != self.dimension:
+            logger.warning(
+                f"Vector dimension {vector.shape[0]} does not match index dimension {self.dimension}"
+            )
+            return False
+        return True
+
+    def build(self, items: Iterable[Tuple[int, Iterable[float]]]):
+        """Полная перестройка индекса из пар (document_id, vector)"""
+        matrix, ids, dimension = collect_vectors(items, self.dimension)
+        with self._lock:
+            self.dimension = dimension
+            self._fill(matrix, ids)
+
+        logger.info(f"Vector index built: {self._size} documents, dimension {self.dimension}")
+
+    def _fill(self, matrix: np.ndarray, ids: np.ndarray):
+        """Заполнение хранилища нормализованными векторами (под блокировкой)"""
+        with self._lock:
+            self._reset_storage()
+            if ids.shape[0]:
+                self._ensure_capacity(ids.shape[0])
+                self._matrix[:ids.shape[0]] = self._encode(matrix)
+                self._ids[:ids.shape[0]] = ids
+                self._size = ids.shape[0]
+                self._positions = {int(document_id): position for position, document_id in enumerate(ids)}
+            self.is_built = True
+
+    def add(self, document_id: int, vector: Iterable[float]) -> bool:
+        """Добавляет или обновляет вектор документа"""
+        normalized = normalize_vector(vector) if vector is not None else None
+        if normalized is None:
+            self.remove(document_id)
+            return False
+
+        with self._lock:
+            if not self._accepts(normalized):
+                return False
+
+            position = self._positions.get(document_id)
+            if position is None:
+                self._ensure_capacity(self._size + 1)
+                position = self._size
+                self._size += 1
+                self._positions[document_id] = position
+                self._ids[position] = document_id
+
+            self._matrix[position] = self._encode(normalized)
+            return True
+
+    def remove(self, document_id: int) -> bool:
+        """Удаляет документ из индекса (последняя строка переносится на освободившееся место)"""
+        with self._lock:
+            position = self._positions.pop(document_id, None)
+            if position is None:
+                return False
+
+            last = self._size - 1
+            if position != last:
+                moved_id = int(self._ids[last])
+                self._matrix[position] = self._matrix[last]
+                self._ids[position] = moved_id
+                self._positions[moved_id] = position
+            self._size = last
+            return True
+
+    def search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Поиск k ближайших документов по косинусному сходству.
+        allowed_ids — отсортированный массив id, среди которых выбираются результаты.
+        """
+        normalized = normalize_vector(query) if query is not None else None
+        if normalized is None or k <= 0:
+            return []
+
+        with self._lock:
+            if self._size == 0:
+                return []
+            if normalized.shape[0] != self.dimension:
+                logger.warning(
+                    f"Query dimension {normalized.shape[0]} does not match index dimension {self.dimension}"
+                )
+                return []
+
+            # Один матрично-векторный проход по всем документам
+            scores = self._score_rows(self._matrix[:self._size], normalized)
+            ids = self._ids[:self._size].copy()
+
+        if allowed_ids is not None:
+            visible = allowed_mask(ids, allowed_ids)
+            scores, ids = scores[visible], ids[visible]
+
+        return top_k(scores, ids, k, threshold)
+
+    def iter_search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None,
+        shard_size: int = 50000
+    ) -> Iterator[Tuple[int, int, List[Tuple[int, float]]]]:
+        """
+        Поиск по шардам из shard_size строк; после каждого шарда возвращается
+        накопленный top-k. Блокировка берется только на время одного шарда,
+        поэтому параллельные изменения индекса учитываются без гарантий.
+        """
+        normalized = normalize_vector(query) if query is not None else None
+        if normalized is None or k <= 0:
+            return
+
+        with self._lock:
+            if self.dimension is not None and normalized.shape[0] != self.dimension:
+                logger.warning(
+                    f"Query dimension {normalized.shape[0]} does not match index dimension {self.dimension}"
+                )
+                return
+            shards = max(1, -(-self._size // shard_size))
+
+        best: Dict[int, float] = {}
+        for shard in range(shards):
+            with self._lock:
+                start = shard * shard_size
+                end = min(start + shard_size, self._size)
+                scores = self._score_rows(self._matrix[start:end], normalized) if end > start else np.empty(0, dtype=np.float32)
+                ids = self._ids[start:end].copy()
+
+            if allowed_ids is not None:
+                visible = allowed_mask(ids, allowed_ids)
+                scores, ids = scores[visible], ids[visible]
+
+            for document_id, score in top_k(scores, ids, k, threshold):
+                best[document_id] = score
+            results = sorted(best.items(), key=lambda item: -item[1])[:k]
+            best = dict(results)
+            yield shard + 1, shards, results
@@ -0,0 +1,287 @@
+"""
+Приближенный поиск ближайших соседей (IVF-flat).
+
+Векторы разбиваются на списки по ближайшему центроиду k-means, при поиске
+сканируются только nprobe ближайших к запросу списков. Индекс сохраняется
+в .npy файлы и открывается воркерами через mmap.
+"""
+
+import json
+import logging
+import os
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .clustering import assign_clusters, train_kmeans
+from .index import BaseVectorIndex, VectorIndex, allowed_mask, collect_vectors, normalize_vector, top_k
+
+logger = logging.getLogger(__name__)
+
+META_FILENAME = 'meta.json'
+ARRAY_NAMES = ('centroids', 'vectors', 'ids', 'offsets')
+
+
+def default_index_dir() -> str:
+    """Каталог для файлов индекса (по умолчанию внутри MEDIA_ROOT)"""
+    return getattr(
+        settings, 'ARCHIVE_VECTOR_INDEX_DIR',
+        os.path.join(settings.MEDIA_ROOT, 'archive_index')
+    )
+
+
+class IVFIndex(BaseVectorIndex):
+    """IVF-flat индекс с инкрементальным буфером для новых документов"""
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        nlist: int = 0,
+        nprobe: int = 8,
+        storage_dir: Optional[str] = None
+    ):
+        super().__init__(dimension)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.storage_dir = storage_dir
+        self.built_at = None
+        self._reset_lists()
+
+    def _reset_lists(self):
+        self._centroids = np.empty((0, self.dimension or 0), dtype=np.float32)
+        self._vectors = np.empty((0, self.dimension or 0), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._sorted_ids = self._ids
+        self._offsets = np.zeros(1, dtype=np.int64)
+        # Документы, добавленные после построения, и удаленные из списков
+        self._delta = VectorIndex(self.dimension)
+        self._tombstones = set()
+
+    def __len__(self) -> int:
+        return self._ids.shape[0] - len(self._tombstones) + len(self._delta)
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._delta or (
+            self._in_lists(document_id) and document_id not in self._tombstones
+        )
+
+    def document_ids(self) -> np.ndarray:
+        with self._lock:
+            listed = self._sorted_ids
+            if self._tombstones:
+                listed = listed[~np.isin(listed, np.fromiter(self._tombstones, dtype=np.int64))]
+            return np.concatenate((listed, self._delta.document_ids()))
+
+    def _in_lists(self, document_id: int) -> bool:
+        position = np.searchsorted(self._sorted_ids, document_id)
+        return position < self._sorted_ids.shape[0] and self._sorted_ids[position] == document_id
+
+    @property
+    def list_count(self) -> int:
+        return self._centroids.shape[0]
+
+    def build(self, items: Iterable[Tuple[int, Iterable[float]]]):
+        """Обучение центроидов и раскладка векторов по спискам"""
+        matrix, ids, dimension = collect_vectors(items, self.dimension)
+        total = ids.shape[0]
+
+        with self._lock:
+            self.dimension = dimension
+            self._reset_lists()
+
+            if total:
+                nlist = self.nlist or int(4 * np.sqrt(total))
+                centroids = train_kmeans(matrix, max(1, min(nlist, total)))
+                assignments = assign_clusters(matrix, centroids)
+
+                order = np.argsort(assignments, kind='stable')
+                counts = np.bincount(assignments, minlength=centroids.shape[0])
+
+                self._centroids = centroids
+                self._vectors = np.ascontiguousarray(matrix[order])
+                self._ids = ids[order]
+                self._sorted_ids = np.sort(self._ids)
+                self._offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+            self.built_at = timezone.now()
+            self.is_built = True
+
+        logger.info(f"IVF index built: {total} documents in {self.list_count} lists")
+
+    def add(self, document_id: int, vector: Iterable[float]) -> bool:
+        """Новые и обновленные документы попадают в точный буфер до следующей перестройки"""
+        with self._lock:
+            if self._in_lists(document_id):
+                self._tombstones.add(document_id)
+            if self._delta.dimension is None:
+                self._delta.dimension = self.dimension
+            added = self._delta.add(document_id, vector)
+            if self.dimension is None:
+                self.dimension = self._delta.dimension
+            return added
+
+    def remove(self, document_id: int) -> bool:
+        with self._lock:
+            removed = self._delta.remove(document_id)
+            if self._in_lists(document_id) and document_id not in self._tombstones:
+                self._tombstones.add(document_id)
+                removed = True
+            return removed
+
+    def search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None,
+        nprobe: Optional[int] = None
+    ) -> List[Tuple[int, float]]:
+        """Поиск по nprobe ближайшим спискам плюс точный проход по буферу"""
+        normalized = normalize_vector(query) if query is not None else None
+        if normalized is None or k <= 0:
+            return []
+
+        with self._lock:
+            if self.dimension is None:
+                return []
+            if normalized.shape[0] != self.dimension:
+                logger.warning(
+                    f"Query dimension {normalized.shape[0]} does not match index dimension {self.dimension}"
+                )
+                return []
+
+            score_parts = []
+            id_parts = []
+
+            if self.list_count:
+                nprobe = max(1, min(nprobe or self.nprobe, self.list_count))
+                centroid_scores = self._centroids @ normalized
+                if nprobe < self.list_count:
+                    probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+                else:
+                    probe = np.arange(self.list_count)
+
+                for list_number in probe:
+                    start, end = self._offsets[list_number], self._offsets[list_number + 1]
+                    if start == end:
+                        continue
+                    score_parts.append(self._vectors[start:end] @ normalized)
+                    id_parts.append(self._ids[start:end])
+
+            tombstones = np.fromiter(self._tombstones, dtype=np.int64) if self._tombstones else None
+            delta_results = self._delta.search(normalized, k, threshold, allowed_ids)
+
+        if score_parts:
+            scores = np.concatenate(score_parts)
+            ids = np.concatenate(id_parts)
+            visible = np.ones(ids.shape[0], dtype=bool)
+            if tombstones is not None:
+                visible &= ~np.isin(ids, tombstones)
+            if allowed_ids is not None:
+                visible &= allowed_mask(ids, allowed_ids)
+            scores, ids = scores[visible], ids[visible]
+        else:
+            scores = np.empty(0, dtype=np.float32)
+            ids = np.empty(0, dtype=np.int64)
+
+        if delta_results:
+            scores = np.concatenate((scores, np.asarray([score for _, score in delta_results], dtype=np.float32)))
+            ids = np.concatenate((ids, np.asarray([document_id for document_id, _ in delta_results], dtype=np.int64)))
+
+        return top_k(scores, ids, k, threshold)
+
+    def save(self, storage_dir: Optional[str] = None) -> str:
+        """
+        Сохраняет индекс на диск. Файлы пишутся под новым токеном сборки,
+        затем атомарно подменяется meta.json, старые файлы удаляются.
+        """
+        storage_dir = storage_dir or self.storage_dir or default_index_dir()
+        os.makedirs(storage_dir, exist_ok=True)
+        token = uuid.uuid4().hex[:12]
+
+        with self._lock:
+            arrays = {
+                'centroids': self._centroids,
+                'vectors': self._vectors,
+                'ids': self._ids,
+                'offsets': self._offsets,
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(storage_dir, f'ivf-{token}-{name}.npy'), array)
+
+            meta = {
+                'token': token,
+                'dimension': self.dimension,
+                'nlist': self.list_count,
+                'count': int(self._ids.shape[0]),
+                'built_at': (self.built_at or timezone.now()).isoformat(),
+            }
+
+        meta_path = os.path.join(storage_dir, META_FILENAME)
+        temp_path = f'{meta_path}.{token}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+        for filename in os.listdir(storage_dir):
+            if filename.startswith('ivf-') and not filename.startswith(f'ivf-{token}-'):
+                try:
+                    os.remove(os.path.join(storage_dir, filename))
+                except OSError:
+                    pass
+
+        logger.info(f"IVF index saved to {storage_dir} ({meta['count']} documents)")
+        return storage_dir
+
+    def load(self, storage_dir: Optional[str] = None, mmap: bool = True) -> bool:
+        """Открывает сохраненный индекс (по умолчанию через mmap, без чтения в память)"""
+        storage_dir = storage_dir or self.storage_dir or default_index_dir()
+        meta_path = os.path.join(storage_dir, META_FILENAME)
+        if not os.path.exists(meta_path):
+            return False
+
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+
+            arrays = {
+                name: np.load(
+                    os.path.join(storage_dir, f"ivf-{meta['token']}-{name}.npy"),
+                    mmap_mode='r' if mmap else None
+                )
+                for name in ARRAY_NAMES
+            }
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load IVF index from {storage_dir}: {e}")
+            return False
+
+        with self._lock:
+            self.dimension = meta['dimension']
+            self._reset_lists()
+            self._centroids = np.asarray(arrays['centroids'])
+            self._vectors = arrays['vectors']
+            self._ids = arrays['ids']
+            self._sorted_ids = np.sort(self._ids)
+            self._offsets = np.asarray(arrays['offsets'])
+            self.built_at = parse_datetime(meta['built_at'])
+            self.is_built = True
+
+        logger.info(f"IVF index loaded from {storage_dir} ({meta['count']} documents)")
+        return True
+
+    def load_from_database(self):
+        """Открывает сохраненный индекс и догоняет изменения; без файла строит индекс в памяти"""
+        if self.load():
+            self.last_synced = self.built_at
+            self.refresh_from_database()
+            return
+
+        logger.warning(
+            "Persisted IVF index not found, building in memory. "
+            "Run 'manage.py rebuild_archive_index' to persist it."
+        )
+        super().load_from_database()
@@ -0,0 +1,223 @@
+"""
+Инвертированный индекс и ранжирование BM25 для полнотекстового поиска по архиву.
+Индексируются имя файла, теги, ключевые слова и извлеченный текст документа.
+"""
+
+import logging
+import math
+import threading
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .index import allowed_mask, top_k
+from .text import tokenize
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = ('id', 'original_file__name', 'tags', 'embedding__keywords', 'embedding__content_text')
+
+
+def document_terms(name: str, tags, keywords, text: str) -> Counter:
+    """Частоты термов документа по всем индексируемым полям"""
+    parts = [name or '', ' '.join(tags or []), ' '.join(keywords or []), text or '']
+    return Counter(tokenize(' '.join(parts), keep_numbers=True))
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """Объединение ранжированных списков id: score = sum(1 / (k + rank))"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, document_id in enumerate(ranking, start=1):
+            scores[document_id] = scores.get(document_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+class LexicalIndex:
+    """Инкрементальный инвертированный индекс с ранжированием BM25"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self.is_built = False
+        self.last_synced = None
+        self._reset()
+
+    def _reset(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # Только ключи термов документа: частоты хранятся в _postings, они нужны для удаления
+        self._documents: Dict[int, Tuple[str, ...]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, document_id: int) -> bool:
+        return document_id in self._documents
+
+    def document_ids(self) -> np.ndarray:
+        """id документов в индексе"""
+        with self._lock:
+            return np.fromiter(self._documents, dtype=np.int64, count=len(self._documents))
+
+    def build(self, items: Iterable[Tuple[int, Counter]]):
+        """Полная перестройка индекса из пар (document_id, частоты термов)"""
+        with self._lock:
+            self._reset()
+            for document_id, terms in items:
+                self._add(document_id, terms)
+            self.is_built = True
+        logger.info(f"Lexical index built: {len(self._documents)} documents, {len(self._postings)} terms")
+
+    def add(self, document_id: int, terms: Counter):
+        """Добавляет или обновляет документ"""
+        with self._lock:
+            self._remove(document_id)
+            self._add(document_id, terms)
+
+    def remove(self, document_id: int) -> bool:
+        with self._lock:
+            return self._remove(document_id)
+
+    def _add(self, document_id: int, terms: Counter):
+        if not terms:
+            return
+        self._documents[document_id] = tuple(terms)
+        length = sum(terms.values())
+        self._lengths[document_id] = length
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[document_id] = frequency
+
+    def _remove(self, document_id: int) -> bool:
+        terms = self._documents.pop(document_id, None)
+        if terms is None:
+            return False
+        self._total_length -= self._lengths.pop(document_id)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[document_id]
+            if not postings:
+                del self._postings[term]
+        return True
+
+    def search(
+        self,
+        query: str,
+        k: int = 20,
+        allowed_ids: Optional[np.ndarray] = None
+    ) -> List[Tuple[int, float]]:
+        """Top-k документов по BM25. allowed_ids — отсортированный массив доступных id"""
+        terms = set(tokenize(query, keep_numbers=True))
+        if not terms or k <= 0:
+            return []
+
+        scores: Dict[int, float] = {}
+        with self._lock:
+            total = len(self._documents)
+            if total == 0:
+                return []
+            average_length = self._total_length / total
+            lengths = self._lengths
+
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for document_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * lengths[document_id] / average_length)
+                    scores[document_id] = scores.get(document_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        if not scores:
+            return []
+        ids = np.fromiter(scores.keys(), dtype=np.int64, count=len(scores))
+        values = np.fromiter(scores.values(), dtype=np.float64, count=len(scores))
+        if allowed_ids is not None:
+            visible = allowed_mask(ids, allowed_ids)
+            ids, values = ids[visible], values[visible]
+        return top_k(values, ids, k)
+
+    @staticmethod
+    def iter_database_documents(filters: Optional[Q] = None):
+        """Частоты термов документов архива из БД"""
+        from archive.models import ArchivedDocument
+
+        rows = ArchivedDocument.objects.filter(filters or Q()).values_list(*DOCUMENT_FIELDS)
+        for document_id, name, tags, keywords, text in rows.iterator(chunk_size=2000):
+            yield document_id, document_terms(name, tags, keywords, text)
+
+    def load_from_database(self):
+        started_at = timezone.now()
+        self.build(self.iter_database_documents())
+        self.last_synced = started_at
+
+    def refresh_document(self, document_id: int):
+        """Переиндексация одного документа (после сохранения или удаления)"""
+        with self._lock:
+            if not self.is_built:
+                return
+            self.remove(document_id)
+            for _, terms in self.iter_database_documents(Q(id=document_id)):
+                self.add(document_id, terms)
+
+    def refresh_documents(self, document_ids: List[int]):
+        """Переиндексация документов одним запросом (после пакетного архивирования)"""
+        with self._lock:
+            if not self.is_built:
+                return
+            for document_id in document_ids:
+                self.remove(document_id)
+            for document_id, terms in self.iter_database_documents(Q(id__in=document_ids)):
+                self.add(document_id, terms)
+
+    def refresh_from_database(self):
+        """Подтягивает изменения, сделанные другими процессами"""
+        started_at = timezone.now()
+        changed = Q(updated_at__gte=self.last_synced) | Q(embedding__updated_at__gte=self.last_synced)
+        for document_id, terms in self.iter_database_documents(changed):
+            self.add(document_id, terms)
+
+        # Удаленные в других процессах документы в выборку изменений не попадают — сверяем id
+        from archive.models import ArchivedDocument
+
+        current = np.fromiter(
+            ArchivedDocument.objects.values_list('id', flat=True).iterator(chunk_size=10000), dtype=np.int64
+        )
+        for document_id in np.setdiff1d(self.document_ids(), current):
+            self.remove(int(document_id))
+        self.last_synced = started_at
+
+    def ensure_synced(self):
+        with self._lock:
+            if not self.is_built:
+                self.load_from_database()
+                return
+
+            refresh_interval = getattr(settings, 'ARCHIVE_VECTOR_INDEX_REFRESH_SECONDS', 60)
+            if self.last_synced and timezone.now() - self.last_synced >= timedelta(seconds=refresh_interval):
+                self.refresh_from_database()
+
+
+# Глобальный экземпляр индекса (один на процесс)
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index(sync: bool = True) -> LexicalIndex:
+    """Получить глобальный экземпляр полнотекстового индекса"""
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    if sync:
+        _lexical_index.ensure_synced()
+    return _lexical_index
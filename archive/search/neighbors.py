@@ -0,0 +1,66 @@
+"""
+Поиск k ближайших соседей для множества векторов блоками матрицы,
+чтобы объем памяти не зависел от размера архива.
+"""
+
+from typing import Iterator, List, Tuple
+
+import numpy as np
+
+
+def blocked_nearest_neighbors(
+    queries: np.ndarray,
+    query_ids: np.ndarray,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    k: int,
+    block_size: int = 512,
+    column_block_size: int = 16384
+) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+    """
+    Для каждой строки queries — k ближайших по скалярному произведению строк vectors
+    (исключая саму себя по id). Векторы должны быть нормализованы.
+    Одновременно в памяти находится не более block_size x column_block_size оценок.
+    Возвращает (query_id, neighbor_ids, scores), соседи отсортированы по убыванию сходства.
+    """
+    total = vectors.shape[0]
+    if k <= 0 or total == 0:
+        return
+
+    for start in range(0, queries.shape[0], block_size):
+        block = queries[start:start + block_size]
+        block_ids = query_ids[start:start + block_size]
+        best_scores = np.full((block.shape[0], k), -np.inf, dtype=np.float32)
+        best_ids = np.full((block.shape[0], k), -1, dtype=np.int64)
+
+        for column_start in range(0, total, column_block_size):
+            column_ids = ids[column_start:column_start + column_block_size]
+            scores = block @ vectors[column_start:column_start + column_block_size].T
+            scores[block_ids[:, None] == column_ids[None, :]] = -np.inf
+
+            # Лучшие k в блоке столбцов, затем слияние с накопленными
+            chunk_k = min(k, column_ids.shape[0])
+            chunk_top = np.argpartition(-scores, chunk_k - 1, axis=1)[:, :chunk_k]
+            merged_scores = np.concatenate((best_scores, np.take_along_axis(scores, chunk_top, axis=1)), axis=1)
+            merged_ids = np.concatenate((best_ids, column_ids[chunk_top]), axis=1)
+
+            top = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(merged_scores, top, axis=1)
+            best_ids = np.take_along_axis(merged_ids, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+
+        for row, query_id in enumerate(block_ids):
+            found = np.isfinite(best_scores[row])
+            yield int(query_id), best_ids[row][found], best_scores[row][found]
+
+
+def merge_neighbors(current: List[dict], candidates: List[dict], k: int) -> List[dict]:
+    """Объединяет два списка соседей [{'id', 'score'}] и оставляет k лучших"""
+    merged = {item['id']: item for item in current}
+    for item in candidates:
+        if item['id'] not in merged or merged[item['id']]['score'] < item['score']:
+            merged[item['id']] = item
+    return sorted(merged.values(), key=lambda item: (-item['score'], item['id']))[:k]
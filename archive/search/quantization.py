@@ -0,0 +1,292 @@
+"""
+Сжатые векторные индексы: скалярное (int8) и продуктовое (PQ) квантование.
+Поиск идет по кодам с асимметричным расстоянием (запрос не квантуется),
+лучшие кандидаты пересчитываются по точным векторам.
+"""
+
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .clustering import assign_clusters, train_kmeans
+from .index import BaseVectorIndex, VectorIndex, _stored_vector, collect_vectors, normalize_vector
+
+logger = logging.getLogger(__name__)
+
+SCORE_BLOCK_SIZE = 8192
+
+# Загрузчик точных векторов для переранжирования: ids -> {document_id: vector}
+VectorLoader = Callable[[List[int]], Dict[int, Iterable[float]]]
+
+
+class ScalarQuantizer:
+    """Поканальное квантование в uint8 по диапазону [min, max] каждой координаты"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.low = None
+        self.scale = None
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension
+
+    def train(self, vectors: np.ndarray):
+        low = vectors.min(axis=0).astype(np.float32)
+        high = vectors.max(axis=0).astype(np.float32)
+        scale = (high - low) / 255.0
+        scale[scale == 0] = 1.0
+        self.low, self.scale = low, scale.astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.low
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """q·x ≈ codes @ (q * scale) + q·low, без восстановления векторов целиком"""
+        weights = (query * self.scale).astype(np.float32)
+        offset = np.float32(query @ self.low)
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            scores[start:start + block.shape[0]] = block.astype(np.float32) @ weights + offset
+        return scores
+
+
+class ProductQuantizer:
+    """
+    Продуктовое квантование: вектор делится на subspaces частей,
+    каждая кодируется номером центроида (до 256) своего словаря.
+    """
+
+    def __init__(self, dimension: int, subspaces: int = 96, iterations: int = 10):
+        self.dimension = dimension
+        self.subspaces = self._fit_subspaces(dimension, subspaces)
+        self.subdimension = dimension // self.subspaces
+        self.iterations = iterations
+        self.codebooks = None
+
+    @staticmethod
+    def _fit_subspaces(dimension: int, subspaces: int) -> int:
+        """Наибольший делитель размерности, не превышающий subspaces"""
+        subspaces = max(1, min(subspaces, dimension))
+        while dimension % subspaces:
+            subspaces -= 1
+        return subspaces
+
+    @property
+    def code_size(self) -> int:
+        return self.subspaces
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float32).reshape(-1, self.subspaces, self.subdimension)
+
+    def train(self, vectors: np.ndarray):
+        parts = self._split(vectors)
+        centroids = min(256, parts.shape[0])
+        codebooks = np.zeros((self.subspaces, centroids, self.subdimension), dtype=np.float32)
+        for subspace in range(self.subspaces):
+            trained = train_kmeans(
+                np.ascontiguousarray(parts[:, subspace]), centroids,
+                iterations=self.iterations, metric='l2'
+            )
+            codebooks[subspace, :trained.shape[0]] = trained
+        self.codebooks = codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        parts = self._split(vectors)
+        codes = np.empty((parts.shape[0], self.subspaces), dtype=np.uint8)
+        for subspace in range(self.subspaces):
+            codes[:, subspace] = assign_clusters(
+                np.ascontiguousarray(parts[:, subspace]), self.codebooks[subspace], metric='l2'
+            )
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.subspaces), codes]
+        return parts.reshape(codes.shape[0], self.dimension)
+
+    def score(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """ADC: таблица q_j·c для каждого подпространства, оценка — сумма m выборок из таблицы"""
+        table = np.einsum('mkd,md->mk', self.codebooks, self._split(query)[0])
+        subspace_rows = np.arange(self.subspaces)
+        scores = np.empty(codes.shape[0], dtype=np.float32)
+        for start in range(0, codes.shape[0], SCORE_BLOCK_SIZE):
+            block = codes[start:start + SCORE_BLOCK_SIZE]
+            scores[start:start + block.shape[0]] = table[subspace_rows, block].sum(axis=1)
+        return scores
+
+
+QUANTIZERS = {
+    'int8': lambda dimension, subspaces: ScalarQuantizer(dimension),
+    'pq': lambda dimension, subspaces: ProductQuantizer(dimension, subspaces),
+}
+
+
+def load_database_vectors(document_ids: List[int]) -> Dict[int, Iterable[float]]:
+    """Точные векторы кандидатов из DocumentEmbedding"""
+    from archive.models import DocumentEmbedding
+
+    rows = DocumentEmbedding.objects.filter(document_id__in=document_ids).values_list(
+        'document_id', 'content_vector', 'content_embedding'
+    )
+    return {document_id: _stored_vector(packed, legacy) for document_id, packed, legacy in rows}
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    Индекс со сжатыми кодами вместо float32 матрицы.
+    Пока векторов меньше min_train, хранит их без сжатия (обучать квантователь не на чем).
+    Поиск: ADC по кодам -> k * rerank_factor кандидатов -> точный пересчет по vector_loader.
+    """
+
+    def __init__(
+        self,
+        dimension: Optional[int] = None,
+        method: str = 'int8',
+        subspaces: int = 96,
+        rerank_factor: int = 4,
+        min_train: int = 1024,
+        vector_loader: Optional[VectorLoader] = None,
+        initial_capacity: int = 1024
+    ):
+        if method not in QUANTIZERS:
+            raise ValueError(f"Unknown quantization method: {method}")
+        self.method = method
+        self.subspaces = subspaces
+        self.rerank_factor = max(1, rerank_factor)
+        self.min_train = max(1, min_train)
+        self.vector_loader = vector_loader or load_database_vectors
+        self.quantizer = None
+        super().__init__(dimension, initial_capacity)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.quantizer is not None
+
+    def _row_shape(self) -> Tuple[int, np.dtype]:
+        if self.quantizer is None:
+            return super()._row_shape()
+        return self.quantizer.code_size, np.uint8
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantizer is None:
+            return vectors
+        return self.quantizer.encode(vectors)
+
+    def _score_rows(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        if self.quantizer is None:
+            return super()._score_rows(rows, query)
+        return self.quantizer.score(rows, query)
+
+    @property
+    def memory_bytes(self) -> int:
+        size = super().memory_bytes
+        if isinstance(self.quantizer, ProductQuantizer):
+            size += self.quantizer.codebooks.nbytes
+        elif isinstance(self.quantizer, ScalarQuantizer):
+            size += self.quantizer.low.nbytes + self.quantizer.scale.nbytes
+        return size
+
+    def _train(self, matrix: np.ndarray) -> bool:
+        """Обучает квантователь, если векторов достаточно"""
+        if matrix.shape[0] < self.min_train:
+            self.quantizer = None
+            return False
+        quantizer = QUANTIZERS[self.method](self.dimension, self.subspaces)
+        quantizer.train(matrix)
+        self.quantizer = quantizer
+        return True
+
+    def build(self, items: Iterable[Tuple[int, Iterable[float]]]):
+        """Полная перестройка: обучение квантователя и кодирование всех векторов"""
+        matrix, ids, dimension = collect_vectors(items, self.dimension)
+        with self._lock:
+            self.dimension = dimension
+            self.quantizer = None
+            self._train(matrix)
+            self._fill(matrix, ids)
+
+        logger.info(
+            f"Quantized index ({self.method}) built: {self._size} documents, "
+            f"{'trained' if self.is_trained else 'uncompressed'}, {self.memory_bytes} bytes"
+        )
+
+    def add(self, document_id: int, vector: Iterable[float]) -> bool:
+        with self._lock:
+            added = super().add(document_id, vector)
+            # Накопилось достаточно векторов — обучаем и сжимаем хранилище
+            if added and self.quantizer is None and self._size >= self.min_train:
+                matrix = self._matrix[:self._size].copy()
+                ids = self._ids[:self._size].copy()
+                self._train(matrix)
+                self._fill(matrix, ids)
+                logger.info(f"Quantized index ({self.method}) trained on {self._size} documents")
+            return added
+
+    def search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None,
+        rerank: bool = True
+    ) -> List[Tuple[int, float]]:
+        """
+        Поиск по кодам с точным пересчетом кандидатов.
+        Порог применяется после пересчета: приближенные оценки могут быть занижены.
+        """
+        if self.quantizer is None or not rerank:
+            return super().search(query, k, threshold, allowed_ids)
+
+        candidates = super().search(query, k * self.rerank_factor, None, allowed_ids)
+        if not candidates:
+            return []
+        return self._rerank(query, candidates, k, threshold)
+
+    def _rerank(
+        self,
+        query: Iterable[float],
+        candidates: List[Tuple[int, float]],
+        k: int,
+        threshold: Optional[float]
+    ) -> List[Tuple[int, float]]:
+        """Точные косинусные оценки кандидатов; без точного вектора остается приближенная"""
+        normalized = normalize_vector(query)
+        try:
+            vectors = self.vector_loader([document_id for document_id, _ in candidates])
+        except Exception as e:
+            logger.warning(f"Could not load vectors for re-ranking: {e}")
+            vectors = {}
+
+        rescored = []
+        for document_id, approximate in candidates:
+            vector = vectors.get(document_id)
+            exact = normalize_vector(vector) if vector is not None else None
+            if exact is not None and exact.shape[0] == normalized.shape[0]:
+                rescored.append((document_id, float(exact @ normalized)))
+            else:
+                rescored.append((document_id, approximate))
+
+        rescored.sort(key=lambda item: -item[1])
+        if threshold is not None:
+            rescored = [item for item in rescored if item[1] >= threshold]
+        return rescored[:k]
+
+    def iter_search(
+        self,
+        query: Iterable[float],
+        k: int = 20,
+        threshold: Optional[float] = None,
+        allowed_ids: Optional[np.ndarray] = None,
+        shard_size: int = 50000
+    ) -> Iterator[Tuple[int, int, List[Tuple[int, float]]]]:
+        if self.quantizer is None:
+            yield from super().iter_search(query, k, threshold, allowed_ids, shard_size)
+            return
+        # Сжатый проход быстрый, промежуточные результаты без пересчета не нужны
+        yield from BaseVectorIndex.iter_search(self, query, k, threshold, allowed_ids, shard_size)
@@ -0,0 +1,34 @@
+"""
+Токенизация и извлечение ключевых слов без обращения к LLM.
+"""
+
+import re
+from collections import Counter
+from typing import List
+
+TOKEN_RE = re.compile(r'[^\W\d_]{3,}', re.UNICODE)
+SEARCH_TOKEN_RE = re.compile(r'[^\W_]{2,}', re.UNICODE)
+
+STOP_WORDS = frozenset({
+    # русский
+    'это', 'как', 'так', 'что', 'для', 'или', 'его', 'она', 'они', 'оно', 'при', 'без',
+    'над', 'под', 'все', 'был', 'была', 'были', 'было', 'быть', 'есть', 'уже', 'еще',
+    'тот', 'эти', 'этот', 'эта', 'того', 'чем', 'где', 'когда', 'если', 'только',
+    'также', 'может', 'которые', 'который', 'которая', 'после', 'через', 'между',
+    # английский
+    'the', 'and', 'for', 'are', 'but', 'not', 'you', 'all', 'any', 'can', 'was', 'one',
+    'our', 'out', 'has', 'have', 'had', 'this', 'that', 'with', 'from', 'they', 'will',
+    'would', 'there', 'their', 'what', 'which', 'when', 'were', 'been', 'into', 'than',
+    'then', 'them', 'these', 'those', 'its', 'also', 'more', 'other', 'some', 'such',
+})
+
+
+def tokenize(text: str, keep_numbers: bool = False) -> List[str]:
+    """Слова в нижнем регистре без стоп-слов (и без чисел, если не указано keep_numbers)"""
+    pattern = SEARCH_TOKEN_RE if keep_numbers else TOKEN_RE
+    return [token for token in pattern.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def extract_keywords(text: str, limit: int = 10) -> List[str]:
+    """Самые частые слова текста"""
+    return [token for token, _ in Counter(tokenize(text)).most_common(limit)]
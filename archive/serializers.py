@@ -295,6 +295,10 @@ class SemanticSearchSerializer(serializers.Serializer):
     limit = serializers.IntegerField(default=10, min_value=1, max_value=100)
     category_id = serializers.IntegerField(required=False)
     similarity_threshold = serializers.FloatField(default=0.7, min_value=0.0, max_value=1.0)
+    mode = serializers.ChoiceField(
+        choices=[('semantic', 'Семантический'), ('hybrid', 'Гибридный (BM25 + векторы)')],
+        default='semantic'
+    )
 
 
 class AnalyticsReportSerializer(serializers.Serializer):
@@ -1,38 +1,69 @@
 import os
 import json
-import hashlib
 import logging
 import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List, Tuple
+from typing import Dict, Any, Optional, List, Tuple, AsyncIterator
 from pathlib import Path
 
+import numpy as np
 from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.db.models import Q, Count, Sum, F
 from celery import shared_task
+from asgiref.sync import sync_to_async
 
 from archive.models import (
     ArchivedDocument, ArchiveCategory, ArchiveActivity,
     AutoArchivingRule, ArchivingJob, DocumentEmbedding,
-    AIAnalysisResult, ArchiveAnalytics
+    AIAnalysisResult, ArchiveAnalytics, ArchivePermission
 )
+from archive.embedding_cache import get_embedding_cache
+from archive.embeddings import DocumentEmbeddingPipeline, is_text_file
+from archive.progress import JobProgressReporter
+from archive.search import get_lexical_index, get_vector_index, reciprocal_rank_fusion
+from archive.search.index import BaseVectorIndex, collect_vectors
+from archive.search.neighbors import blocked_nearest_neighbors, merge_neighbors
 from filemanager.models import FileItem
+from filemanager.services.checksum import get_checksum_service
+from ai_integration.services.chunked_analysis import ChunkedAnalyzer, iter_file_chunks
 from ai_integration.services.ollama_service import OllamaService
+from ai_integration.services.scheduler import PRIORITY_BATCH, get_request_scheduler
 
 logger = logging.getLogger(__name__)
 
 
+class CategorySnapshot:
+    """Активные категории, загруженные одним запросом (для категоризации пакета документов)"""
+    
+    def __init__(self):
+        active = list(ArchiveCategory.objects.filter(is_active=True).select_related('retention_policy'))
+        self.auto_categories = [category for category in active if category.auto_categorize]
+        # Категория по умолчанию: 'general' в названии, иначе первая активная
+        self.default = next((category for category in active if 'general' in category.name.lower()), None)
+        if self.default is None and active:
+            self.default = active[0]
+
+
 class DocumentCategorizer:
     """Сервис автоматической категоризации документов"""
     
     def __init__(self):
-        self.ai_service = OllamaService()
+        self.ai_service = OllamaService(priority=PRIORITY_BATCH)
+        self.content_analyzer = ChunkedAnalyzer(self.ai_service)
         
-    def analyze_document_content(self, file_item: FileItem) -> Dict[str, Any]:
-        """Анализирует содержимое документа для категоризации"""
+    def analyze_document_content(
+        self,
+        file_item: FileItem,
+        ai_analysis: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Анализирует содержимое документа для категоризации.
+        ai_analysis — готовый результат ИИ анализа того же содержимого (уже архивированного документа
+        с тем же checksum или из analyze_contents); {} — анализ уже выполнялся и результата нет.
+        """
         try:
             analysis = {}
             
@@ -47,12 +78,13 @@ class DocumentCategorizer:
                     file_path = file_item.get_absolute_path()
                     if os.path.exists(file_path):
                         with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                            content = f.read()[:5000]  # Первые 5000 символов
+                            analysis['content_preview'] = f.read(500)
                         
-                        # ИИ анализ содержимого
-                        ai_analysis = self.ai_service.analyze_text(content)
-                        analysis['ai_analysis'] = ai_analysis
-                        analysis['content_preview'] = content[:500]
+                        # ИИ анализ всего содержимого по частям
+                        if ai_analysis is not None:
+                            analysis['ai_analysis'] = ai_analysis
+                        else:
+                            analysis['ai_analysis'] = self.content_analyzer.sync_analyze_file(file_path, 'summary') or {}
                         
                 except Exception as e:
                     logger.warning(f"Could not analyze content for {file_item.name}: {e}")
@@ -69,6 +101,19 @@ class DocumentCategorizer:
             logger.error(f"Error analyzing document {file_item.name}: {e}")
             return {}
     
+    def analyze_contents(self, file_items: Dict[str, FileItem]) -> Dict[str, Dict[str, Any]]:
+        """
+        ИИ анализ содержимого нескольких файлов {ключ: файл} одновременно —
+        пакет ограничен лимитом модели, а не последовательными запросами
+        """
+        paths = {}
+        for key, file_item in file_items.items():
+            if file_item.is_text or file_item.is_code:
+                file_path = file_item.get_absolute_path()
+                if os.path.exists(file_path):
+                    paths[key] = file_path
+        return self.content_analyzer.sync_analyze_files(paths, 'summary')
+    
     def _extract_filename_keywords(self, filename: str) -> List[str]:
         """Извлекает ключевые слова из имени файла"""
         keywords = []
@@ -120,19 +165,18 @@ class DocumentCategorizer:
         
         return list(set(keywords))
     
-    def determine_category(self, analysis: Dict[str, Any]) -> Optional[ArchiveCategory]:
-        """Определяет подходящую категорию на основе анализа"""
+    def determine_category(
+        self,
+        analysis: Dict[str, Any],
+        snapshot: Optional[CategorySnapshot] = None
+    ) -> Optional[ArchiveCategory]:
+        """Определяет подходящую категорию на основе анализа (snapshot — общий для пакета)"""
         try:
-            # Получаем все активные категории с правилами автокатегоризации
-            categories = ArchiveCategory.objects.filter(
-                is_active=True, 
-                auto_categorize=True
-            ).prefetch_related('retention_policy')
-            
+            snapshot = snapshot or CategorySnapshot()
             best_match = None
             best_score = 0
             
-            for category in categories:
+            for category in snapshot.auto_categories:
                 score = self._calculate_category_score(category, analysis)
                 if score > best_score:
                     best_score = score
@@ -143,10 +187,7 @@ class DocumentCategorizer:
                 return best_match
             
             # Если не нашли подходящую категорию, возвращаем категорию по умолчанию
-            return ArchiveCategory.objects.filter(
-                name__icontains='general',
-                is_active=True
-            ).first() or ArchiveCategory.objects.filter(is_active=True).first()
+            return snapshot.default
             
         except Exception as e:
             logger.error(f"Error determining category: {e}")
@@ -195,13 +236,25 @@ class DocumentCategorizer:
         return min(score, 1.0)  # Максимальная оценка 1.0
 
 
+def known_analyses(checksums) -> Dict[str, Dict[str, Any]]:
+    """
+    Результаты ИИ анализа уже архивированного содержимого по checksum — одним запросом:
+    одинаковые файлы анализируются один раз.
+    """
+    known: Dict[str, Dict[str, Any]] = {}
+    for checksum, analysis in ArchivedDocument.objects.filter(
+        checksum__in=set(checksums)
+    ).exclude(checksum='').exclude(ai_analysis={}).values_list('checksum', 'ai_analysis'):
+        known.setdefault(checksum, analysis)
+    return known
+
+
 class AutoArchiver:
     """Сервис автоматического архивирования документов"""
     
     def __init__(self):
         self.categorizer = DocumentCategorizer()
     
-    @transaction.atomic
     def archive_document(
         self, 
         file_item: FileItem, 
@@ -209,14 +262,19 @@ class AutoArchiver:
         category: Optional[ArchiveCategory] = None,
         note: str = ""
     ) -> ArchivedDocument:
-        """Архивирует документ"""
+        """Архивирует документ; ИИ анализ выполняется до транзакции записи"""
         try:
             # Проверяем, не архивирован ли уже документ
             if hasattr(file_item, 'archive_record'):
                 raise ValueError(f"Document {file_item.name} is already archived")
             
-            # Анализируем документ
-            analysis = self.categorizer.analyze_document_content(file_item)
+            # Вычисляем checksum файла
+            checksum = self._calculate_checksum(file_item)
+            
+            # Анализируем документ (ИИ анализ того же содержимого берется из архива)
+            analysis = self.categorizer.analyze_document_content(
+                file_item, known_analyses([checksum]).get(checksum) if checksum else None
+            )
             
             # Определяем категорию, если не указана
             if not category:
@@ -224,31 +282,29 @@ class AutoArchiver:
                 if not category:
                     raise ValueError("Could not determine suitable category for document")
             
-            # Вычисляем checksum файла
-            checksum = self._calculate_checksum(file_item)
-            
-            # Создаем запись архива
-            archived_doc = ArchivedDocument.objects.create(
-                original_file=file_item,
-                category=category,
-                archived_by=user,
-                metadata=analysis,
-                ai_analysis=analysis.get('ai_analysis', {}),
-                tags=analysis.get('filename_keywords', []) + analysis.get('path_keywords', []),
-                checksum=checksum,
-                archive_note=note,
-                access_level=category.default_access_level,
-                status='archived'
-            )
-            
-            # Логируем активность
-            ArchiveActivity.objects.create(
-                document=archived_doc,
-                user=user,
-                activity_type='archived',
-                description=f"Document archived to category: {category.name}",
-                metadata={'analysis_score': 'auto', 'category_id': category.id}
-            )
+            with transaction.atomic():
+                # Создаем запись архива
+                archived_doc = ArchivedDocument.objects.create(
+                    original_file=file_item,
+                    category=category,
+                    archived_by=user,
+                    metadata=analysis,
+                    ai_analysis=analysis.get('ai_analysis', {}),
+                    tags=analysis.get('filename_keywords', []) + analysis.get('path_keywords', []),
+                    checksum=checksum,
+                    archive_note=note,
+                    access_level=category.default_access_level,
+                    status='archived'
+                )
+                
+                # Логируем активность
+                ArchiveActivity.objects.create(
+                    document=archived_doc,
+                    user=user,
+                    activity_type='archived',
+                    description=f"Document archived to category: {category.name}",
+                    metadata={'analysis_score': 'auto', 'category_id': category.id}
+                )
             
             logger.info(f"Document {file_item.name} archived successfully to {category.name}")
             return archived_doc
@@ -264,12 +320,7 @@ class AutoArchiver:
             if not os.path.exists(file_path):
                 return ""
             
-            sha256_hash = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(chunk)
-            
-            return sha256_hash.hexdigest()
+            return get_checksum_service().checksum(file_path)
             
         except Exception as e:
             logger.warning(f"Could not calculate checksum for {file_item.name}: {e}")
@@ -277,29 +328,7 @@ class AutoArchiver:
     
     def process_bulk_archiving(self, file_items: List[FileItem], user: User) -> Dict[str, Any]:
         """Обрабатывает пакетное архивирование файлов"""
-        results = {
-            'success': [],
-            'errors': [],
-            'total': len(file_items)
-        }
-        
-        for file_item in file_items:
-            try:
-                archived_doc = self.archive_document(file_item, user)
-                results['success'].append({
-                    'file_id': file_item.id,
-                    'file_name': file_item.name,
-                    'archive_id': archived_doc.id,
-                    'category': archived_doc.category.name
-                })
-            except Exception as e:
-                results['errors'].append({
-                    'file_id': file_item.id,
-                    'file_name': file_item.name,
-                    'error': str(e)
-                })
-        
-        return results
+        return BulkArchiver(self).archive(file_items, user)
     
     def check_archiving_eligibility(self, file_item: FileItem) -> Dict[str, Any]:
         """Проверяет, подходит ли файл для архивирования"""
@@ -344,6 +373,171 @@ class AutoArchiver:
         return result
 
 
+class BulkArchiver:
+    """
+    Пакетное архивирование: новое содержимое части анализируется ИИ одновременно,
+    файлы категоризуются по одному снимку категорий, документы и записи журнала
+    пишутся bulk_create, по транзакции на часть из ARCHIVE_BULK_CHUNK_SIZE файлов.
+    """
+    
+    def __init__(self, auto_archiver: Optional[AutoArchiver] = None, chunk_size: Optional[int] = None):
+        self.auto_archiver = auto_archiver or AutoArchiver()
+        self.categorizer = self.auto_archiver.categorizer
+        self.chunk_size = chunk_size or getattr(settings, 'ARCHIVE_BULK_CHUNK_SIZE', 500)
+    
+    def archive(
+        self,
+        file_items: List[FileItem],
+        user: User,
+        category: Optional[ArchiveCategory] = None,
+        note: str = ""
+    ) -> Dict[str, Any]:
+        """Архивирует файлы; ошибки по отдельным файлам не прерывают пакет"""
+        results = {
+            'success': [],
+            'errors': [],
+            'total': len(file_items)
+        }
+        snapshot = CategorySnapshot()
+        seen = set()
+        
+        for start in range(0, len(file_items), self.chunk_size):
+            chunk = file_items[start:start + self.chunk_size]
+            # Уже архивированные файлы части — одним запросом
+            archived = set(ArchivedDocument.objects.filter(
+                original_file__in=[file_item.id for file_item in chunk]
+            ).values_list('original_file_id', flat=True))
+            
+            # Checksum файлов части — параллельно
+            paths = {file_item.id: file_item.get_absolute_path() for file_item in chunk if file_item.id not in archived}
+            checksums = get_checksum_service().checksums(path for path in paths.values() if os.path.exists(path))
+            # Готовые результаты ИИ анализа одинакового содержимого — одним запросом
+            analyses = known_analyses(filter(None, checksums.values()))
+            # Новое содержимое части анализируется одновременно, по разу на checksum и вне транзакций
+            pending = {}
+            for file_item in chunk:
+                checksum = checksums.get(paths.get(file_item.id))
+                if checksum and checksum not in analyses and file_item.id not in seen:
+                    pending.setdefault(checksum, file_item)
+            analyses.update(self.categorizer.analyze_contents(pending))
+            
+            documents = []
+            for file_item in chunk:
+                try:
+                    if file_item.id in archived or file_item.id in seen:
+                        raise ValueError(f"Document {file_item.name} is already archived")
+                    seen.add(file_item.id)
+                    checksum = checksums.get(paths[file_item.id]) or ""
+                    document = self._prepare(
+                        file_item, user, snapshot, checksum, analyses.get(checksum, {}), category, note
+                    )
+                    documents.append(document)
+                except Exception as e:
+                    logger.error(f"Error archiving document {file_item.name}: {e}")
+                    results['errors'].append(self._error(file_item, e))
+            
+            self._write(documents, user, results)
+        
+        logger.info(f"Bulk archiving finished: {len(results['success'])} archived, {len(results['errors'])} failed")
+        return results
+    
+    def _prepare(
+        self,
+        file_item: FileItem,
+        user: User,
+        snapshot: CategorySnapshot,
+        checksum: str,
+        ai_analysis: Optional[Dict[str, Any]],
+        category: Optional[ArchiveCategory],
+        note: str
+    ) -> ArchivedDocument:
+        """Категория файла по готовому анализу — вне транзакции"""
+        analysis = self.categorizer.analyze_document_content(file_item, ai_analysis)
+        document_category = category or self.categorizer.determine_category(analysis, snapshot)
+        if not document_category:
+            raise ValueError("Could not determine suitable category for document")
+        
+        document = ArchivedDocument(
+            original_file=file_item,
+            category=document_category,
+            archived_by=user,
+            metadata=analysis,
+            ai_analysis=analysis.get('ai_analysis', {}),
+            tags=analysis.get('filename_keywords', []) + analysis.get('path_keywords', []),
+            checksum=checksum,
+            archive_note=note,
+            access_level=document_category.default_access_level,
+            status='archived'
+        )
+        document.assign_retention_date()
+        return document
+    
+    def _write(self, documents: List[ArchivedDocument], user: User, results: Dict[str, Any]):
+        """Запись части одной транзакцией; при ошибке — по одному, чтобы найти проблемные файлы"""
+        if not documents:
+            return
+        try:
+            with transaction.atomic():
+                self._insert(documents, user)
+        except Exception as e:
+            logger.warning(f"Bulk insert of {len(documents)} documents failed, retrying one by one: {e}")
+            written = []
+            for document in documents:
+                document.pk = None
+                document._state.adding = True
+                try:
+                    with transaction.atomic():
+                        self._insert([document], user)
+                    written.append(document)
+                except Exception as item_error:
+                    logger.error(f"Error archiving document {document.original_file.name}: {item_error}")
+                    results['errors'].append(self._error(document.original_file, item_error))
+            documents = written
+        
+        for document in documents:
+            results['success'].append({
+                'file_id': document.original_file.id,
+                'file_name': document.original_file.name,
+                'archive_id': document.id,
+                'category': document.category.name
+            })
+    
+    def _insert(self, documents: List[ArchivedDocument], user: User):
+        ArchivedDocument.objects.bulk_create(documents)
+        
+        activities = []
+        for document in documents:
+            activities.append(ArchiveActivity(
+                document=document,
+                user=user,
+                activity_type='archived',
+                description=f"Document archived to category: {document.category.name}",
+                metadata={'analysis_score': 'auto', 'category_id': document.category.id}
+            ))
+            # bulk_create не вызывает post_save: запись, которую добавляет сигнал archived_document_created
+            activities.append(ArchiveActivity(
+                document=document,
+                user=document.archived_by,
+                activity_type='document_archived',
+                description=f'Документ "{document.original_file.name}" архивирован в категорию "{document.category.name}"'
+            ))
+        ArchiveActivity.objects.bulk_create(activities)
+        
+        # И переиндексацию из сигнала archived_document_saved — одним запросом на часть
+        index = get_lexical_index(sync=False)
+        if index.is_built:
+            document_ids = [document.id for document in documents]
+            transaction.on_commit(lambda: index.refresh_documents(document_ids))
+    
+    @staticmethod
+    def _error(file_item: FileItem, error: Exception) -> Dict[str, Any]:
+        return {
+            'file_id': file_item.id,
+            'file_name': file_item.name,
+            'error': str(error)
+        }
+
+
 class ArchiveManager:
     """Основной менеджер для работы с архивом"""
     
@@ -486,6 +680,9 @@ class ArchiveManager:
             stats['total_size_bytes'] = total_size
             stats['total_size_mb'] = total_size / (1024 * 1024) if total_size else 0
             
+            # Эффективность кэша embeddings (счетчики текущего процесса)
+            stats['embedding_cache'] = get_embedding_cache().stats()
+            
             return stats
             
         except Exception as e:
@@ -493,11 +690,368 @@ class ArchiveManager:
             return {}
 
 
+# Конец очереди стадии конвейера
+_DONE = object()
+
+
+class ArchivingPipeline:
+    """
+    Конвейер задания архивирования: checksum → запись документов →
+    ИИ анализ → статус 'archived' → embeddings. Стадии связаны ограниченными очередями и
+    работают одновременно, у каждой свой пул обработчиков; запись в БД — пакетами.
+    """
+    
+    # Ключи configuration['pipeline'] задания
+    OPTIONS = ('hash_workers', 'ai_workers', 'embedding_workers', 'batch_size', 'queue_size', 'flush_interval')
+    
+    def __init__(
+        self,
+        service: 'AutoArchivingService',
+        hash_workers: Optional[int] = None,
+        ai_workers: Optional[int] = None,
+        embedding_workers: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        flush_interval: Optional[float] = None
+    ):
+        self.service = service
+        self.hash_workers = hash_workers or getattr(settings, 'ARCHIVE_PIPELINE_HASH_WORKERS', 0) or min(8, os.cpu_count() or 1)
+        # Вдвое больше слотов модели: пока один обработчик пишет результат, модель занята другим
+        self.ai_workers = ai_workers or getattr(settings, 'ARCHIVE_PIPELINE_AI_WORKERS', 0) or (
+            2 * get_request_scheduler().limit(service.ai_service.default_model)
+        )
+        self.embedding_workers = embedding_workers or getattr(settings, 'ARCHIVE_PIPELINE_EMBEDDING_WORKERS', 2)
+        self.batch_size = batch_size or getattr(settings, 'ARCHIVE_PIPELINE_BATCH_SIZE', 100)
+        self.queue_size = queue_size or getattr(settings, 'ARCHIVE_PIPELINE_QUEUE_SIZE', 256)
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'ARCHIVE_PIPELINE_FLUSH_INTERVAL', 0.5)
+        self.flush_interval = flush_interval
+        self.job: Optional[ArchivingJob] = None
+        self.reporter: Optional[JobProgressReporter] = None
+        self.category: Optional[ArchiveCategory] = None
+        self.ai_analysis = True
+        # Результаты ИИ анализа по checksum: одинаковое содержимое анализируется один раз
+        self.analyses: Dict[str, asyncio.Future] = {}
+        self.archived = 0
+        self.failed = 0
+    
+    async def run(self, job: ArchivingJob, reporter: Optional[JobProgressReporter] = None) -> Dict[str, int]:
+        """Обрабатывает файлы задания, возвращает число архивированных и ошибок"""
+        self.job = job
+        self.reporter = reporter or JobProgressReporter(job)
+        self.ai_analysis = job.configuration.get('require_ai_analysis', True)
+        # С политикой хранения: срок хранения документов считается без запросов
+        self.category = await sync_to_async(
+            ArchiveCategory.objects.select_related('retention_policy').get
+        )(pk=job.target_category_id)
+        file_items, errors = await sync_to_async(self.resolve)(job.source_paths)
+        if errors:
+            await self._fail(errors)
+        
+        hashing, writing, analysis, finishing, embedding = (asyncio.Queue(self.queue_size) for _ in range(5))
+        
+        async def feed():
+            for file_item in file_items:
+                await hashing.put(file_item)
+            for _ in range(self.hash_workers):
+                await hashing.put(_DONE)
+        
+        stages = [feed(), self._stage([self._hash(hashing, writing) for _ in range(self.hash_workers)], writing, 1)]
+        if self.ai_analysis:
+            stages += [
+                self._stage([self._write(writing, analysis)], analysis, self.ai_workers),
+                self._stage([self._analyze(analysis, finishing) for _ in range(self.ai_workers)], finishing, 1),
+            ]
+        else:
+            stages.append(self._stage([self._write(writing, finishing)], finishing, 1))
+        stages += [
+            self._stage([self._finish(finishing, embedding)], embedding, self.embedding_workers),
+            self._stage([self._embed(embedding) for _ in range(self.embedding_workers)]),
+        ]
+        tasks = [asyncio.ensure_future(stage) for stage in stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        logger.info(f"Archiving job {job.id}: {self.archived} archived, {self.failed} failed")
+        return {'archived': self.archived, 'failed': self.failed}
+    
+    def resolve(self, source_paths: List[str]) -> Tuple[List[FileItem], List[Tuple[str, str]]]:
+        """FileItem по путям задания одним запросом; пути без файла и уже архивированные — в ошибки"""
+        media_root = os.path.abspath(settings.MEDIA_ROOT)
+        
+        def relative(path: str) -> str:
+            if os.path.isabs(path) and os.path.abspath(path).startswith(media_root + os.sep):
+                return os.path.relpath(path, media_root)
+            return path
+        
+        paths = [str(path) for path in source_paths]
+        by_path = {
+            file_item.path: file_item
+            for file_item in FileItem.objects.filter(
+                path__in=set(paths) | {relative(path) for path in paths}
+            ).select_related('owner')
+        }
+        archived = set(ArchivedDocument.objects.filter(
+            original_file__in=[file_item.id for file_item in by_path.values()]
+        ).values_list('original_file_id', flat=True))
+        
+        file_items = []
+        errors = []
+        seen = set()
+        for path in paths:
+            file_item = by_path.get(path) or by_path.get(relative(path))
+            if file_item is None:
+                errors.append((path, f"File not found: {path}"))
+            elif file_item.id in archived or file_item.id in seen:
+                errors.append((path, f"Error processing {path}: document {file_item.name} is already archived"))
+            else:
+                seen.add(file_item.id)
+                file_items.append(file_item)
+        return file_items, errors
+    
+    async def _stage(self, workers: List, outbox: Optional[asyncio.Queue] = None, consumers: int = 0):
+        """Обработчики стадии; после их завершения — конец очереди для каждого обработчика следующей"""
+        await asyncio.gather(*workers)
+        for _ in range(consumers):
+            await outbox.put(_DONE)
+    
+    async def _batches(self, inbox: asyncio.Queue, size: int) -> AsyncIterator[List]:
+        """Пакеты из очереди: до size элементов или сколько пришло за flush_interval после первого"""
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            finished = False
+            while len(batch) < size:
+                try:
+                    item = await asyncio.wait_for(inbox.get(), max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if item is _DONE:
+                    finished = True
+                    break
+                batch.append(item)
+            yield batch
+            if finished:
+                return
+    
+    async def _progress(self, processed: int = 0, successful: int = 0, failed: int = 0):
+        """Ход задания — в JobProgressReporter; запись в БД, когда набралось достаточно"""
+        self.reporter.add(processed=processed, successful=successful, failed=failed)
+        if self.reporter.due():
+            await sync_to_async(self.reporter.flush)()
+    
+    async def _fail(self, errors: List[Tuple[str, str]]):
+        """Ошибки (путь, сообщение) по отдельным файлам"""
+        for file_path, message in errors:
+            self.reporter.error(message, file_path)
+        self.failed += len(errors)
+        await self._progress(processed=len(errors), failed=len(errors))
+    
+    async def _hash(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """Checksum файлов — в потоках"""
+        while True:
+            file_item = await inbox.get()
+            if file_item is _DONE:
+                return
+            path = file_item.get_absolute_path()
+            try:
+                checksum = await asyncio.to_thread(self.service.calculate_file_checksum, path)
+                document = ArchivedDocument(
+                    original_file=file_item,
+                    category=self.category,
+                    archived_by=file_item.owner,
+                    status='processing',
+                    checksum=checksum,
+                    metadata={
+                        'original_size': file_item.size,
+                        'original_path': path,
+                        'archived_by_rule': True
+                    }
+                )
+                document.assign_retention_date()
+                await outbox.put(document)
+            except Exception as e:
+                logger.error(f"Failed to archive file {file_item.name}: {e}")
+                await self._fail([(path, f"Error processing {path}: {e}")])
+    
+    async def _write(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """Запись документов пакетами; ошибка пакета — запись по одному"""
+        async for batch in self._batches(inbox, self.batch_size):
+            written, errors = await sync_to_async(self._insert_batch)(batch)
+            if errors:
+                await self._fail(errors)
+            if not self.ai_analysis:
+                for document in written:
+                    await outbox.put((document, []))
+                continue
+            
+            loop = asyncio.get_running_loop()
+            known = await sync_to_async(self._known_analyses)(
+                [document for document in written if document.checksum and document.checksum not in self.analyses]
+            )
+            for checksum, results in known.items():
+                self.analyses[checksum] = loop.create_future()
+                self.analyses[checksum].set_result(results)
+            for document in written:
+                await outbox.put(document)
+    
+    def _insert_batch(
+        self,
+        documents: List[ArchivedDocument]
+    ) -> Tuple[List[ArchivedDocument], List[Tuple[str, str]]]:
+        errors = []
+        try:
+            with transaction.atomic():
+                self._insert(documents)
+            written = documents
+        except Exception as e:
+            logger.warning(f"Bulk insert of {len(documents)} documents failed, retrying one by one: {e}")
+            written = []
+            for document in documents:
+                document.pk = None
+                document._state.adding = True
+                try:
+                    with transaction.atomic():
+                        self._insert([document])
+                    written.append(document)
+                except Exception as item_error:
+                    logger.error(f"Failed to archive file {document.original_file.name}: {item_error}")
+                    path = document.metadata['original_path']
+                    errors.append((path, f"Error processing {path}: {item_error}"))
+        return written, errors
+    
+    def _insert(self, documents: List[ArchivedDocument]):
+        ArchivedDocument.objects.bulk_create(documents)
+        # bulk_create не вызывает post_save: запись, которую добавляет сигнал archived_document_created
+        ArchiveActivity.objects.bulk_create([
+            ArchiveActivity(
+                document=document,
+                user=document.archived_by,
+                activity_type='document_archived',
+                description=f'Документ "{document.original_file.name}" архивирован в категорию "{document.category.name}"'
+            )
+            for document in documents
+        ])
+    
+    @staticmethod
+    def _known_analyses(documents: List[ArchivedDocument]) -> Dict[str, List[AIAnalysisResult]]:
+        """Результаты анализа того же содержимого из прошлых заданий — одним запросом на пакет"""
+        if not documents:
+            return {}
+        sources: Dict[str, int] = {}
+        known: Dict[str, List[AIAnalysisResult]] = {}
+        for result in AIAnalysisResult.objects.filter(
+            document__checksum__in={document.checksum for document in documents}
+        ).exclude(document__in=documents).annotate(source_checksum=F('document__checksum')).order_by('document_id', 'id'):
+            # Берем результаты одного документа на checksum
+            if sources.setdefault(result.source_checksum, result.document_id) == result.document_id:
+                known.setdefault(result.source_checksum, []).append(result)
+        return known
+    
+    async def _analyze(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """ИИ анализ: параллельные запросы к модели, одинаковое содержимое — один раз"""
+        while True:
+            document = await inbox.get()
+            if document is _DONE:
+                return
+            if not document.checksum:
+                results = await self._analysis(document)
+            elif document.checksum in self.analyses:
+                results = await asyncio.shield(self.analyses[document.checksum])
+            else:
+                future = asyncio.get_running_loop().create_future()
+                self.analyses[document.checksum] = future
+                results = []
+                try:
+                    results = await self._analysis(document)
+                finally:
+                    # При отмене обработчика ожидающие того же содержимого не должны зависнуть
+                    if not future.done():
+                        future.set_result(results)
+            
+            copies = []
+            for result in results:
+                copy = AIAnalysisResult(**{
+                    field.attname: getattr(result, field.attname)
+                    for field in AIAnalysisResult._meta.concrete_fields
+                    if not field.primary_key and field.name not in ('document', 'created_at')
+                })
+                copy.document = document
+                copies.append(copy)
+            await outbox.put((document, copies))
+    
+    async def _analysis(self, document: ArchivedDocument) -> List[AIAnalysisResult]:
+        try:
+            return await self.service.analyze_file(document.original_file)
+        except Exception as e:
+            logger.error(f"AI analysis failed for document {document.id}: {e}")
+            return []
+    
+    async def _finish(self, inbox: asyncio.Queue, outbox: asyncio.Queue):
+        """Результаты анализа и статус 'archived' — пакетами"""
+        async for batch in self._batches(inbox, self.batch_size):
+            try:
+                await sync_to_async(self._finish_batch)(batch)
+            except Exception as e:
+                logger.error(f"Failed to finish {len(batch)} archived documents: {e}")
+                await self._fail([
+                    (document.metadata['original_path'], f"Error processing {document.metadata['original_path']}: {e}")
+                    for document, _ in batch
+                ])
+                continue
+            self.archived += len(batch)
+            await self._progress(processed=len(batch), successful=len(batch))
+            for document, _ in batch:
+                await outbox.put(document)
+    
+    def _finish_batch(self, batch: List[Tuple[ArchivedDocument, List[AIAnalysisResult]]]):
+        documents = [document for document, _ in batch]
+        results = [result for _, document_results in batch for result in document_results]
+        with transaction.atomic():
+            AIAnalysisResult.objects.bulk_create(results)
+            # Записи журнала из сигнала ai_analysis_completed
+            ArchiveActivity.objects.bulk_create([
+                ArchiveActivity(
+                    document=result.document,
+                    user=result.document.archived_by,
+                    activity_type='ai_analysis_completed',
+                    description=f'ИИ анализ завершен. Точность: {result.confidence_score:.1%}'
+                )
+                for result in results
+                if result.confidence_score > 0
+            ])
+            ArchivedDocument.objects.filter(id__in=[document.id for document in documents]).update(status='archived')
+            for document in documents:
+                document.status = 'archived'
+            
+            # Переиндексация из сигнала archived_document_saved — одним запросом на пакет
+            index = get_lexical_index(sync=False)
+            if index.is_built:
+                document_ids = [document.id for document in documents]
+                transaction.on_commit(lambda: index.refresh_documents(document_ids))
+    
+    async def _embed(self, inbox: asyncio.Queue):
+        """Embeddings пакетами DocumentEmbeddingPipeline; несколько пакетов одновременно"""
+        pipeline = self.service.embedding_pipeline
+        async for batch in self._batches(inbox, pipeline.batch_size):
+            await pipeline.embed_documents(batch)
+
+
 class AutoArchivingService:
     """Сервис автоматического архивирования файлов"""
     
     def __init__(self):
-        self.ai_service = OllamaService()
+        self.ai_service = OllamaService(priority=PRIORITY_BATCH)
+        self.content_analyzer = ChunkedAnalyzer(self.ai_service)
+        self.embedding_pipeline = DocumentEmbeddingPipeline(self.ai_service)
     
     async def process_auto_archiving_rules(self):
         """Обработка всех активных правил автоархивирования"""
@@ -532,14 +1086,14 @@ class AutoArchivingService:
             return
         
         # Создать задание архивирования
-        job = ArchivingJob.objects.create(
+        job = await sync_to_async(ArchivingJob.objects.create)(
             auto_rule=rule,
             job_type='auto_rule',
-            source_paths=[str(f.full_path) for f in candidate_files],
-            target_category=rule.target_category,
+            source_paths=[f.path for f in candidate_files],
+            target_category_id=rule.target_category_id,
             configuration=rule.trigger_conditions,
             total_files=len(candidate_files),
-            created_by=rule.created_by
+            created_by_id=rule.created_by_id
         )
         
         # Выполнить архивирование
@@ -583,54 +1137,45 @@ class AutoArchivingService:
         # Исключить уже архивированные файлы
         query &= ~Q(archive_record__isnull=False)
         
-        return list(FileItem.objects.filter(query)[:1000])  # Лимит на обработку
+        return await sync_to_async(list)(FileItem.objects.filter(query)[:1000])  # Лимит на обработку
     
     async def process_archiving_job(self, job: ArchivingJob):
-        """Обработка задания архивирования"""
-        job.status = 'running'
-        job.started_at = timezone.now()
-        job.save()
+        """Обработка задания архивирования конвейером ArchivingPipeline"""
+        reporter = JobProgressReporter(job)
+        await sync_to_async(reporter.start)()
+        
+        # Параллелизм стадий задания: configuration['pipeline'], иначе настройки ARCHIVE_PIPELINE_*
+        options = job.configuration.get('pipeline', {})
+        pipeline = ArchivingPipeline(self, **{key: options[key] for key in ArchivingPipeline.OPTIONS if key in options})
+        status = 'failed'
+        results = None
         
         try:
-            source_paths = job.source_paths
-            
-            for file_path in source_paths:
-                try:
-                    file_item = FileItem.objects.get(full_path=file_path)
-                    success = await self.archive_single_file(
-                        file_item, 
-                        job.target_category,
-                        job.configuration.get('require_ai_analysis', True)
-                    )
-                    
-                    if success:
-                        job.update_progress(processed=1, successful=1)
-                    else:
-                        job.update_progress(processed=1, failed=1)
-                        
-                except FileItem.DoesNotExist:
-                    job.error_log.append(f"File not found: {file_path}")
-                    job.update_progress(processed=1, failed=1)
-                
-                except Exception as e:
-                    job.error_log.append(f"Error processing {file_path}: {str(e)}")
-                    job.update_progress(processed=1, failed=1)
-            
-            job.status = 'completed'
+            results = await pipeline.run(job, reporter)
+            status = 'completed'
             
         except Exception as e:
-            job.status = 'failed'
-            job.error_log.append(f"Job failed: {str(e)}")
+            reporter.error(f"Job failed: {str(e)}")
             
         finally:
-            job.completed_at = timezone.now()
-            job.save()
+            await sync_to_async(reporter.finish)(status, results)
     
     async def archive_single_file(self, file_item: FileItem, category: ArchiveCategory, ai_analysis: bool = True) -> bool:
         """Архивирование одного файла"""
+        return await self.archive_file(file_item, category, ai_analysis) is not None
+    
+    async def archive_file(
+        self,
+        file_item: FileItem,
+        category: ArchiveCategory,
+        ai_analysis: bool = True,
+        create_embedding: bool = True
+    ) -> Optional[ArchivedDocument]:
+        """Архивирование файла; create_embedding=False оставляет embedding для пакетной обработки"""
         try:
             # Вычислить checksum
-            checksum = self.calculate_file_checksum(file_item.full_path)
+            file_path = file_item.get_absolute_path()
+            checksum = self.calculate_file_checksum(file_path)
             
             # Создать архивную запись
             archived_doc = ArchivedDocument.objects.create(
@@ -641,7 +1186,7 @@ class AutoArchivingService:
                 checksum=checksum,
                 metadata={
                     'original_size': file_item.size,
-                    'original_path': str(file_item.full_path),
+                    'original_path': file_path,
                     'archived_by_rule': True
                 }
             )
@@ -650,86 +1195,105 @@ class AutoArchivingService:
             if ai_analysis:
                 await self.perform_ai_analysis(archived_doc)
             
-            # Создать векторное представление
-            await self.create_document_embedding(archived_doc)
-            
             archived_doc.status = 'archived'
             archived_doc.save()
             
+            # Создать векторное представление
+            if create_embedding:
+                await self.create_document_embedding(archived_doc)
+            
             logger.info(f"Successfully archived file: {file_item.name}")
-            return True
+            return archived_doc
             
         except Exception as e:
             logger.error(f"Failed to archive file {file_item.name}: {str(e)}")
-            return False
+            return None
     
     async def perform_ai_analysis(self, document: ArchivedDocument):
         """Выполнение ИИ анализа документа"""
         try:
-            file_path = document.original_file.full_path
-            
-            # Классификация контента через Ollama
-            classification_result = await self.ai_service.classify_document_content(str(file_path))
-            AIAnalysisResult.objects.create(
-                document=document,
-                analysis_type='content_classification',
-                ai_model='ollama_llama2',
-                results=classification_result,
-                confidence_score=classification_result.get('confidence', 0.0),
-                classifications=classification_result.get('categories', []),
-                processing_time=classification_result.get('processing_time', 0.0)
-            )
+            if self.reuse_ai_analysis(document):
+                return
             
-            # Извлечение ключевых слов
-            keywords_result = await self.ai_service.extract_keywords(str(file_path))
-            AIAnalysisResult.objects.create(
-                document=document,
-                analysis_type='entity_extraction',
-                ai_model='ollama_llama2',
-                results=keywords_result,
-                confidence_score=keywords_result.get('confidence', 0.0),
-                extracted_entities=keywords_result.get('keywords', []),
-                processing_time=keywords_result.get('processing_time', 0.0)
-            )
+            for result in await self.analyze_file(document.original_file):
+                result.document = document
+                result.save()
             
         except Exception as e:
             logger.error(f"AI analysis failed for document {document.id}: {str(e)}")
     
+    async def analyze_file(self, file_item: FileItem) -> List[AIAnalysisResult]:
+        """
+        ИИ анализ текстового файла: изложение содержимого по частям (ChunkedAnalyzer)
+        и ключевые слова изложения. Несохраненные результаты без документа; [] для нетекстовых файлов.
+        """
+        if not is_text_file(file_item):
+            return []
+        
+        chunks = iter_file_chunks(file_item.get_absolute_path(), self.content_analyzer.chunker)
+        summary = await self.content_analyzer.analyze(chunks, 'summary')
+        if not summary:
+            raise RuntimeError(f"No analysis returned for {file_item.name}")
+        results = [AIAnalysisResult(
+            analysis_type='content_classification',
+            ai_model=summary.get('model') or self.ai_service.default_model,
+            results=summary,
+            summary=summary['analysis'],
+            # Модель не оценивает уверенность
+            confidence_score=0.0,
+            processing_time=(summary.get('total_duration') or 0) / 1e9
+        )]
+        
+        # Ключевые слова — по изложению, а не по всему файлу
+        keywords = await self.ai_service.analyze_text(summary['analysis'], 'keywords')
+        if keywords:
+            results.append(AIAnalysisResult(
+                analysis_type='entity_extraction',
+                ai_model=keywords.get('model') or self.ai_service.default_model,
+                results=keywords,
+                confidence_score=0.0,
+                extracted_entities=self.parse_keywords(keywords['analysis']),
+                processing_time=(keywords.get('total_duration') or 0) / 1e9
+            ))
+        return results
+    
+    @staticmethod
+    def parse_keywords(text: str, limit: int = 20) -> List[str]:
+        """Ключевые слова из ответа модели: список строками или через запятую"""
+        keywords = []
+        for line in text.replace(',', '\n').splitlines():
+            keyword = line.strip().lstrip('-*•0123456789.) ').strip()
+            if keyword and keyword.lower() not in (existing.lower() for existing in keywords):
+                keywords.append(keyword)
+        return keywords[:limit]
+    
+    def reuse_ai_analysis(self, document: ArchivedDocument) -> bool:
+        """Копирует результаты анализа документа с тем же содержимым (checksum) вместо нового вызова модели"""
+        if not document.checksum:
+            return False
+        source = AIAnalysisResult.objects.filter(
+            document__checksum=document.checksum
+        ).exclude(document=document).values_list('document_id', flat=True).first()
+        if source is None:
+            return False
+        
+        copies = []
+        for result in AIAnalysisResult.objects.filter(document_id=source):
+            result.pk = None
+            result.document = document
+            copies.append(result)
+        AIAnalysisResult.objects.bulk_create(copies)
+        logger.info(f"Reused AI analysis of document {source} for document {document.id}")
+        return True
+    
     async def create_document_embedding(self, document: ArchivedDocument):
         """Создание векторного представления документа"""
-        try:
-            file_path = document.original_file.full_path
-            
-            # Получить embedding контента через ИИ сервис
-            content_text = await self.ai_service.extract_text_content(str(file_path))
-            content_embedding = await self.ai_service.get_text_embedding(content_text)
-            
-            # Получить embedding метаданных
-            metadata_text = json.dumps(document.metadata)
-            metadata_embedding = await self.ai_service.get_text_embedding(metadata_text)
-            
-            # Извлечь ключевые слова
-            keywords = await self.ai_service.extract_keywords(str(file_path))
-            
-            DocumentEmbedding.objects.create(
-                document=document,
-                content_embedding=content_embedding,
-                metadata_embedding=metadata_embedding,
-                keywords=keywords.get('keywords', []) if isinstance(keywords, dict) else keywords,
-                embedding_model='ollama-embeddings'
-            )
-            
-        except Exception as e:
-            logger.error(f"Failed to create embedding for document {document.id}: {str(e)}")
+        await self.embedding_pipeline.embed_documents([document])
     
     def calculate_file_checksum(self, file_path: str) -> str:
         """Вычисление SHA-256 checksum файла"""
-        hash_sha256 = hashlib.sha256()
         try:
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_sha256.update(chunk)
-            return hash_sha256.hexdigest()
+            return get_checksum_service().checksum(str(file_path))
         except Exception as e:
             logger.error(f"Failed to calculate checksum for {file_path}: {str(e)}")
             return ""
@@ -743,17 +1307,38 @@ class AutoArchivingService:
 class ArchiveSearchService:
     """Сервис поиска в архиве с ИИ поддержкой"""
     
+    # Во сколько раз больше кандидатов берется из каждого индекса для гибридного ранжирования
+    FUSION_DEPTH = 4
+    
     def __init__(self):
         self.ai_service = OllamaService()
     
-    async def semantic_search(self, query: str, user: User, limit: int = 20) -> List[Dict]:
-        """Семантический поиск по архиву"""
+    async def semantic_search(
+        self,
+        query: str,
+        user: User,
+        limit: int = 20,
+        category_id: Optional[int] = None,
+        similarity_threshold: float = 0.3,
+        mode: str = 'semantic'
+    ) -> List[Dict]:
+        """
+        Семантический поиск по архиву.
+        mode='hybrid' объединяет косинусное сходство и BM25 (reciprocal rank fusion).
+        """
         try:
             # Получить embedding запроса
             query_embedding = await self.ai_service.get_text_embedding(query)
+            if not query_embedding and mode != 'hybrid':
+                return []
             
             # Найти похожие документы
-            similar_docs = await self.find_similar_documents(query_embedding, user, limit)
+            similar_docs = await self.find_similar_documents(
+                query_embedding, user, limit,
+                category_id=category_id,
+                similarity_threshold=similarity_threshold,
+                query_text=query if mode == 'hybrid' else None
+            )
             
             return similar_docs
             
@@ -761,33 +1346,192 @@ class ArchiveSearchService:
             logger.error(f"Semantic search failed: {str(e)}")
             return []
     
-    async def find_similar_documents(self, query_embedding: List[float], user: User, limit: int) -> List[Dict]:
-        """Поиск похожих документов по embedding"""
-        # Получить все embeddings с правами доступа
-        embeddings = DocumentEmbedding.objects.select_related('document').filter(
-            document__status='archived'
+    async def find_similar_documents(
+        self,
+        query_embedding: Optional[List[float]],
+        user: User,
+        limit: int,
+        category_id: Optional[int] = None,
+        similarity_threshold: float = 0.3,
+        query_text: Optional[str] = None
+    ) -> List[Dict]:
+        """Поиск похожих документов по embedding (и по тексту запроса, если он передан)"""
+        return await sync_to_async(self._find_similar_documents)(
+            query_embedding, user, limit, category_id, similarity_threshold, query_text
         )
+    
+    def _find_similar_documents(
+        self,
+        query_embedding: Optional[List[float]],
+        user: User,
+        limit: int,
+        category_id: Optional[int],
+        similarity_threshold: float,
+        query_text: Optional[str] = None
+    ) -> List[Dict]:
+        """Top-k по векторному (и полнотекстовому) индексу среди видимых пользователю документов"""
+        allowed_ids = self.get_visible_document_ids(user, category_id)
+        depth = limit * self.FUSION_DEPTH if query_text else limit
         
-        similarities = []
-        for embedding in embeddings:
-            # Проверить права доступа
-            if not self.check_document_access(embedding.document, user):
-                continue
+        candidates = []
+        if query_embedding:
+            candidates = get_vector_index().search(
+                query_embedding,
+                k=depth,
+                threshold=similarity_threshold,
+                allowed_ids=allowed_ids
+            )
+        similarity_by_id = dict(candidates)
+        
+        if query_text:
+            lexical = get_lexical_index().search(query_text, k=depth, allowed_ids=allowed_ids)
+            ranked = reciprocal_rank_fusion([
+                [document_id for document_id, _ in candidates],
+                [document_id for document_id, _ in lexical]
+            ])[:limit]
+        else:
+            ranked = candidates
+        if not ranked:
+            return []
+        
+        documents_by_id = self._load_documents([document_id for document_id, _ in ranked])
+        return self._build_results(ranked, documents_by_id, similarity_by_id)
+    
+    async def stream_semantic_search(
+        self,
+        query: str,
+        user: User,
+        limit: int = 20,
+        category_id: Optional[int] = None,
+        similarity_threshold: float = 0.3
+    ) -> AsyncIterator[Dict]:
+        """
+        Семантический поиск с промежуточными результатами: после каждого шарда
+        индекса отдается текущий top-k {'shard', 'shards', 'results', 'final'}
+        """
+        query_embedding = await self.ai_service.get_text_embedding(query)
+        if not query_embedding:
+            yield {'shard': 1, 'shards': 1, 'results': [], 'final': True}
+            return
+        
+        index = await sync_to_async(get_vector_index)()
+        allowed_ids = await sync_to_async(self.get_visible_document_ids)(user, category_id)
+        shards = index.iter_search(
+            query_embedding,
+            k=limit,
+            threshold=similarity_threshold,
+            allowed_ids=allowed_ids,
+            shard_size=getattr(settings, 'ARCHIVE_SEARCH_STREAM_SHARD_SIZE', 20000)
+        )
+        
+        documents_by_id = {}
+        previous = None
+        while True:
+            # Каждый шард считается в отдельном потоке, чтобы не блокировать event loop
+            step = await asyncio.to_thread(next, shards, None)
+            if step is None:
+                break
+            shard, total, ranked = step
             
-            # Вычислить косинусное сходство
-            similarity = self.cosine_similarity(query_embedding, embedding.content_embedding)
+            missing = [document_id for document_id, _ in ranked if document_id not in documents_by_id]
+            if missing:
+                documents_by_id.update(await sync_to_async(self._load_documents)(missing))
             
-            if similarity > 0.3:  # Порог сходства
-                similarities.append({
-                    'document': embedding.document,
-                    'similarity': similarity,
-                    'keywords': embedding.keywords[:5]  # Топ 5 ключевых слов
-                })
+            # Неизменившийся top-k повторно не отправляем (кроме последнего шарда)
+            if ranked != previous or shard == total:
+                yield {
+                    'shard': shard,
+                    'shards': total,
+                    'results': self._build_results(ranked, documents_by_id, dict(ranked)),
+                    'final': shard == total
+                }
+            previous = ranked
+    
+    def _load_documents(self, document_ids: List[int]) -> Dict[int, ArchivedDocument]:
+        """Загрузка найденных документов одним запросом"""
+        documents = ArchivedDocument.objects.select_related(
+            'original_file', 'category', 'archived_by', 'embedding'
+        ).defer(
+            'embedding__content_embedding', 'embedding__metadata_embedding', 'embedding__content_text',
+            'embedding__content_vector', 'embedding__metadata_vector'
+        ).filter(
+            id__in=document_ids
+        )
+        return {document.id: document for document in documents}
+    
+    def _build_results(
+        self,
+        ranked: List[Tuple[int, float]],
+        documents_by_id: Dict[int, ArchivedDocument],
+        similarity_by_id: Dict[int, float]
+    ) -> List[Dict]:
+        results = []
+        for document_id, score in ranked:
+            document = documents_by_id.get(document_id)
+            if document is None:
+                continue
+            
+            results.append({
+                'document': document,
+                'similarity': similarity_by_id.get(document_id),
+                'score': score,
+                # Топ 5 ключевых слов
+                'keywords': document.embedding.keywords[:5] if hasattr(document, 'embedding') else []
+            })
         
-        # Сортировать по сходству
-        similarities.sort(key=lambda x: x['similarity'], reverse=True)
+        return results
+    
+    def get_visible_document_ids(self, user: User, category_id: Optional[int] = None) -> np.ndarray:
+        """
+        Отсортированный массив id документов, доступных пользователю
+        (те же правила, что в check_document_access, но двумя запросами на весь архив)
+        """
+        documents = ArchivedDocument.objects.filter(status='archived')
+        if category_id:
+            documents = documents.filter(category_id=category_id)
+        
+        access = self.access_filter(user)
+        visible = np.fromiter(
+            documents.filter(access).values_list('id', flat=True).iterator(chunk_size=10000),
+            dtype=np.int64
+        )
+        
+        if user.is_authenticated:
+            granted = ArchivePermission.objects.filter(
+                user=user,
+                permission_type='view',
+                document__in=documents.exclude(access)
+            ).values_list('document_id', flat=True)
+            visible = np.concatenate((visible, np.fromiter(granted, dtype=np.int64)))
+        
+        return np.unique(visible)
+    
+    @staticmethod
+    def access_filter(user: User) -> Q:
+        """Условие доступа по уровню и владельцу (без индивидуальных разрешений)"""
+        if not user.is_authenticated:
+            return Q(access_level='public')
+        return Q(access_level__in=['public', 'internal']) | Q(archived_by=user)
+    
+    def get_related_documents(self, document: ArchivedDocument, user: User) -> List[Dict]:
+        """Похожие документы из предрассчитанного списка (без векторного поиска)"""
+        embedding = DocumentEmbedding.objects.filter(document=document).only('related_documents').first()
+        if embedding is None or not embedding.related_documents:
+            return []
+        
+        scores = {item['id']: item['score'] for item in embedding.related_documents}
+        access = self.access_filter(user)
+        if user.is_authenticated:
+            access |= Q(permissions__user=user, permissions__permission_type='view')
         
-        return similarities[:limit]
+        documents = ArchivedDocument.objects.select_related(
+            'original_file', 'category', 'archived_by'
+        ).filter(id__in=scores, status='archived').filter(access).distinct()
+        
+        return sorted(
+            ({'document': related, 'similarity': scores[related.id]} for related in documents),
+            key=lambda item: -item['similarity']
+        )
     
     def cosine_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """Вычисление косинусного сходства между векторами"""
@@ -825,6 +1569,91 @@ class ArchiveSearchService:
         ).exists()
 
 
+class RelatedDocumentsService:
+    """Предрасчет похожих документов (DocumentEmbedding.related_documents)"""
+    
+    def __init__(self, k: Optional[int] = None, block_size: Optional[int] = None):
+        self.k = k or getattr(settings, 'ARCHIVE_RELATED_DOCUMENTS_COUNT', 10)
+        self.block_size = block_size or getattr(settings, 'ARCHIVE_RELATED_BLOCK_SIZE', 512)
+    
+    def load_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Нормализованные векторы всех архивных документов"""
+        matrix, ids, _ = collect_vectors(BaseVectorIndex.iter_database_vectors())
+        return matrix, ids
+    
+    def compute(self, full: bool = False) -> Dict[str, int]:
+        """
+        Полный расчет или инкрементальный — только для документов без списка соседей
+        (similarity_score IS NULL) и для тех, к чьим спискам эти документы добавляются.
+        """
+        matrix, ids = self.load_vectors()
+        if ids.shape[0] == 0:
+            return {'documents': 0, 'updated': 0}
+        
+        if full:
+            updates = self._neighbors(matrix, ids, matrix, ids)
+        else:
+            pending = np.fromiter(
+                DocumentEmbedding.objects.filter(
+                    similarity_score__isnull=True,
+                    document__status='archived'
+                ).values_list('document_id', flat=True),
+                dtype=np.int64
+            )
+            pending_mask = np.isin(ids, pending)
+            if not pending_mask.any():
+                return {'documents': int(ids.shape[0]), 'updated': 0}
+            
+            new_matrix, new_ids = matrix[pending_mask], ids[pending_mask]
+            updates = self._neighbors(new_matrix, new_ids, matrix, ids)
+            
+            # Новые документы могут войти в списки уже обработанных
+            candidates = self._neighbors(matrix[~pending_mask], ids[~pending_mask], new_matrix, new_ids)
+            current = dict(
+                DocumentEmbedding.objects.filter(
+                    document_id__in=[int(document_id) for document_id in candidates]
+                ).values_list('document_id', 'related_documents')
+            )
+            for document_id, neighbors in candidates.items():
+                existing = current.get(document_id) or []
+                merged = merge_neighbors(existing, neighbors, self.k)
+                if merged != existing:
+                    updates[document_id] = merged
+        
+        self.save(updates)
+        return {'documents': int(ids.shape[0]), 'updated': len(updates)}
+    
+    def _neighbors(self, queries, query_ids, vectors, ids) -> Dict[int, List[Dict]]:
+        return {
+            query_id: [
+                {'id': int(neighbor_id), 'score': round(float(score), 6)}
+                for neighbor_id, score in zip(neighbor_ids, scores)
+            ]
+            for query_id, neighbor_ids, scores in blocked_nearest_neighbors(
+                queries, query_ids, vectors, ids, self.k, block_size=self.block_size
+            )
+        }
+    
+    def save(self, updates: Dict[int, List[Dict]], batch_size: int = 500):
+        """Запись списков соседей через bulk_update"""
+        embedding_ids = dict(
+            DocumentEmbedding.objects.filter(document_id__in=list(updates)).values_list('document_id', 'id')
+        )
+        embeddings = [
+            DocumentEmbedding(
+                id=embedding_ids[document_id],
+                related_documents=neighbors,
+                # Сходство с ближайшим документом
+                similarity_score=neighbors[0]['score'] if neighbors else 0.0
+            )
+            for document_id, neighbors in updates.items()
+            if document_id in embedding_ids
+        ]
+        DocumentEmbedding.objects.bulk_update(
+            embeddings, ['related_documents', 'similarity_score'], batch_size=batch_size
+        )
+
+
 class ArchiveAnalyticsService:
     """Сервис аналитики архива"""
     
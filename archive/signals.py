@@ -3,6 +3,7 @@ Django signals for archive app.
 Handles automatic operations like metadata extraction, AI analysis, etc.
 """
 
+from django.db import transaction
 from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
@@ -12,8 +13,10 @@ from .models import (
     ArchivingJob, 
     AIAnalysisResult,
     AutoArchivingRule,
-    ArchiveActivity
+    ArchiveActivity,
+    DocumentEmbedding
 )
+from .search import get_lexical_index, get_vector_index
 from .services import AutoArchivingService
 
 
@@ -97,6 +100,85 @@ def archived_document_deleting(sender, instance, **kwargs):
     )
 
 
+@receiver(post_delete, sender=ArchivedDocument)
+def archived_document_deleted(sender, instance, **kwargs):
+    """
+    Удаление документа из полнотекстового индекса.
+    """
+    index = get_lexical_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.id
+    transaction.on_commit(lambda: index.remove(document_id))
+
+
+@receiver(post_save, sender=ArchivedDocument)
+def archived_document_saved(sender, instance, **kwargs):
+    """
+    Переиндексация имени и тегов документа в полнотекстовом индексе.
+    """
+    index = get_lexical_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.id
+    transaction.on_commit(lambda: index.refresh_document(document_id))
+
+
+@receiver(post_save, sender=DocumentEmbedding)
+def document_embedding_saved(sender, instance, **kwargs):
+    """
+    Инкрементальное обновление векторного индекса после сохранения embedding.
+    """
+    index = get_vector_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.document_id
+    vector = instance.get_content_vector()
+    transaction.on_commit(lambda: index.add(document_id, vector))
+
+
+@receiver(post_save, sender=DocumentEmbedding)
+def document_embedding_text_saved(sender, instance, **kwargs):
+    """
+    Переиндексация ключевых слов и текста документа в полнотекстовом индексе.
+    """
+    index = get_lexical_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.document_id
+    transaction.on_commit(lambda: index.refresh_document(document_id))
+
+
+@receiver(post_delete, sender=DocumentEmbedding)
+def document_embedding_deleted(sender, instance, **kwargs):
+    """
+    Удаление документа из векторного индекса.
+    """
+    index = get_vector_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.document_id
+    transaction.on_commit(lambda: index.remove(document_id))
+
+
+@receiver(post_delete, sender=DocumentEmbedding)
+def document_embedding_text_deleted(sender, instance, **kwargs):
+    """
+    Переиндексация документа без ключевых слов и текста.
+    """
+    index = get_lexical_index(sync=False)
+    if not index.is_built:
+        return
+
+    document_id = instance.document_id
+    transaction.on_commit(lambda: index.refresh_document(document_id))
+
+
 @receiver(post_save, sender=AutoArchivingRule)
 def auto_rule_status_changed(sender, instance, **kwargs):
     """
@@ -13,8 +13,9 @@ from .models import (
     ArchivedDocument, AutoArchivingRule, ArchivingJob,
     ArchiveActivity, AIAnalysisResult, DocumentEmbedding
 )
-from .services import AutoArchivingService, ArchiveAnalyticsService
+from .services import AutoArchivingService, ArchiveAnalyticsService, RelatedDocumentsService
 from filemanager.models import FileItem
+from filemanager.services.blobstore import get_blob_store
 
 logger = logging.getLogger(__name__)
 
@@ -193,6 +194,22 @@ def create_document_embedding(document_id):
         return {'success': False, 'error': str(e)}
 
 
+@shared_task
+def compute_related_documents(full=False):
+    """
+    Предрасчет похожих документов для DocumentEmbedding.related_documents.
+    По умолчанию обрабатываются только новые документы.
+    """
+    try:
+        result = RelatedDocumentsService().compute(full=full)
+        logger.info(f"Related documents computed: {result}")
+        return {'success': True, **result}
+        
+    except Exception as e:
+        logger.error(f"Error computing related documents: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
 @shared_task
 def cleanup_expired_documents():
     """
@@ -242,6 +259,20 @@ def cleanup_old_activities():
         return {'success': False, 'error': str(e)}
 
 
+@shared_task
+def collect_blob_garbage():
+    """
+    Удаление блобов содержимого, на которые не ссылается ни одна версия файла.
+    """
+    try:
+        result = get_blob_store().collect_garbage()
+        return {'success': True, **result}
+        
+    except Exception as e:
+        logger.error(f"Error collecting blob garbage: {str(e)}")
+        return {'success': False, 'error': str(e)}
+
+
 @shared_task
 def generate_analytics_report():
     """
@@ -0,0 +1,914 @@
+import asyncio
+import os
+import tempfile
+from unittest.mock import AsyncMock, Mock, patch
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from filemanager.models import ContentBlob, FileItem
+from .embedding_cache import EmbeddingCache
+from .embeddings import DocumentEmbeddingPipeline
+from .models import (
+    AIAnalysisResult, ArchiveActivity, ArchiveCategory, ArchivedDocument, ArchivingJob, ArchivingJobError,
+    DocumentEmbedding, RetentionPolicy
+)
+
+from .search.benchmark import recall_at_k, sample_queries
+from .search.codec import HEADER_SIZE, pack_vector, unpack_vector, vector_dimension
+from .search.index import VectorIndex, normalize_vector
+from .search.ivf import IVFIndex
+from .search.lexical import LexicalIndex, document_terms, reciprocal_rank_fusion
+from .search.neighbors import blocked_nearest_neighbors, merge_neighbors
+from .search.quantization import ProductQuantizer, QuantizedIndex, ScalarQuantizer
+from .search.text import extract_keywords, tokenize
+from .progress import JobProgressReporter, archiving_job_group
+from .services import ArchiveSearchService, ArchivingPipeline, AutoArchivingService, BulkArchiver
+
+
+class VectorIndexTest(SimpleTestCase):
+    """Тесты для векторного индекса архива"""
+
+    def setUp(self):
+        self.index = VectorIndex(initial_capacity=2)
+        self.index.build([
+            (1, [1.0, 0.0, 0.0]),
+            (2, [0.0, 1.0, 0.0]),
+            (3, [0.7, 0.7, 0.0]),
+        ])
+
+    def test_normalize_vector(self):
+        """Тест L2-нормализации"""
+        vector = normalize_vector([3.0, 4.0])
+        self.assertAlmostEqual(float(np.linalg.norm(vector)), 1.0, places=6)
+        self.assertEqual(vector.dtype, np.float32)
+        self.assertIsNone(normalize_vector([0.0, 0.0]))
+        self.assertIsNone(normalize_vector([]))
+
+    def test_search_orders_by_similarity(self):
+        """Тест сортировки результатов по косинусному сходству"""
+        results = self.index.search([1.0, 0.1, 0.0], k=2)
+        self.assertEqual([document_id for document_id, _ in results], [1, 3])
+        self.assertGreater(results[0][1], results[1][1])
+
+    def test_search_threshold(self):
+        """Тест порога сходства"""
+        results = self.index.search([1.0, 0.0, 0.0], k=10, threshold=0.5)
+        self.assertEqual({document_id for document_id, _ in results}, {1, 3})
+
+    def test_incremental_add_and_update(self):
+        """Тест инкрементального добавления и обновления"""
+        self.assertTrue(self.index.add(4, [0.0, 0.0, 1.0]))
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search([0.0, 0.0, 1.0], k=1)[0][0], 4)
+
+        # Повторное добавление обновляет строку, а не создает дубликат
+        self.index.add(4, [1.0, 0.0, 0.0])
+        self.assertEqual(len(self.index), 4)
+        self.assertNotEqual(self.index.search([0.0, 0.0, 1.0], k=1)[0][0], 4)
+
+    def test_remove_keeps_positions_consistent(self):
+        """Тест удаления с переносом последней строки"""
+        self.assertTrue(self.index.remove(1))
+        self.assertFalse(self.index.remove(1))
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn(1, self.index)
+
+        results = self.index.search([0.0, 1.0, 0.0], k=1)
+        self.assertEqual(results[0][0], 2)
+        results = self.index.search([0.7, 0.7, 0.0], k=1)
+        self.assertEqual(results[0][0], 3)
+
+    def test_search_with_allowed_ids(self):
+        """Тест фильтрации результатов по множеству доступных документов"""
+        results = self.index.search([1.0, 0.1, 0.0], k=3, allowed_ids=np.array([2, 3], dtype=np.int64))
+        self.assertEqual([document_id for document_id, _ in results], [3, 2])
+        self.assertEqual(self.index.search([1.0, 0.0, 0.0], allowed_ids=np.array([], dtype=np.int64)), [])
+
+    def test_iter_search_yields_partial_results(self):
+        """Тест промежуточных результатов поиска по шардам"""
+        steps = list(self.index.iter_search([1.0, 0.1, 0.0], k=2, shard_size=1))
+        self.assertEqual([(shard, shards) for shard, shards, _ in steps], [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual([document_id for document_id, _ in steps[0][2]], [1])
+        self.assertEqual(steps[-1][2], self.index.search([1.0, 0.1, 0.0], k=2))
+
+    def test_dimension_mismatch_is_rejected(self):
+        """Тест отклонения векторов другой размерности"""
+        self.assertFalse(self.index.add(5, [1.0, 0.0]))
+        self.assertEqual(self.index.search([1.0, 0.0], k=5), [])
+
+
+class VectorCodecTest(SimpleTestCase):
+    """Тесты для бинарного формата хранения векторов"""
+
+    def test_float32_roundtrip(self):
+        """Тест упаковки и распаковки float32"""
+        vector = [0.25, -1.5, 3.0]
+        packed = pack_vector(vector)
+        self.assertEqual(len(packed), HEADER_SIZE + 3 * 4)
+        self.assertEqual(vector_dimension(packed), 3)
+
+        unpacked = unpack_vector(packed)
+        self.assertEqual(unpacked.dtype, np.float32)
+        np.testing.assert_array_equal(unpacked, np.asarray(vector, dtype=np.float32))
+
+    def test_unpack_does_not_copy(self):
+        """Тест распаковки без копирования буфера"""
+        packed = pack_vector([1.0, 2.0])
+        unpacked = unpack_vector(memoryview(packed))
+        self.assertFalse(unpacked.flags.writeable)
+        self.assertFalse(unpacked.flags.owndata)
+
+    def test_float16_storage(self):
+        """Тест компактного float16 формата"""
+        packed = pack_vector([0.5] * 768, dtype='float16')
+        self.assertEqual(len(packed), HEADER_SIZE + 768 * 2)
+        self.assertEqual(unpack_vector(packed).dtype, np.float16)
+
+    def test_invalid_payload(self):
+        """Тест обработки поврежденных данных"""
+        with self.assertRaises(ValueError):
+            unpack_vector(b'xx')
+        with self.assertRaises(ValueError):
+            unpack_vector(pack_vector([1.0, 2.0])[:-1])
+        with self.assertRaises(ValueError):
+            pack_vector([1.0], dtype='int8')
+
+
+class IVFIndexTest(SimpleTestCase):
+    """Тесты для IVF индекса"""
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        centers = rng.normal(size=(8, 16))
+        vectors = np.repeat(centers, 50, axis=0) + rng.normal(scale=0.05, size=(400, 16))
+        self.items = list(enumerate(vectors.astype(np.float32), start=1))
+        self.index = IVFIndex(nlist=8, nprobe=2)
+        self.index.build(self.items)
+        self.exact = VectorIndex()
+        self.exact.build(self.items)
+
+    def test_build_partitions_all_vectors(self):
+        """Тест раскладки всех векторов по спискам"""
+        self.assertEqual(len(self.index), 400)
+        self.assertEqual(self.index.list_count, 8)
+        self.assertIn(1, self.index)
+
+    def test_recall_against_exact_search(self):
+        """Тест recall@k относительно точного поиска"""
+        queries = sample_queries(self.exact._matrix[:len(self.exact)], 20)
+        result = recall_at_k(self.index, self.exact, queries, k=10)
+        self.assertGreaterEqual(result['recall'], 0.9)
+
+        full_probe = recall_at_k(self.index, self.exact, queries, k=10, nprobe=8)
+        self.assertEqual(full_probe['recall'], 1.0)
+
+    def test_incremental_add_and_remove(self):
+        """Тест буфера новых документов и удаления"""
+        self.index.add(1000, [1.0] * 16)
+        results = self.index.search([1.0] * 16, k=1)
+        self.assertEqual(results[0][0], 1000)
+
+        target = self.items[0][1]
+        self.assertEqual(self.index.search(target, k=1)[0][0], 1)
+        self.assertTrue(self.index.remove(1))
+        self.assertNotIn(1, self.index)
+        self.assertNotIn(1, [document_id for document_id, _ in self.index.search(target, k=5)])
+        self.assertEqual(len(self.index), 400)
+
+    def test_update_replaces_listed_vector(self):
+        """Тест обновления вектора документа, уже лежащего в списке"""
+        self.index.add(1, [-1.0] * 16)
+        ids = [document_id for document_id, _ in self.index.search([-1.0] * 16, k=3)]
+        self.assertEqual(ids.count(1), 1)
+        self.assertEqual(ids[0], 1)
+        self.assertEqual(len(self.index), 400)
+
+    def test_search_with_allowed_ids(self):
+        """Тест фильтрации списков и буфера по доступным документам"""
+        self.index.add(1000, [1.0] * 16)
+        allowed_ids = np.arange(2, 400, 2, dtype=np.int64)
+        results = self.index.search(self.items[0][1], k=10, allowed_ids=allowed_ids, nprobe=8)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(document_id % 2 == 0 for document_id, _ in results))
+        self.assertNotIn(1000, [document_id for document_id, _ in self.index.search([1.0] * 16, k=5, allowed_ids=allowed_ids)])
+
+    def test_save_and_load_with_mmap(self):
+        """Тест сохранения и загрузки индекса через mmap"""
+        with tempfile.TemporaryDirectory() as storage_dir:
+            self.index.save(storage_dir)
+            loaded = IVFIndex(nprobe=2)
+            self.assertTrue(loaded.load(storage_dir))
+            self.assertIsInstance(loaded._vectors, np.memmap)
+
+            query = self.items[10][1]
+            self.assertEqual(loaded.search(query, k=5), self.index.search(query, k=5))
+            self.assertFalse(IVFIndex().load(f'{storage_dir}/missing'))
+
+
+class TextProcessingTest(SimpleTestCase):
+    """Тесты токенизации и ключевых слов"""
+
+    def test_tokenize_skips_stop_words_and_numbers(self):
+        """Тест токенизации"""
+        self.assertEqual(tokenize('Это отчет for 2024 Report'), ['отчет', 'report'])
+
+    def test_extract_keywords_by_frequency(self):
+        """Тест выбора самых частых слов"""
+        self.assertEqual(extract_keywords('договор аренда договор склад договор аренда', limit=2), ['договор', 'аренда'])
+
+
+@override_settings(ARCHIVE_EMBEDDING_BATCH_SIZE=2)
+class DocumentEmbeddingPipelineTest(SimpleTestCase):
+    """Тесты пакетного построения embeddings"""
+
+    def setUp(self):
+        self.ai_service = Mock(embedding_model='test-embed')
+        self.ai_service.get_text_embeddings = AsyncMock(
+            side_effect=lambda texts: [[float(i + 1), 1.0] for i in range(len(texts))]
+        )
+        self.cache = EmbeddingCache(max_entries=100)
+        self.pipeline = DocumentEmbeddingPipeline(self.ai_service, cache=self.cache)
+        self.documents = [
+            ArchivedDocument(id=i, original_file=FileItem(name=f'report{i}.bin'), metadata={'n': i}, tags=['отчет'])
+            for i in range(1, 6)
+        ]
+
+    @patch.object(DocumentEmbeddingPipeline, 'save_embeddings')
+    def test_documents_are_embedded_in_batches(self, save_embeddings):
+        """Тест: один запрос к модели и одно сохранение на пакет"""
+        created = asyncio.run(self.pipeline.embed_documents(self.documents))
+
+        self.assertEqual(created, 5)
+        self.assertEqual(self.ai_service.get_text_embeddings.await_count, 3)
+        self.assertEqual(save_embeddings.call_count, 3)
+
+        # Контент и метаданные пакета отправляются вместе
+        first_texts = self.ai_service.get_text_embeddings.await_args_list[0].args[0]
+        self.assertEqual(len(first_texts), 4)
+
+        embedding = save_embeddings.call_args_list[0].args[0][0]
+        self.assertEqual(embedding.embedding_model, 'test-embed')
+        self.assertEqual(list(embedding.get_content_vector()), [1.0, 1.0])
+        self.assertEqual(list(embedding.get_metadata_vector()), [3.0, 1.0])
+        self.assertIn('отчет', embedding.keywords)
+
+    @patch.object(DocumentEmbeddingPipeline, 'save_embeddings')
+    def test_missing_embeddings_are_skipped(self, save_embeddings):
+        """Тест пропуска документов без embedding"""
+        self.ai_service.get_text_embeddings = AsyncMock(return_value=[None, [1.0, 0.0], None, None])
+        created = asyncio.run(self.pipeline.embed_documents(self.documents[:2]))
+
+        self.assertEqual(created, 1)
+        self.assertEqual(save_embeddings.call_args.args[0][0].document_id, 2)
+
+    @patch('archive.embeddings.read_file_text', return_value='содержимое договора')
+    @patch.object(DocumentEmbeddingPipeline, 'save_embeddings')
+    def test_duplicates_and_reruns_use_cache(self, save_embeddings, read_file_text):
+        """Тест: одинаковые файлы и повторная обработка не обращаются к модели"""
+        first = ArchivedDocument(id=10, original_file=FileItem(name='a.txt'), metadata={'n': 1}, checksum='c' * 64)
+        duplicate = ArchivedDocument(id=11, original_file=FileItem(name='b.txt'), metadata={'n': 1}, checksum='c' * 64)
+
+        asyncio.run(self.pipeline.embed_documents([first]))
+        self.assertEqual(self.ai_service.get_text_embeddings.await_count, 1)
+
+        self.assertEqual(asyncio.run(self.pipeline.embed_documents([duplicate, first])), 2)
+        self.assertEqual(self.ai_service.get_text_embeddings.await_count, 1)
+        self.assertEqual(read_file_text.call_count, 1)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['memory_hits'], 4)
+        self.assertEqual(stats['misses'], 2)
+
+
+class EmbeddingCacheTest(SimpleTestCase):
+    """Тесты кэша embeddings"""
+
+    def test_lru_eviction(self):
+        """Тест вытеснения давно не использованных записей"""
+        cache = EmbeddingCache(max_entries=2)
+        cache.set('a', 'model', '1.0', {'vector': b'a'})
+        cache.set('b', 'model', '1.0', {'vector': b'b'})
+        cache.get('a', 'model', '1.0')
+        cache.set('c', 'model', '1.0', {'vector': b'c'})
+
+        self.assertIsNotNone(cache.get('a', 'model', '1.0'))
+        self.assertIsNone(cache.get('b', 'model', '1.0'))
+        self.assertEqual(cache.stats()['entries'], 2)
+
+    def test_key_includes_model_and_version(self):
+        """Тест разделения записей разных моделей и версий"""
+        cache = EmbeddingCache()
+        cache.set('a', 'model', '1.0', {'vector': b'a'})
+        self.assertIsNone(cache.get('a', 'model', '2.0'))
+        self.assertIsNone(cache.get('a', 'other', '1.0'))
+
+    @override_settings(CACHES={'embeddings': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_shared_tier(self):
+        """Тест второго уровня кэша, общего для процессов"""
+        writer = EmbeddingCache(shared_alias='embeddings')
+        writer.set('a', 'model', '1.0', {'vector': b'a'})
+
+        reader = EmbeddingCache(shared_alias='embeddings')
+        self.assertEqual(reader.get('a', 'model', '1.0'), {'vector': b'a'})
+        self.assertEqual(reader.stats()['shared_hits'], 1)
+        reader.get('a', 'model', '1.0')
+        self.assertEqual(reader.stats()['memory_hits'], 1)
+
+
+class LexicalIndexTest(SimpleTestCase):
+    """Тесты полнотекстового индекса BM25"""
+
+    def setUp(self):
+        self.index = LexicalIndex()
+        self.index.build([
+            (1, document_terms('договор_аренды_2023.pdf', ['договор'], ['аренда'], 'договор аренды склада')),
+            (2, document_terms('отчет.docx', ['отчет'], ['финансы'], 'финансовый отчет за квартал, аренда офиса')),
+            (3, document_terms('договор_поставки.pdf', ['договор'], ['поставка'], 'договор поставки оборудования')),
+        ])
+
+    def test_bm25_ranking(self):
+        """Тест ранжирования по BM25"""
+        results = self.index.search('договор аренды')
+        self.assertEqual(results[0][0], 1)
+        self.assertEqual({document_id for document_id, _ in results}, {1, 3})
+        self.assertEqual(self.index.search('2023')[0][0], 1)
+        self.assertEqual(self.index.search('неизвестное'), [])
+
+    def test_incremental_updates(self):
+        """Тест добавления, обновления и удаления документов"""
+        self.index.add(4, document_terms('аренда.txt', [], [], 'аренда аренда аренда'))
+        self.assertEqual(self.index.search('аренда')[0][0], 4)
+
+        self.index.add(4, document_terms('счет.txt', [], [], 'счет'))
+        self.assertNotIn(4, [document_id for document_id, _ in self.index.search('аренда')])
+
+        self.assertTrue(self.index.remove(4))
+        self.assertEqual(self.index.search('счет'), [])
+        self.assertNotIn('счет', self.index._postings)
+        self.assertEqual(len(self.index), 3)
+
+    def test_search_with_allowed_ids(self):
+        """Тест фильтрации по доступным документам"""
+        results = self.index.search('договор', allowed_ids=np.array([3], dtype=np.int64))
+        self.assertEqual([document_id for document_id, _ in results], [3])
+
+    def test_reciprocal_rank_fusion(self):
+        """Тест объединения ранжированных списков"""
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+        self.assertEqual([document_id for document_id, _ in fused], [1, 3, 2])
+
+
+class NearestNeighborsTest(SimpleTestCase):
+    """Тесты блочного поиска ближайших соседей"""
+
+    def test_blocked_matches_full_matrix(self):
+        """Тест: результат не зависит от размера блоков"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(50, 8)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        ids = np.arange(100, 150, dtype=np.int64)
+
+        full = {
+            query_id: list(neighbor_ids)
+            for query_id, neighbor_ids, _ in blocked_nearest_neighbors(vectors, ids, vectors, ids, 5, 64, 64)
+        }
+        blocked = {
+            query_id: list(neighbor_ids)
+            for query_id, neighbor_ids, _ in blocked_nearest_neighbors(vectors, ids, vectors, ids, 5, 7, 3)
+        }
+        self.assertEqual(full, blocked)
+
+        scores = vectors @ vectors.T
+        np.fill_diagonal(scores, -np.inf)
+        expected = list(ids[np.argsort(-scores[0])[:5]])
+        self.assertEqual(full[100], expected)
+        self.assertNotIn(100, full[100])
+
+    def test_fewer_vectors_than_k(self):
+        """Тест: соседей меньше k"""
+        vectors = np.eye(2, dtype=np.float32)
+        ids = np.array([1, 2], dtype=np.int64)
+        results = list(blocked_nearest_neighbors(vectors, ids, vectors, ids, 5))
+        self.assertEqual([list(neighbor_ids) for _, neighbor_ids, _ in results], [[2], [1]])
+
+    def test_merge_neighbors(self):
+        """Тест слияния списков соседей"""
+        current = [{'id': 1, 'score': 0.9}, {'id': 2, 'score': 0.5}]
+        merged = merge_neighbors(current, [{'id': 3, 'score': 0.7}, {'id': 2, 'score': 0.6}], k=2)
+        self.assertEqual([item['id'] for item in merged], [1, 3])
+
+
+class QuantizedIndexTest(SimpleTestCase):
+    """Тесты для сжатых индексов (int8, PQ)"""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        centers = rng.normal(size=(8, 32))
+        vectors = np.repeat(centers, 50, axis=0) + rng.normal(scale=0.3, size=(400, 32))
+        self.items = list(enumerate(vectors.astype(np.float32), start=1))
+        self.stored = {document_id: vector for document_id, vector in self.items}
+        self.exact = VectorIndex()
+        self.exact.build(self.items)
+        self.queries = sample_queries(self.exact._matrix[:len(self.exact)], 20)
+
+    def load_vectors(self, document_ids):
+        return {document_id: self.stored[document_id] for document_id in document_ids if document_id in self.stored}
+
+    def build(self, method, **options):
+        index = QuantizedIndex(method=method, min_train=100, vector_loader=self.load_vectors, **options)
+        index.build(self.items)
+        return index
+
+    def test_quantizers_reconstruct_vectors(self):
+        """Тест точности восстановления векторов из кодов"""
+        matrix = self.exact._matrix[:len(self.exact)]
+        scalar = ScalarQuantizer(32)
+        scalar.train(matrix)
+        self.assertLess(np.abs(scalar.decode(scalar.encode(matrix)) - matrix).max(), 0.01)
+
+        product = ProductQuantizer(32, subspaces=8)
+        product.train(matrix)
+        codes = product.encode(matrix)
+        self.assertEqual(codes.shape, (400, 8))
+        self.assertEqual(codes.dtype, np.uint8)
+        # Асимметричная оценка совпадает со скалярным произведением на восстановленный вектор
+        query = normalize_vector(self.queries[0])
+        np.testing.assert_allclose(product.score(codes, query), product.decode(codes) @ query, atol=1e-4)
+
+    def test_subspaces_fit_dimension(self):
+        """Тест выбора делителя размерности для PQ"""
+        self.assertEqual(ProductQuantizer(768, subspaces=96).subspaces, 96)
+        self.assertEqual(ProductQuantizer(100, subspaces=96).subspaces, 50)
+
+    def test_recall_with_rerank(self):
+        """Тест recall@k после точного пересчета кандидатов"""
+        for method, options in [('int8', {}), ('pq', {'subspaces': 8})]:
+            with self.subTest(method=method):
+                index = self.build(method, rerank_factor=4, **options)
+                self.assertTrue(index.is_trained)
+                result = recall_at_k(index, self.exact, self.queries, k=10)
+                self.assertGreaterEqual(result['recall'], 0.95)
+
+                # Оценки после пересчета точные
+                document_id, score = index.search(self.queries[0], k=1)[0]
+                expected = dict(self.exact.search(self.queries[0], k=400))[document_id]
+                self.assertAlmostEqual(score, expected, places=5)
+
+    def test_memory_savings(self):
+        """Тест объема памяти сжатых индексов"""
+        int8 = self.build('int8')
+        pq = self.build('pq', subspaces=8)
+        self.assertLess(int8.memory_bytes, self.exact.memory_bytes)
+        self.assertLess(pq._matrix[:len(pq)].nbytes, int8._matrix[:len(int8)].nbytes)
+        self.assertEqual(pq._matrix[:len(pq)].nbytes, 400 * 8)
+
+    def test_untrained_index_is_exact(self):
+        """Тест хранения без сжатия до накопления выборки для обучения"""
+        index = QuantizedIndex(method='pq', subspaces=8, min_train=500, vector_loader=self.load_vectors)
+        index.build(self.items)
+        self.assertFalse(index.is_trained)
+        self.assertEqual(index.search(self.queries[0], k=5), self.exact.search(self.queries[0], k=5))
+
+        for document_id in range(1000, 1100):
+            self.stored[document_id] = self.items[document_id % 400][1]
+            index.add(document_id, self.stored[document_id])
+        self.assertTrue(index.is_trained)
+        self.assertEqual(len(index), 500)
+        self.assertEqual(index._matrix.dtype, np.uint8)
+
+    def test_incremental_add_remove_and_threshold(self):
+        """Тест добавления, удаления и порога сходства"""
+        index = self.build('int8')
+        self.stored[1000] = np.ones(32, dtype=np.float32)
+        index.add(1000, self.stored[1000])
+        self.assertEqual(index.search(np.ones(32), k=1)[0][0], 1000)
+
+        target = self.items[0][1]
+        self.assertEqual(index.search(target, k=1)[0][0], 1)
+        self.assertTrue(index.remove(1))
+        self.assertNotIn(1, [document_id for document_id, _ in index.search(target, k=5)])
+
+        results = index.search(target, k=10, threshold=0.99)
+        self.assertTrue(all(score >= 0.99 for _, score in results))
+
+
+class BulkArchiverTest(TestCase):
+    """Тесты пакетного архивирования"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('archivist', password='x')
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        self.contracts = ArchiveCategory.objects.create(
+            name='Contracts', retention_policy=policy, created_by=self.user,
+            auto_rules={'file_extensions': ['.pdf'], 'filename_keywords': ['contract']}
+        )
+        self.general = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=self.user)
+        self.archiver = BulkArchiver(chunk_size=3)
+
+    def files(self, *names):
+        # Без сигналов post_save приложения filemanager
+        return FileItem.objects.bulk_create([
+            FileItem(name=name, path=f'missing/{name}', owner=self.user, mime_type='application/pdf')
+            for name in names
+        ])
+
+    def test_bulk_archive(self):
+        """Тест категоризации, журнала, срока хранения и ошибок по отдельным файлам"""
+        contract, photo, report = self.files('contract_2024.pdf', 'photo.pdf', 'report.pdf')
+        self.archiver.archive([report], self.user)
+
+        results = self.archiver.archive([contract, photo, report, contract], self.user)
+        self.assertEqual(results['total'], 4)
+        self.assertEqual(
+            {item['file_name']: item['category'] for item in results['success']},
+            {'contract_2024.pdf': 'Contracts', 'photo.pdf': 'General'}
+        )
+        self.assertEqual([item['file_id'] for item in results['errors']], [report.id, contract.id])
+
+        document = ArchivedDocument.objects.get(original_file=contract)
+        self.assertEqual(document.status, 'archived')
+        self.assertIsNotNone(document.retention_date)
+        self.assertEqual(
+            sorted(ArchiveActivity.objects.filter(document=document).values_list('activity_type', flat=True)),
+            ['archived', 'document_archived']
+        )
+
+    def test_queries_do_not_grow_with_batch(self):
+        """Тест: число запросов на часть не зависит от числа файлов в ней"""
+        archiver = BulkArchiver(chunk_size=100)
+        with CaptureQueriesContext(connection) as small:
+            archiver.archive(self.files('a.pdf', 'b.pdf'), self.user)
+        with CaptureQueriesContext(connection) as large:
+            archiver.archive(self.files(*[f'file{index}.pdf' for index in range(10)]), self.user)
+        self.assertEqual(len(small), len(large))
+
+    def test_failed_chunk_is_retried_per_file(self):
+        """Тест: ошибка записи части — файлы записываются по одному, проблемный попадает в errors"""
+        files = self.files('a.pdf', 'bad.pdf', 'c.pdf')
+        insert = self.archiver._insert
+
+        def failing_insert(documents, user):
+            if any(document.original_file.name == 'bad.pdf' for document in documents):
+                raise IntegrityError('constraint failed')
+            insert(documents, user)
+
+        with patch.object(self.archiver, '_insert', side_effect=failing_insert):
+            results = self.archiver.archive(files, self.user)
+
+        self.assertEqual([item['file_name'] for item in results['success']], ['a.pdf', 'c.pdf'])
+        self.assertEqual([item['file_name'] for item in results['errors']], ['bad.pdf'])
+        self.assertEqual(ArchivedDocument.objects.count(), 2)
+        self.assertEqual(ArchiveActivity.objects.count(), 4)
+
+    def test_identical_content_is_analyzed_once(self):
+        """Тест: одинаковые файлы анализируются один раз, в том числе при повторном архивировании"""
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root, BLOB_STORE_ROOT=os.path.join(media_root, 'blobs')
+        ):
+            names = ('first.txt', 'second.txt', 'third.txt')
+            for name in names:
+                with open(os.path.join(media_root, name), 'w') as f:
+                    f.write('quarterly report')
+            files = FileItem.objects.bulk_create([
+                FileItem(name=name, path=name, owner=self.user, mime_type='text/plain') for name in names
+            ])
+            analyzer = self.archiver.categorizer.content_analyzer
+            with patch.object(analyzer, 'analyze', AsyncMock(return_value={'summary': 'report'})) as analyze:
+                results = self.archiver.archive(files[:2], self.user)
+                repeated = self.archiver.archive(files[2:], self.user)
+
+            self.assertEqual((len(results['success']), len(repeated['success'])), (2, 1))
+            analyze.assert_called_once()
+            self.assertEqual(
+                list(ArchivedDocument.objects.values_list('ai_analysis', flat=True)),
+                [{'summary': 'report'}] * 3
+            )
+            # Содержимое архива не копируется в хранилище блобов
+            self.assertFalse(ContentBlob.objects.exists())
+
+
+    def test_chunk_contents_are_analyzed_concurrently(self):
+        """Тест: ИИ анализ файлов части идет одновременно, а не по одному файлу"""
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            names = [f'note{number}.txt' for number in range(4)]
+            for name in names:
+                with open(os.path.join(media_root, name), 'w') as f:
+                    f.write(f'content of {name}')
+            files = FileItem.objects.bulk_create([
+                FileItem(name=name, path=name, owner=self.user, mime_type='text/plain') for name in names
+            ])
+            running = []
+            peak = []
+
+            async def analyze(chunks, analysis_type, model=None, language='auto'):
+                running.append(analysis_type)
+                peak.append(len(running))
+                await asyncio.sleep(0.05)
+                running.pop()
+                return {'summary': ''.join(chunks)}
+
+            analyzer = self.archiver.categorizer.content_analyzer
+            analyzer.concurrency = 4
+            with patch.object(analyzer, 'analyze', side_effect=analyze):
+                results = self.archiver.archive(files, self.user)
+
+            self.assertEqual(len(results['success']), 4)
+            # Часть — 3 файла
+            self.assertEqual(max(peak), 3)
+            self.assertEqual(
+                sorted(ArchivedDocument.objects.values_list('ai_analysis__summary', flat=True)),
+                [f'content of {name}' for name in names]
+            )
+
+
+class ArchivedDocumentSearchAPITest(APITestCase):
+    """Тесты поиска в списке архивных документов"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='x')
+        owner = User.objects.create_user('owner', password='x')
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        category = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=owner)
+        files = FileItem.objects.bulk_create([
+            FileItem(name=name, path=name, owner=owner) for name in ('lease.pdf', 'secret.pdf', 'lease_scan.pdf')
+        ])
+        self.public, self.private, self.scan = [
+            ArchivedDocument.objects.create(
+                original_file=file_item, category=category, archived_by=owner, access_level=access_level, status='archived'
+            )
+            for file_item, access_level in zip(files, ('public', 'confidential', 'public'))
+        ]
+        self.index = LexicalIndex()
+        self.index.build([
+            (self.private.id, document_terms('secret.pdf', [], [], 'аренда аренда аренда')),
+            (self.public.id, document_terms('lease.pdf', [], [], 'аренда склада')),
+            (self.scan.id, document_terms('lease_scan.pdf', [], [], '')),
+        ])
+        self.client.force_authenticate(user=self.user)
+
+    def search(self, query):
+        with patch('archive.views.get_lexical_index', return_value=self.index):
+            response = self.client.get('/api/v1/archive/documents/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        return [item['id'] for item in results.get('results', results)]
+
+    def test_search_ranks_visible_documents(self):
+        """Тест: недоступные пользователю документы не занимают места в выдаче, имя файла ищется по индексу"""
+        with patch.object(self.index, 'search', wraps=self.index.search) as search:
+            self.assertEqual(self.search('аренда'), [self.public.id])
+        self.assertEqual(list(search.call_args.kwargs['allowed_ids']), sorted([self.public.id, self.scan.id]))
+        self.assertEqual(sorted(self.search('lease')), sorted([self.public.id, self.scan.id]))
+        self.assertEqual(self.search('scan'), [self.scan.id])
+
+    def test_hybrid_search_computes_visible_documents_once(self):
+        """Тест: доступные документы вычисляются один раз на запрос и передаются обоим индексам"""
+        service = ArchiveSearchService()
+        vector_index = VectorIndex()
+        vector_index.build([(self.public.id, [1.0, 0.0]), (self.private.id, [1.0, 0.1])])
+        with patch('archive.services.get_vector_index', return_value=vector_index), \
+                patch('archive.services.get_lexical_index', return_value=self.index), \
+                patch.object(service, 'get_visible_document_ids', wraps=service.get_visible_document_ids) as visible, \
+                patch.object(vector_index, 'search', wraps=vector_index.search) as vector_search, \
+                patch.object(self.index, 'search', wraps=self.index.search) as lexical_search:
+            results = service._find_similar_documents([1.0, 0.0], self.user, 10, None, 0.0, 'аренда')
+
+        visible.assert_called_once_with(self.user, None)
+        self.assertIs(vector_search.call_args.kwargs['allowed_ids'], lexical_search.call_args.kwargs['allowed_ids'])
+        self.assertEqual([result['document'].id for result in results], [self.public.id])
+
+
+class IndexRefreshTest(TestCase):
+    """Тесты синхронизации индексов с изменениями других процессов"""
+
+    def setUp(self):
+        user = User.objects.create_user('indexer', password='x')
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        category = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=user)
+        files = FileItem.objects.bulk_create([
+            FileItem(name=name, path=name, owner=user) for name in ('kept.txt', 'deleted.txt')
+        ])
+        self.kept, self.deleted = [
+            ArchivedDocument.objects.create(original_file=file_item, category=category, archived_by=user, status='archived')
+            for file_item in files
+        ]
+        DocumentEmbedding.objects.bulk_create([
+            DocumentEmbedding(document=document, content_vector=pack_vector([1.0, float(number)]))
+            for number, document in enumerate((self.kept, self.deleted))
+        ])
+
+    def test_refresh_removes_deleted_documents(self):
+        """Тест: документы, удаленные в другом процессе, пропадают из индексов при обновлении"""
+        indexes = [VectorIndex(), IVFIndex(nlist=1), LexicalIndex()]
+        with patch('archive.search.ivf.IVFIndex.load', return_value=False):
+            for index in indexes:
+                index.load_from_database()
+        self.assertTrue(all(self.deleted.id in index for index in indexes))
+
+        # Удаление в обход сигналов, как в другом процессе
+        DocumentEmbedding.objects.filter(document=self.deleted).delete()
+        ArchiveActivity.objects.filter(document=self.deleted).delete()
+        ArchivedDocument.objects.filter(id=self.deleted.id)._raw_delete(ArchivedDocument.objects.db)
+        for index in indexes:
+            index.refresh_from_database()
+        self.assertEqual([list(index.document_ids()) for index in indexes], [[self.kept.id]] * 3)
+
+    def test_saved_embeddings_update_lexical_index_without_per_document_queries(self):
+        """Тест: имена файлов для полнотекстового индекса читаются одним запросом на пакет"""
+        index = LexicalIndex()
+        index.build([])
+        documents = list(ArchivedDocument.objects.all())
+        embeddings = [
+            DocumentEmbedding(document=document, content_text='квартальный отчет', keywords=['отчет'])
+            for document in documents
+        ]
+        pipeline = DocumentEmbeddingPipeline(Mock(embedding_model='test-embed'), cache=EmbeddingCache())
+        with patch('archive.embeddings.get_lexical_index', return_value=index), \
+                patch('archive.embeddings.get_vector_index', return_value=VectorIndex()), \
+                self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(2):
+            pipeline.save_embeddings(embeddings)
+        self.assertEqual([document_id for document_id, _ in index.search('deleted')], [self.deleted.id])
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ArchivingPipelineTest(TestCase):
+    """Тесты конвейера задания архивирования"""
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root.name, BLOB_STORE_ROOT=os.path.join(self.media_root.name, 'blobs')
+        )
+        self.settings_override.enable()
+        self.user = User.objects.create_user('pipeline', password='x')
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        self.category = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=self.user)
+        self.service = AutoArchivingService()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media_root.cleanup()
+
+    def job(self, contents, missing=(), **configuration):
+        for name, content in contents.items():
+            with open(os.path.join(self.media_root.name, name), 'w') as f:
+                f.write(content)
+        FileItem.objects.bulk_create([
+            FileItem(name=name, path=name, owner=self.user, mime_type='text/plain') for name in contents
+        ])
+        return ArchivingJob.objects.create(
+            job_type='manual', source_paths=list(contents) + list(missing), target_category=self.category,
+            configuration=configuration, total_files=len(contents) + len(missing), created_by=self.user
+        )
+
+    def run_job(self, job):
+        embed = AsyncMock(return_value=0)
+        with patch.object(self.service.embedding_pipeline, 'embed_documents', embed):
+            async_to_sync(self.service.process_archiving_job)(job)
+        job.refresh_from_db()
+        return sorted(document.original_file.name for call in embed.call_args_list for document in call.args[0])
+
+    def test_job_pipeline(self):
+        """Тест: все стадии, ошибки по отдельным путям, одинаковое содержимое анализируется один раз"""
+        job = self.job(
+            {'a.txt': 'same', 'b.txt': 'same', 'c.txt': 'other'}, missing=['lost.txt'],
+            pipeline={'hash_workers': 2, 'ai_workers': 3, 'batch_size': 2}
+        )
+        generate = AsyncMock(side_effect=lambda prompt, model=None: {
+            'response': '1. отчет\n2. квартал' if prompt.startswith('Выдели') else 'Квартальный отчет',
+            'model': 'test-model', 'total_duration': 2e9
+        })
+        with patch.object(self.service.ai_service, 'generate', generate):
+            embedded = self.run_job(job)
+
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual((job.processed_files, job.successful_files, job.failed_files), (4, 3, 1))
+        self.assertEqual(list(job.errors.values_list('file_path', 'message')), [('lost.txt', 'File not found: lost.txt')])
+        self.assertEqual(embedded, ['a.txt', 'b.txt', 'c.txt'])
+        # Изложение и ключевые слова — по разу на уникальное содержимое
+        self.assertEqual(generate.await_count, 4)
+        self.assertEqual(AIAnalysisResult.objects.count(), 6)
+        keywords = AIAnalysisResult.objects.filter(analysis_type='entity_extraction')
+        self.assertEqual([result.extracted_entities for result in keywords], [['отчет', 'квартал']] * 3)
+        self.assertEqual(set(ArchivedDocument.objects.values_list('status', flat=True)), {'archived'})
+        self.assertFalse(ArchivedDocument.objects.filter(retention_date__isnull=True).exists())
+        self.assertFalse(ContentBlob.objects.exists())
+
+        # Результаты уже проанализированного содержимого переиспользуются другими заданиями
+        with patch.object(self.service.ai_service, 'generate', generate):
+            self.run_job(self.job({'d.txt': 'same'}))
+        self.assertEqual(generate.await_count, 4)
+        self.assertEqual(AIAnalysisResult.objects.filter(document__original_file__name='d.txt').count(), 2)
+
+    def test_cancelled_analysis_releases_waiters(self):
+        """Тест: отмена обработчика, анализирующего содержимое, не оставляет ожидающих того же содержимого"""
+        pipeline = ArchivingPipeline(self.service)
+        documents = [ArchivedDocument(checksum='same', metadata={}) for _ in range(2)]
+
+        async def hang(document):
+            await asyncio.Event().wait()
+
+        async def run():
+            inbox, outbox = asyncio.Queue(), asyncio.Queue()
+            for document in documents:
+                inbox.put_nowait(document)
+            with patch.object(pipeline, '_analysis', side_effect=hang):
+                first = asyncio.ensure_future(pipeline._analyze(inbox, outbox))
+                await asyncio.sleep(0)
+                second = asyncio.ensure_future(pipeline._analyze(inbox, outbox))
+                await asyncio.sleep(0)
+                first.cancel()
+                result = await asyncio.wait_for(outbox.get(), 1)
+                second.cancel()
+            return result
+
+        self.assertEqual(async_to_sync(run)(), (documents[1], []))
+
+    def test_job_without_ai_analysis(self):
+        """Тест: без ИИ анализа документы сразу получают статус 'archived', уже архивированные — ошибки"""
+        job = self.job({'a.txt': 'first', 'b.txt': 'second'}, require_ai_analysis=False)
+        self.run_job(job)
+        repeated = ArchivingJob.objects.create(
+            job_type='manual', source_paths=['a.txt'], target_category=self.category,
+            configuration={'require_ai_analysis': False}, total_files=1, created_by=self.user
+        )
+        self.run_job(repeated)
+
+        self.assertEqual((job.successful_files, job.failed_files), (2, 0))
+        self.assertEqual((repeated.successful_files, repeated.failed_files), (0, 1))
+        self.assertEqual(ArchivedDocument.objects.filter(status='archived').count(), 2)
+        self.assertFalse(AIAnalysisResult.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class JobProgressReporterTest(TestCase):
+    """Тесты записи хода задания архивирования"""
+
+    def setUp(self):
+        user = User.objects.create_user('progress', password='x')
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        category = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=user)
+        self.job = ArchivingJob.objects.create(
+            job_type='manual', source_paths=[], target_category=category, total_files=10, created_by=user
+        )
+
+    def counters(self):
+        return tuple(ArchivingJob.objects.filter(pk=self.job.pk).values_list(
+            'processed_files', 'successful_files', 'failed_files'
+        ).get())
+
+    def test_flush_by_count(self):
+        """Тест: счетчики копятся в памяти и записываются одним UPDATE, ошибки — в отдельную таблицу"""
+        reporter = JobProgressReporter(self.job, interval=3600, every=3)
+        reporter.add(processed=1, successful=1)
+        reporter.add(processed=1, failed=1)
+        reporter.error('File not found: lost.txt', 'lost.txt')
+        self.assertFalse(reporter.due())
+
+        reporter.add(processed=1, successful=1)
+        self.assertTrue(reporter.due())
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(reporter.flush())
+        self.assertEqual(
+            [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']], ['UPDATE', 'INSERT']
+        )
+        self.assertEqual(self.counters(), (3, 2, 1))
+        self.assertEqual(list(ArchivingJobError.objects.values_list('message', flat=True)), ['File not found: lost.txt'])
+        self.assertFalse(reporter.flush())
+
+    def test_reporters_increment_atomically(self):
+        """Тест: записи нескольких обработчиков складываются, а не перезаписывают друг друга"""
+        first = JobProgressReporter(self.job)
+        second = JobProgressReporter(ArchivingJob.objects.get(pk=self.job.pk))
+        first.add(processed=2, successful=2)
+        second.add(processed=3, failed=3)
+        first.flush()
+        second.flush()
+        self.assertEqual(self.counters(), (5, 2, 3))
+
+    def test_progress_is_published(self):
+        """Тест: записанный ход задания и итог публикуются подписчикам группы"""
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(archiving_job_group(self.job.id), channel)
+
+        reporter = JobProgressReporter(self.job)
+        reporter.add(processed=4, successful=3, failed=1)
+        reporter.error('Error processing bad.txt: broken', 'bad.txt')
+        reporter.flush()
+        reporter.finish('completed', {'archived': 3, 'failed': 1})
+
+        progress, finished = [async_to_sync(channel_layer.receive)(channel) for _ in range(2)]
+        self.assertEqual(progress['type'], 'archiving.progress')
+        self.assertEqual((progress['job']['processed_files'], progress['job']['progress_percentage']), (4, 40.0))
+        self.assertEqual(progress['errors'], ['Error processing bad.txt: broken'])
+        self.assertEqual(finished['job']['status'], 'completed')
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.status, self.job.results), ('completed', {'archived': 3, 'failed': 1}))
@@ -4,9 +4,11 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from django.shortcuts import get_object_or_404
-from django.db.models import Q, Count, Sum
+from django.conf import settings
+from django.db.models import Count, Sum, Case, When, Value, IntegerField
 from django.utils import timezone
 from django.http import HttpResponse
+from asgiref.sync import async_to_sync
 import json
 import csv
 import logging
@@ -26,6 +28,7 @@ from .serializers import (
     ArchivePermissionSerializer, ComplianceRuleSerializer, ArchiveStatsSerializer,
     SemanticSearchSerializer, AnalyticsReportSerializer
 )
+from .search import get_lexical_index
 from .services import AutoArchivingService, ArchiveSearchService, ArchiveAnalyticsService
 
 logger = logging.getLogger(__name__)
@@ -60,13 +63,22 @@ class ArchivedDocumentViewSet(viewsets.ModelViewSet):
         if access_level:
             queryset = queryset.filter(access_level=access_level)
         
-        # Поиск по имени файла
+        # Полнотекстовый поиск (BM25) среди доступных пользователю документов, результаты упорядочены
+        # по релевантности; имя файла входит в индекс, поэтому отдельный LIKE-поиск не нужен
         search = self.request.query_params.get('search')
         if search:
-            queryset = queryset.filter(
-                Q(original_file__name__icontains=search) |
-                Q(tags__icontains=search) |
-                Q(metadata__icontains=search)
+            ranked_ids = [
+                document_id for document_id, _ in get_lexical_index().search(
+                    search,
+                    k=settings.ARCHIVE_FULLTEXT_SEARCH_LIMIT,
+                    allowed_ids=ArchiveSearchService().get_visible_document_ids(self.request.user, category_id)
+                )
+            ]
+            return queryset.filter(id__in=ranked_ids).order_by(
+                Case(
+                    *[When(id=document_id, then=Value(rank)) for rank, document_id in enumerate(ranked_ids)],
+                    output_field=IntegerField()
+                )
             )
         
         return queryset.order_by('-archived_at')
@@ -130,6 +142,22 @@ class ArchivedDocumentViewSet(viewsets.ModelViewSet):
             'size': document.original_file.size
         })
     
+    @action(detail=True, methods=['get'])
+    def related(self, request, pk=None):
+        """Похожие документы (предрассчитанные задачей compute_related_documents)"""
+        document = self.get_object()
+        related = ArchiveSearchService().get_related_documents(document, request.user)
+
+        return Response({
+            'results': [
+                {
+                    'document': ArchivedDocumentListSerializer(item['document']).data,
+                    'similarity': item['similarity']
+                }
+                for item in related
+            ]
+        })
+
     @action(detail=True, methods=['post'])
     def update_metadata(self, request, pk=None):
         """Обновление метаданных документа"""
@@ -309,7 +337,8 @@ class ArchivingJobViewSet(viewsets.ModelViewSet):
         """Получение логов задания"""
         job = self.get_object()
         return Response({
-            'error_log': job.error_log,
+            # Ошибки заданий до появления ArchivingJobError остались в error_log
+            'error_log': job.error_log + list(job.errors.values_list('message', flat=True)),
             'results': job.results
         })
 
@@ -356,15 +385,25 @@ class SemanticSearchView(APIView):
         
         try:
             search_service = ArchiveSearchService()
-            results = search_service.semantic_search(
+            results = async_to_sync(search_service.semantic_search)(
                 query=serializer.validated_data['query'],
+                user=request.user,
                 limit=serializer.validated_data['limit'],
                 category_id=serializer.validated_data.get('category_id'),
-                similarity_threshold=serializer.validated_data['similarity_threshold']
+                similarity_threshold=serializer.validated_data['similarity_threshold'],
+                mode=serializer.validated_data['mode']
             )
             
             return Response({
-                'results': results,
+                'results': [
+                    {
+                        'document': ArchivedDocumentListSerializer(item['document']).data,
+                        'similarity': item['similarity'],
+                        'score': item['score'],
+                        'keywords': item['keywords']
+                    }
+                    for item in results
+                ],
                 'query': serializer.validated_data['query'],
                 'total_found': len(results)
             })
@@ -1,12 +1,14 @@
 import os
 import mimetypes
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 from django.conf import settings
 from django.utils import timezone
 import uuid
 
+from filemanager.services.checksum import get_checksum_service
+
 
 def upload_to_user_directory(instance, filename):
     """Загрузка файлов в директорию пользователя"""
@@ -175,6 +177,26 @@ class FilePermission(models.Model):
         return self.expires_at and self.expires_at < timezone.now()
 
 
+class ContentBlob(models.Model):
+    """Содержимое файла в хранилище по SHA-256 (filemanager.services.blobstore) — одно на checksum"""
+    
+    checksum = models.CharField(max_length=64, unique=True)  # SHA-256
+    size = models.BigIntegerField()
+    # Ссылки из FileVersion; блоб без ссылок удаляется сборкой мусора
+    ref_count = models.IntegerField(default=0)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.checksum[:12]} ({self.ref_count} refs)"
+
+
 class FileVersion(models.Model):
     """Версии файлов"""
     
@@ -183,6 +205,9 @@ class FileVersion(models.Model):
     file = models.FileField(upload_to=upload_to_user_directory)
     size = models.BigIntegerField()
     checksum = models.CharField(max_length=64)  # SHA-256
+    blob = models.ForeignKey(
+        ContentBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='file_versions'
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     comment = models.TextField(blank=True)
@@ -197,6 +222,32 @@ class FileVersion(models.Model):
     
     def __str__(self):
         return f"{self.file_item.name} v{self.version_number}"
+    
+    def save(self, *args, **kwargs):
+        # Размер и SHA-256 версии считаются по содержимому файла
+        if self.file:
+            if self.size is None:
+                self.size = self.file.size
+            if not self.checksum:
+                self.checksum = get_checksum_service().checksum_file(self.file)
+        
+        # Ссылка на блоб и строка версии — в одной транзакции: при ошибке сохранения ссылка не остается
+        with transaction.atomic():
+            # Новая версия хранится в хранилище блобов: одинаковое содержимое — один файл на диске
+            if (
+                self.file and self._state.adding and self.blob_id is None
+                and getattr(settings, 'BLOB_STORE_ENABLED', True)
+            ):
+                from filemanager.services.blobstore import get_blob_store
+                store = get_blob_store()
+                self.blob = store.acquire_field_file(self.file, self.checksum)
+                blob_name = store.storage_name(self.checksum)
+                if self.file._committed and self.file.name != blob_name:
+                    # Уже сохраненный файл версии заменен блобом; удаляется после фиксации, чтобы не потерять его при откате
+                    storage, name = self.file.storage, self.file.name
+                    transaction.on_commit(lambda: storage.delete(name))
+                self.file = blob_name
+            super().save(*args, **kwargs)
 
 
 class FileShare(models.Model):
@@ -0,0 +1,221 @@
+"""
+Хранилище содержимого файлов по SHA-256 (content-addressable).
+
+Файл с checksum abcd... хранится один раз в BLOB_STORE_ROOT/ab/cd/abcd...
+(по умолчанию MEDIA_ROOT/blobs). ContentBlob.ref_count — число ссылок из
+FileVersion; блобы без ссылок удаляет collect_garbage.
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from filemanager.models import ContentBlob
+from filemanager.services.checksum import get_checksum_service
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Файлы блобов на диске и счетчики ссылок в ContentBlob"""
+
+    def __init__(self, root: Optional[str] = None):
+        self._root = root
+
+    @property
+    def root(self) -> str:
+        return os.path.abspath(self._root or getattr(settings, 'BLOB_STORE_ROOT', os.path.join(settings.MEDIA_ROOT, 'blobs')))
+
+    @staticmethod
+    def relative_path(checksum: str) -> str:
+        """Путь внутри хранилища: два уровня каталогов по префиксу хеша"""
+        return os.path.join(checksum[:2], checksum[2:4], checksum)
+
+    def path(self, checksum: str) -> str:
+        return os.path.join(self.root, self.relative_path(checksum))
+
+    def storage_name(self, checksum: str) -> str:
+        """Имя файла блоба для FileField (относительно MEDIA_ROOT)"""
+        return os.path.relpath(self.path(checksum), os.path.abspath(settings.MEDIA_ROOT)).replace(os.sep, '/')
+
+    def exists(self, checksum: str) -> bool:
+        return os.path.exists(self.path(checksum))
+
+    def _write(self, checksum: str, write) -> str:
+        """Запись во временный файл и атомарное переименование: читатели не видят неполный блоб"""
+        path = self.path(checksum)
+        if os.path.exists(path):
+            return path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(descriptor, 'wb') as target:
+                write(target)
+            os.chmod(temp_path, 0o444)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return path
+
+    def store_file(self, source_path: str, checksum: str) -> str:
+        """Копирует файл в хранилище, если такого содержимого еще нет"""
+        def copy(target):
+            with open(source_path, 'rb') as source:
+                shutil.copyfileobj(source, target, getattr(settings, 'FILE_CHECKSUM_BUFFER_SIZE', 1024 * 1024))
+
+        return self._write(checksum, copy)
+
+    def store_field_file(self, field_file, checksum: str) -> str:
+        """То же для файла модели (в том числе еще не сохраненной загрузки)"""
+        def copy(target):
+            for chunk in field_file.chunks():
+                target.write(chunk)
+
+        return self._write(checksum, copy)
+
+    def acquire(self, checksum: str, size: int, count: int = 1) -> ContentBlob:
+        """Добавляет count ссылок на блоб"""
+        return self.acquire_many({checksum: (size, count)})[checksum]
+
+    def acquire_many(self, entries: Dict[str, Tuple[int, int]]) -> Dict[str, ContentBlob]:
+        """
+        Ссылки на несколько блобов: {checksum: (размер, число ссылок)}.
+        Недостающие строки создаются одним bulk_create, счетчики обновляются одним UPDATE.
+        """
+        blobs: Dict[str, ContentBlob] = {}
+        pending = dict(entries)
+        # Строку, удаленную сборкой мусора между bulk_create и UPDATE, создаем заново
+        while pending:
+            with transaction.atomic():
+                ContentBlob.objects.bulk_create(
+                    [ContentBlob(checksum=checksum, size=size) for checksum, (size, _) in pending.items()],
+                    ignore_conflicts=True
+                )
+                ContentBlob.objects.filter(checksum__in=pending).update(
+                    ref_count=F('ref_count') + Case(
+                        *[When(checksum=checksum, then=Value(count)) for checksum, (_, count) in pending.items()],
+                        default=Value(0),
+                        output_field=IntegerField()
+                    ),
+                    updated_at=timezone.now()
+                )
+                for blob in ContentBlob.objects.filter(checksum__in=pending):
+                    blobs[blob.checksum] = blob
+                    del pending[blob.checksum]
+        return blobs
+
+    def acquire_file(self, source_path: str, checksum: Optional[str] = None) -> ContentBlob:
+        """
+        Добавляет ссылку на содержимое файла и сохраняет его в хранилище.
+        Ссылка берется до записи: блоб со ссылкой сборка мусора не удаляет.
+        """
+        checksum = checksum or get_checksum_service().checksum(source_path)
+        blob = self.acquire(checksum, os.path.getsize(source_path))
+        self.store_file(source_path, checksum)
+        return blob
+
+    def acquire_field_file(self, field_file, checksum: Optional[str] = None) -> ContentBlob:
+        checksum = checksum or get_checksum_service().checksum_file(field_file)
+        blob = self.acquire(checksum, field_file.size)
+        self.store_field_file(field_file, checksum)
+        return blob
+
+    def release(self, blob_ids: Iterable[int]):
+        """Снимает по одной ссылке (после удаления версии)"""
+        counts: Dict[int, int] = {}
+        for blob_id in blob_ids:
+            if blob_id is not None:
+                counts[blob_id] = counts.get(blob_id, 0) + 1
+        if not counts:
+            return
+        ContentBlob.objects.filter(id__in=counts).update(
+            ref_count=F('ref_count') - Case(
+                *[When(id=blob_id, then=Value(count)) for blob_id, count in counts.items()],
+                default=Value(0),
+                output_field=IntegerField()
+            ),
+            updated_at=timezone.now()
+        )
+
+    def collect_garbage(self, grace: Optional[int] = None) -> Dict[str, int]:
+        """
+        Удаляет блобы без ссылок и файлы без строк ContentBlob
+        (остаются после отката транзакции), не тронутые дольше grace секунд.
+        """
+        grace = getattr(settings, 'BLOB_STORE_GC_GRACE', 3600) if grace is None else grace
+        cutoff = timezone.now() - timedelta(seconds=grace)
+        deleted = 0
+        freed = 0
+
+        with transaction.atomic():
+            unreferenced = list(
+                ContentBlob.objects.select_for_update().filter(ref_count__lte=0, updated_at__lt=cutoff)
+            )
+            for blob in unreferenced:
+                path = self.path(blob.checksum)
+                if os.path.exists(path):
+                    os.unlink(path)
+                freed += blob.size
+            ContentBlob.objects.filter(id__in=[blob.id for blob in unreferenced], ref_count__lte=0).delete()
+            deleted += len(unreferenced)
+
+        orphans = 0
+        if os.path.isdir(self.root):
+            known = set(ContentBlob.objects.values_list('checksum', flat=True).iterator(chunk_size=10000))
+            oldest = time.time() - grace
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    if name in known or os.path.getmtime(path) >= oldest:
+                        continue
+                    freed += os.path.getsize(path)
+                    os.unlink(path)
+                    orphans += 1
+
+        if deleted or orphans:
+            logger.info(f"Blob store garbage collected: {deleted} unreferenced, {orphans} orphaned, {freed} bytes freed")
+        return {'deleted': deleted, 'orphans': orphans, 'freed_bytes': freed}
+
+    @staticmethod
+    def stats() -> Dict[str, int]:
+        """Объем хранилища и экономия от дедупликации"""
+        totals = ContentBlob.objects.filter(ref_count__gt=0).aggregate(
+            blobs=Sum(Value(1)),
+            stored_bytes=Sum('size'),
+            referenced_bytes=Sum(F('size') * F('ref_count'))
+        )
+        stored = totals['stored_bytes'] or 0
+        referenced = totals['referenced_bytes'] or 0
+        return {
+            'blobs': totals['blobs'] or 0,
+            'stored_bytes': stored,
+            'referenced_bytes': referenced,
+            'saved_bytes': referenced - stored,
+        }
+
+
+_blob_store: Optional[BlobStore] = None
+_blob_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    """Получить хранилище блобов"""
+    global _blob_store
+    if _blob_store is None:
+        with _blob_store_lock:
+            if _blob_store is None:
+                _blob_store = BlobStore()
+    return _blob_store
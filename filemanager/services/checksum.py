@@ -0,0 +1,152 @@
+"""
+Вычисление SHA-256 файлов.
+
+Файлы читаются большими блоками в один буфер (readinto), крупные —
+через mmap без копирования. hashlib отпускает GIL на время хеширования,
+поэтому пакет файлов хешируется параллельно в пуле потоков.
+Результаты запоминаются по (устройство, inode, размер, mtime): неизменный
+файл повторно не читается.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FileKey = Tuple[int, int, int, int]
+
+
+def file_key(stat_result: os.stat_result) -> FileKey:
+    """Ключ содержимого: изменение файла меняет размер или mtime"""
+    return stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns
+
+
+class ChecksumService:
+    """SHA-256 файлов с памятью результатов и параллельным хешированием пакетов"""
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        buffer_size: Optional[int] = None,
+        mmap_threshold: Optional[int] = None,
+        memo_size: Optional[int] = None
+    ):
+        self.pid = os.getpid()
+        self.workers = workers or getattr(settings, 'FILE_CHECKSUM_WORKERS', 0) or min(8, os.cpu_count() or 1)
+        self.buffer_size = buffer_size or getattr(settings, 'FILE_CHECKSUM_BUFFER_SIZE', 1024 * 1024)
+        if mmap_threshold is None:
+            mmap_threshold = getattr(settings, 'FILE_CHECKSUM_MMAP_THRESHOLD', 64 * 1024 * 1024)
+        self.mmap_threshold = mmap_threshold  # 0 — не использовать mmap
+        self.memo_size = memo_size or getattr(settings, 'FILE_CHECKSUM_MEMO_SIZE', 100000)
+        self._memo: 'OrderedDict[FileKey, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='checksum')
+        return self._executor
+
+    def _remembered(self, key: FileKey) -> Optional[str]:
+        with self._lock:
+            digest = self._memo.get(key)
+            if digest is None:
+                self.misses += 1
+                return None
+            self._memo.move_to_end(key)
+            self.hits += 1
+            return digest
+
+    def _remember(self, key: FileKey, digest: str):
+        with self._lock:
+            self._memo[key] = digest
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_size:
+                self._memo.popitem(last=False)
+
+    def _hash_file(self, path: str, size: int) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as f:
+            if self.mmap_threshold and size >= self.mmap_threshold:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    sha256.update(mapped)
+                return sha256.hexdigest()
+
+            buffer = bytearray(min(self.buffer_size, max(size, 1)))
+            view = memoryview(buffer)
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                sha256.update(view[:read])
+        return sha256.hexdigest()
+
+    def checksum(self, path: str) -> str:
+        """SHA-256 файла (OSError, если файл недоступен)"""
+        key = file_key(os.stat(path))
+        digest = self._remembered(key)
+        if digest is None:
+            digest = self._hash_file(path, key[2])
+            # Файл изменился во время чтения — результат не запоминаем
+            if file_key(os.stat(path)) == key:
+                self._remember(key, digest)
+        return digest
+
+    def checksums(self, paths: Iterable[str]) -> Dict[str, Optional[str]]:
+        """SHA-256 пакета файлов параллельно; None для недоступных файлов"""
+        paths = list(dict.fromkeys(paths))
+        results: Dict[str, Optional[str]] = {}
+        futures = {path: self.executor.submit(self.checksum, path) for path in paths}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                logger.warning(f"Could not calculate checksum for {path}: {e}")
+                results[path] = None
+        return results
+
+    def checksum_file(self, field_file) -> str:
+        """SHA-256 файла модели: сохраненного — по пути, загружаемого — по содержимому"""
+        try:
+            path = field_file.path
+        except (AttributeError, NotImplementedError, ValueError):
+            path = None
+        if path and os.path.exists(path):
+            return self.checksum(path)
+
+        sha256 = hashlib.sha256()
+        for chunk in field_file.chunks(self.buffer_size):
+            sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'memo_size': len(self._memo), 'hits': self.hits, 'misses': self.misses, 'workers': self.workers}
+
+
+# Пул потоков не переживает fork — после fork сервис создается заново
+_checksum_service: Optional[ChecksumService] = None
+_checksum_service_lock = threading.Lock()
+
+
+def get_checksum_service() -> ChecksumService:
+    """Получить сервис контрольных сумм процесса"""
+    global _checksum_service
+    if _checksum_service is None or _checksum_service.pid != os.getpid():
+        with _checksum_service_lock:
+            if _checksum_service is None or _checksum_service.pid != os.getpid():
+                _checksum_service = ChecksumService()
+    return _checksum_service
@@ -1,6 +1,8 @@
-from django.db.models.signals import pre_delete, post_save
+from django.db import transaction
+from django.db.models.signals import pre_delete, post_delete, post_save
 from django.dispatch import receiver
-from .models import FileItem
+from .models import FileItem, FileVersion
+from .services.blobstore import get_blob_store
 from .services.filesystem import FileSystemService
 import os
 
@@ -20,3 +22,10 @@ def create_directory_if_needed(sender, instance, created, **kwargs):
     if created and instance.is_directory:
         fs_service = FileSystemService()
         fs_service.create_directory(instance.full_path)
+
+@receiver(post_delete, sender=FileVersion)
+def release_version_blob(sender, instance, **kwargs):
+    """Снимает ссылку версии на блоб; файл блоба удаляет сборка мусора, когда ссылок не останется"""
+    if instance.blob_id:
+        blob_id = instance.blob_id
+        transaction.on_commit(lambda: get_blob_store().release([blob_id]))
@@ -2,9 +2,18 @@ import json
 import asyncio
 import os
 import threading
+from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
 from channels.generic.websocket import AsyncWebsocketConsumer
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from archive.models import ArchivingJob
+from archive.progress import archiving_job_group, archiving_job_state
+from archive.serializers import ArchivedDocumentListSerializer
+from archive.services import ArchiveSearchService
+from ai_integration.models import AIAnalysis
+from ai_integration.services.analysis_jobs import analysis_group, analysis_state
+from ai_integration.services.ollama_service import generation_event, get_ollama_service
 from .services.filesystem import FileSystemService
 
 class FileChangeHandler(FileSystemEventHandler):
@@ -34,6 +43,10 @@ class SimpleFileManagerConsumer(AsyncWebsocketConsumer):
         self.heartbeat_task = None
         self.file_observer = None
         self.watched_path = '/workspaces/codespaces-django'
+        self.search_task = None
+        self.generation_task = None
+        self.analysis_groups = set()
+        self.job_groups = set()
     
     async def connect(self):
         """Обработка подключения клиента"""
@@ -56,6 +69,15 @@ class SimpleFileManagerConsumer(AsyncWebsocketConsumer):
         """Обработка отключения клиента"""
         if self.heartbeat_task:
             self.heartbeat_task.cancel()
+        
+        if self.search_task:
+            self.search_task.cancel()
+        
+        if self.generation_task:
+            self.generation_task.cancel()
+        
+        for group in self.analysis_groups | self.job_groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
             
         if self.file_observer:
             self.file_observer.stop()
@@ -127,6 +149,22 @@ class SimpleFileManagerConsumer(AsyncWebsocketConsumer):
                     await self.handle_bulk_upload(data)
                 elif action == 'watch_directory':
                     await self.handle_watch_directory(data)
+                elif action == 'semantic_search':
+                    await self.handle_semantic_search(data)
+                elif action == 'cancel_search':
+                    await self.cancel_search()
+                elif action == 'generate':
+                    await self.handle_generate(data)
+                elif action == 'cancel_generation':
+                    await self.cancel_generation()
+                elif action == 'subscribe_analysis':
+                    await self.handle_subscribe_analysis(data)
+                elif action == 'unsubscribe_analysis':
+                    await self.handle_unsubscribe_analysis(data)
+                elif action == 'subscribe_archiving_job':
+                    await self.handle_subscribe_archiving_job(data)
+                elif action == 'unsubscribe_archiving_job':
+                    await self.handle_unsubscribe_archiving_job(data)
                 else:
                     await self.send_error(f'Unknown action: {action}')
                     
@@ -206,6 +244,169 @@ class SimpleFileManagerConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             await self.send_error(f'Error getting project info: {str(e)}')
 
+    async def handle_semantic_search(self, data):
+        """
+        Семантический поиск по архиву с потоковой отдачей результатов.
+        Новый запрос отменяет предыдущий (поиск по мере набора текста).
+        """
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.send_error('Authentication required for semantic search')
+            return
+        
+        query = (data.get('query') or '').strip()
+        await self.cancel_search()
+        if not query:
+            return
+        
+        self.search_task = asyncio.create_task(self.stream_search_results(
+            user,
+            query,
+            request_id=data.get('request_id'),
+            limit=min(int(data.get('limit', 10)), 100),
+            category_id=data.get('category_id'),
+            similarity_threshold=float(data.get('similarity_threshold', 0.3))
+        ))
+    
+    async def cancel_search(self):
+        """Отмена текущего поиска"""
+        if self.search_task and not self.search_task.done():
+            self.search_task.cancel()
+        self.search_task = None
+    
+    async def stream_search_results(self, user, query, request_id=None, **options):
+        """Отправка промежуточных top-k результатов по мере обработки шардов индекса"""
+        try:
+            async for step in ArchiveSearchService().stream_semantic_search(query, user, **options):
+                await self.send(text_data=json.dumps({
+                    'type': 'search_results',
+                    'request_id': request_id,
+                    'query': query,
+                    'shard': step['shard'],
+                    'shards': step['shards'],
+                    'final': step['final'],
+                    'results': [
+                        {
+                            'document': ArchivedDocumentListSerializer(item['document']).data,
+                            'similarity': item['similarity'],
+                            'keywords': item['keywords']
+                        }
+                        for item in step['results']
+                    ]
+                }))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.send_error(f'Search failed: {str(e)}')
+
+    async def handle_generate(self, data):
+        """Потоковая генерация текста: токены отправляются по мере появления"""
+        prompt = (data.get('prompt') or '').strip()
+        if not prompt:
+            await self.send_error('Prompt is required')
+            return
+        
+        await self.cancel_generation()
+        self.generation_task = asyncio.create_task(
+            self.stream_generation(prompt, data.get('model'), request_id=data.get('request_id'))
+        )
+    
+    async def cancel_generation(self):
+        """Отмена текущей генерации (запрос к Ollama прерывается)"""
+        if self.generation_task and not self.generation_task.done():
+            self.generation_task.cancel()
+        self.generation_task = None
+    
+    async def stream_generation(self, prompt, model=None, request_id=None):
+        """Отправка частей ответа модели"""
+        try:
+            async for chunk in get_ollama_service().generate_stream(prompt, model):
+                await self.send(text_data=json.dumps({
+                    'type': 'generation',
+                    'request_id': request_id,
+                    **generation_event(chunk)
+                }))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.send_error(f'Generation failed: {str(e)}')
+
+    async def handle_subscribe_analysis(self, data):
+        """Подписка на ход анализа, поставленного в очередь (POST /api/v1/ai/analyze/...)"""
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.send_error('Authentication required for analysis progress')
+            return
+        
+        analysis_id = data.get('analysis_id')
+        try:
+            # Только собственные анализы: чужой id выглядит как несуществующий
+            analysis = await database_sync_to_async(
+                AIAnalysis.objects.select_related('file_item').get
+            )(id=analysis_id, user=user)
+        except (AIAnalysis.DoesNotExist, ValueError, TypeError):
+            await self.send_error(f'Analysis not found: {analysis_id}')
+            return
+        
+        group = analysis_group(analysis.id)
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.analysis_groups.add(group)
+        
+        # Текущее состояние: анализ мог завершиться до подписки
+        await self.analysis_progress({'analysis': analysis_state(analysis)})
+    
+    async def handle_unsubscribe_analysis(self, data):
+        """Отписка от событий анализа"""
+        group = analysis_group(data.get('analysis_id'))
+        if group in self.analysis_groups:
+            self.analysis_groups.discard(group)
+            await self.channel_layer.group_discard(group, self.channel_name)
+    
+    async def analysis_progress(self, event):
+        """Событие analysis.progress из channel layer"""
+        await self.send(text_data=json.dumps({
+            'type': 'analysis_progress',
+            **event['analysis']
+        }))
+
+    async def handle_subscribe_archiving_job(self, data):
+        """Подписка на ход задания архивирования"""
+        user = self.scope.get('user')
+        if not user or not user.is_authenticated:
+            await self.send_error('Authentication required for archiving job progress')
+            return
+        
+        job_id = data.get('job_id')
+        # Только собственные задания (персоналу — любые): чужой id выглядит как несуществующий
+        jobs = ArchivingJob.objects.all() if user.is_staff else ArchivingJob.objects.filter(created_by=user)
+        try:
+            job = await database_sync_to_async(jobs.get)(id=job_id)
+        except (ArchivingJob.DoesNotExist, ValueError, TypeError, ValidationError):
+            await self.send_error(f'Archiving job not found: {job_id}')
+            return
+        
+        group = archiving_job_group(job.id)
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.job_groups.add(group)
+        
+        # Текущее состояние: задание могло продвинуться до подписки
+        await self.archiving_progress({'job': archiving_job_state(job), 'errors': []})
+    
+    async def handle_unsubscribe_archiving_job(self, data):
+        """Отписка от событий задания архивирования"""
+        group = archiving_job_group(data.get('job_id'))
+        if group in self.job_groups:
+            self.job_groups.discard(group)
+            await self.channel_layer.group_discard(group, self.channel_name)
+    
+    async def archiving_progress(self, event):
+        """Событие archiving.progress из channel layer"""
+        await self.send(text_data=json.dumps({
+            'type': 'archiving_progress',
+            'errors': event['errors'],
+            **event['job']
+        }))
+
     async def send_error(self, message):
         """Отправка сообщения об ошибке"""
         await self.send(text_data=json.dumps({
@@ -1,12 +1,27 @@
 import os
+import asyncio
+import hashlib
 import tempfile
+from django.db import IntegrityError
 from django.test import TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.contrib.auth.models import User
+from django.contrib.auth.models import AnonymousUser, User
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from .models import FileItem
+from unittest.mock import AsyncMock, patch
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from archive.models import ArchiveCategory, ArchivingJob, RetentionPolicy
+from archive.services import ArchiveSearchService
+from ai_integration.models import AIAnalysis, AIModel
+from ai_integration.services.analysis_jobs import analysis_group
+from ai_integration.services.ollama_service import OllamaService
+from .models import ContentBlob, FileItem, FileVersion
+from .simple_consumer import SimpleFileManagerConsumer
+from .services.blobstore import get_blob_store
+from .services.checksum import ChecksumService
 from .services.filesystem import FileSystemService
 
 
@@ -70,6 +85,154 @@ class FileSystemServiceTest(TestCase):
         # self.assertIn('test.txt', [item['name'] for item in contents])
 
 
+class ChecksumServiceTest(TestCase):
+    """Тесты вычисления контрольных сумм"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.service = ChecksumService(workers=4, buffer_size=1024, mmap_threshold=64 * 1024)
+    
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+    
+    def test_checksum_matches_sha256(self):
+        """Тест: блочное чтение и mmap дают SHA-256 содержимого"""
+        for size in (0, 1000, 5000, 100 * 1024):
+            content = os.urandom(size)
+            path = self.write(f'file_{size}', content)
+            self.assertEqual(self.service.checksum(path), hashlib.sha256(content).hexdigest())
+    
+    def test_unchanged_files_are_not_rehashed(self):
+        """Тест: сумма неизмененного файла берется из памяти, измененный файл хешируется заново"""
+        path = self.write('doc.txt', b'first')
+        self.assertEqual(self.service.checksum(path), hashlib.sha256(b'first').hexdigest())
+        with patch.object(self.service, '_hash_file', side_effect=AssertionError('rehashed')):
+            self.service.checksum(path)
+        self.assertEqual(self.service.stats()['hits'], 1)
+        
+        self.write('doc.txt', b'second version')
+        self.assertEqual(self.service.checksum(path), hashlib.sha256(b'second version').hexdigest())
+    
+    def test_parallel_batch(self):
+        """Тест: пакет хешируется параллельно, недоступные файлы — None"""
+        contents = {self.write(f'f{index}', os.urandom(3000)): None for index in range(20)}
+        for path in contents:
+            with open(path, 'rb') as f:
+                contents[path] = hashlib.sha256(f.read()).hexdigest()
+        missing = os.path.join(self.temp_dir, 'missing')
+        
+        results = self.service.checksums(list(contents) + [missing])
+        self.assertEqual({path: results[path] for path in contents}, contents)
+        self.assertIsNone(results[missing])
+    
+    def test_uploaded_file(self):
+        """Тест: сумма загружаемого файла считается по содержимому"""
+        upload = SimpleUploadedFile('version.txt', b'version content')
+        self.assertEqual(self.service.checksum_file(upload), hashlib.sha256(b'version content').hexdigest())
+
+
+class BlobStoreTest(TestCase):
+    """Тесты хранилища содержимого по SHA-256"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.temp_dir, BLOB_STORE_ROOT=os.path.join(self.temp_dir, 'blobs'))
+        self.settings_override.enable()
+        self.store = get_blob_store()
+        self.user = User.objects.create_user('blobs', password='x')
+    
+    def tearDown(self):
+        import shutil
+        self.settings_override.disable()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+    
+    def write(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+    
+    def test_identical_files_share_blob(self):
+        """Тест: одинаковое содержимое хранится один раз в каталоге по префиксу хеша"""
+        checksum = hashlib.sha256(b'invoice').hexdigest()
+        first = self.store.acquire_file(self.write('a.pdf', b'invoice'))
+        second = self.store.acquire_file(self.write('b.pdf', b'invoice'))
+        
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(ContentBlob.objects.get(checksum=checksum).ref_count, 2)
+        path = self.store.path(checksum)
+        self.assertEqual(path, os.path.join(self.temp_dir, 'blobs', checksum[:2], checksum[2:4], checksum))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'invoice')
+    
+    def test_garbage_collection(self):
+        """Тест: удаляются блобы без ссылок и файлы без записей, блобы со ссылками остаются"""
+        kept = self.store.acquire_file(self.write('kept.txt', b'kept'))
+        released = self.store.acquire_file(self.write('released.txt', b'released'))
+        self.store.release([released.id])
+        self.store.store_file(self.write('orphan.txt', b'orphan'), hashlib.sha256(b'orphan').hexdigest())
+        
+        result = self.store.collect_garbage(grace=0)
+        self.assertEqual((result['deleted'], result['orphans']), (1, 1))
+        self.assertTrue(self.store.exists(kept.checksum))
+        self.assertFalse(self.store.exists(released.checksum))
+        self.assertFalse(ContentBlob.objects.filter(id=released.id).exists())
+    
+    def test_file_versions_are_deduplicated(self):
+        """Тест: версии с одинаковым содержимым ссылаются на один блоб, удаление снимает ссылку"""
+        file_item = FileItem.objects.bulk_create([FileItem(name='doc.txt', path='doc.txt', owner=self.user)])[0]
+        versions = [
+            FileVersion.objects.create(
+                file_item=file_item, version_number=number, created_by=self.user,
+                file=SimpleUploadedFile('doc.txt', b'same content')
+            )
+            for number in (1, 2)
+        ]
+        blob = ContentBlob.objects.get()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertEqual({version.file.name for version in versions}, {self.store.storage_name(blob.checksum)})
+        self.assertEqual(versions[0].size, len(b'same content'))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            versions[0].delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+    
+    def test_failed_version_save_releases_blob(self):
+        """Тест: ссылка на блоб откатывается вместе с неудачным сохранением версии"""
+        file_item = FileItem.objects.bulk_create([FileItem(name='doc.txt', path='doc.txt', owner=self.user)])[0]
+        version = FileVersion(
+            file_item=file_item, version_number=1, created_by=self.user,
+            file=SimpleUploadedFile('doc.txt', b'lost content')
+        )
+        
+        with patch('django.db.models.Model.save', side_effect=IntegrityError('constraint failed')):
+            with self.assertRaises(IntegrityError):
+                version.save()
+        self.assertFalse(ContentBlob.objects.filter(ref_count__gt=0).exists())
+    
+    def test_stored_version_file_is_replaced_by_blob(self):
+        """Тест: уже сохраненный файл версии удаляется после переноса в блоб"""
+        file_item = FileItem.objects.bulk_create([FileItem(name='doc.txt', path='doc.txt', owner=self.user)])[0]
+        path = self.write('doc.txt', b'stored content')
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            version = FileVersion.objects.create(
+                file_item=file_item, version_number=1, created_by=self.user, file='doc.txt'
+            )
+        self.assertEqual(version.file.name, self.store.storage_name(version.checksum))
+        self.assertFalse(os.path.exists(path))
+        with open(self.store.path(version.checksum), 'rb') as f:
+            self.assertEqual(f.read(), b'stored content')
+
+
 class FileManagerAPITest(APITestCase):
     """Тесты для API файлового менеджера"""
     
@@ -178,3 +341,151 @@ class WebSocketConsumerTest(TestCase):
         """Тест уведомления об изменении файла"""
         # Тесты для уведомлений через WebSocket
         pass
+    
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_semantic_search_streams_and_cancels(self):
+        """Тест потоковой выдачи поиска и отмены предыдущего запроса"""
+        async def fake_stream(service, query, user, **options):
+            for shard in (1, 2):
+                await asyncio.sleep(0.05)
+                yield {'shard': shard, 'shards': 2, 'results': [], 'final': shard == 2}
+        
+        async def run_test():
+            communicator = WebsocketCommunicator(SimpleFileManagerConsumer.as_asgi(), '/ws/filemanager/')
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_json_from()  # connection_status
+            
+            await communicator.send_json_to({'action': 'semantic_search', 'query': 'дог', 'request_id': 1})
+            await communicator.send_json_to({'action': 'semantic_search', 'query': 'договор', 'request_id': 2})
+            
+            messages = [await communicator.receive_json_from(timeout=2) for _ in range(2)]
+            self.assertEqual([message['request_id'] for message in messages], [2, 2])
+            self.assertEqual([message['shard'] for message in messages], [1, 2])
+            self.assertTrue(messages[-1]['final'])
+            self.assertTrue(await communicator.receive_nothing(timeout=0.2))
+            
+            await communicator.disconnect()
+        
+        with patch.object(SimpleFileManagerConsumer, 'start_file_watcher', AsyncMock()), \
+                patch.object(ArchiveSearchService, 'stream_semantic_search', fake_stream):
+            async_to_sync(run_test)()
+    
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_generate_streams_tokens(self):
+        """Тест потоковой генерации текста через WebSocket"""
+        async def fake_stream(service, prompt, model=None):
+            for token in ('При', 'вет'):
+                yield {'response': token, 'done': False}
+            yield {'response': '', 'done': True, 'model': 'llama', 'eval_count': 2}
+        
+        async def run_test():
+            communicator = WebsocketCommunicator(SimpleFileManagerConsumer.as_asgi(), '/ws/filemanager/')
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_json_from()  # connection_status
+            
+            await communicator.send_json_to({'action': 'generate', 'prompt': 'Привет', 'request_id': 7})
+            messages = [await communicator.receive_json_from(timeout=2) for _ in range(3)]
+            self.assertEqual([message['type'] for message in messages], ['generation'] * 3)
+            self.assertEqual(''.join(message['response'] for message in messages), 'Привет')
+            self.assertTrue(messages[-1]['done'])
+            self.assertEqual(messages[-1]['eval_count'], 2)
+            self.assertEqual(messages[0]['request_id'], 7)
+            
+            await communicator.disconnect()
+        
+        with patch.object(SimpleFileManagerConsumer, 'start_file_watcher', AsyncMock()), \
+                patch.object(OllamaService, 'generate_stream', fake_stream):
+            async_to_sync(run_test)()
+    
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_subscribe_analysis_progress(self):
+        """Тест подписки на ход анализа через WebSocket"""
+        analysis = AIAnalysis.objects.create(
+            user=self.user,
+            ai_model=AIModel.objects.create(name='llama', model_type='text_analysis'),
+            analysis_type='text',
+            input_data='Привет'
+        )
+        
+        async def run_test():
+            communicator = WebsocketCommunicator(SimpleFileManagerConsumer.as_asgi(), '/ws/filemanager/')
+            communicator.scope['user'] = self.user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await communicator.receive_json_from()  # connection_status
+            
+            await communicator.send_json_to({'action': 'subscribe_analysis', 'analysis_id': analysis.id})
+            current = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(current['type'], 'analysis_progress')
+            self.assertEqual(current['status'], 'pending')
+            
+            await get_channel_layer().group_send(analysis_group(analysis.id), {
+                'type': 'analysis.progress',
+                'analysis': {'analysis_id': analysis.id, 'status': 'completed', 'result': {'analysis': 'ok'}}
+            })
+            pushed = await communicator.receive_json_from(timeout=2)
+            self.assertEqual(pushed['status'], 'completed')
+            self.assertEqual(pushed['result'], {'analysis': 'ok'})
+            
+            await communicator.disconnect()
+        
+        with patch.object(SimpleFileManagerConsumer, 'start_file_watcher', AsyncMock()):
+            async_to_sync(run_test)()
+    
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_subscribe_analysis_requires_owner(self):
+        """Тест: на чужой анализ и без аутентификации подписаться нельзя"""
+        other = User.objects.create_user('other', password='x')
+        analysis = AIAnalysis.objects.create(
+            user=other,
+            ai_model=AIModel.objects.create(name='llama', model_type='text_analysis'),
+            analysis_type='text',
+            input_data='Привет'
+        )
+        
+        async def subscribe(user):
+            communicator = WebsocketCommunicator(SimpleFileManagerConsumer.as_asgi(), '/ws/filemanager/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            await communicator.receive_json_from()  # connection_status
+            await communicator.send_json_to({'action': 'subscribe_analysis', 'analysis_id': analysis.id})
+            reply = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return reply
+        
+        with patch.object(SimpleFileManagerConsumer, 'start_file_watcher', AsyncMock()):
+            for user in (self.user, AnonymousUser()):
+                reply = async_to_sync(subscribe)(user)
+                self.assertEqual(reply['type'], 'error')
+                self.assertNotIn('result', reply)
+    
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_subscribe_archiving_job_requires_owner(self):
+        """Тест: на ход задания архивирования подписываются автор и персонал"""
+        owner = User.objects.create_user('archivist', password='x')
+        staff = User.objects.create_user('admin', password='x', is_staff=True)
+        policy = RetentionPolicy.objects.create(name='1 год', retention_period=1, period_type='years')
+        category = ArchiveCategory.objects.create(name='General', retention_policy=policy, created_by=owner)
+        job = ArchivingJob.objects.create(
+            job_type='manual', source_paths=[], target_category=category, total_files=1, created_by=owner
+        )
+        
+        async def subscribe(user):
+            communicator = WebsocketCommunicator(SimpleFileManagerConsumer.as_asgi(), '/ws/filemanager/')
+            communicator.scope['user'] = user
+            await communicator.connect()
+            await communicator.receive_json_from()  # connection_status
+            await communicator.send_json_to({'action': 'subscribe_archiving_job', 'job_id': str(job.id)})
+            reply = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return reply['type']
+        
+        with patch.object(SimpleFileManagerConsumer, 'start_file_watcher', AsyncMock()):
+            self.assertEqual(
+                [async_to_sync(subscribe)(user) for user in (owner, staff, self.user, AnonymousUser())],
+                ['archiving_progress', 'archiving_progress', 'error', 'error']
+            )
@@ -12,6 +12,10 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hello_world.settings")
 
 # Импортируем конфигурацию WebSocket после установки переменной окружения
 from filemanager.routing import websocket_urlpatterns  # noqa
+from ai_integration.services.metrics import start_metrics_flusher  # noqa
+
+# Запись метрик вызовов Ollama в AIModelPerformance / AIUsageStatistics
+start_metrics_flusher()
 
 application = ProtocolTypeRouter(
     {
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_init, worker_ready
 from django.conf import settings
 from .celerybeat_schedule import CELERYBEAT_SCHEDULE
 
@@ -28,3 +29,15 @@ app.conf.update(
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
+
+@worker_ready.connect
+def preload_ollama_models(**kwargs):
+    """Предзагрузка моделей Ollama при старте воркера (OLLAMA_PRELOAD_MODELS)"""
+    from ai_integration.services.ollama_service import get_ollama_service
+    get_ollama_service().models.sync_preload()
+
+@worker_process_init.connect
+def start_ai_metrics_flusher(**kwargs):
+    """Запись метрик вызовов Ollama в БД из каждого процесса воркера"""
+    from ai_integration.services.metrics import start_metrics_flusher
+    start_metrics_flusher()
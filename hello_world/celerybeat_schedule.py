@@ -22,6 +22,22 @@ CELERYBEAT_SCHEDULE = {
         'schedule': crontab(hour=3, minute=0),  # Каждый день в 3:00
     },
     
+    'collect-blob-garbage': {
+        'task': 'archive.tasks.collect_blob_garbage',
+        'schedule': crontab(hour=3, minute=30),  # Каждый день в 3:30
+    },
+    
+    'compute-related-documents': {
+        'task': 'archive.tasks.compute_related_documents',
+        'schedule': crontab(minute='*/15'),  # Каждые 15 минут (только новые документы)
+    },
+    
+    'recompute-related-documents': {
+        'task': 'archive.tasks.compute_related_documents',
+        'schedule': crontab(hour=4, minute=0),  # Каждый день в 4:00 (полный пересчет)
+        'kwargs': {'full': True},
+    },
+    
     'generate-analytics-report': {
         'task': 'archive.tasks.generate_analytics_report',
         'schedule': crontab(hour=1, minute=0),  # Каждый день в 1:00
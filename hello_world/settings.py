@@ -215,6 +215,17 @@ FILE_UPLOAD_MAX_MEMORY_SIZE = MAX_UPLOAD_SIZE
 DATA_UPLOAD_MAX_MEMORY_SIZE = MAX_UPLOAD_SIZE
 FILE_UPLOAD_PERMISSIONS = 0o644
 
+# Контрольные суммы файлов (filemanager.services.checksum)
+FILE_CHECKSUM_WORKERS = config('FILE_CHECKSUM_WORKERS', default=0, cast=int)  # потоков хеширования; 0 — по числу ядер (до 8)
+FILE_CHECKSUM_BUFFER_SIZE = config('FILE_CHECKSUM_BUFFER_SIZE', default=1024 * 1024, cast=int)  # байт на чтение
+FILE_CHECKSUM_MMAP_THRESHOLD = config('FILE_CHECKSUM_MMAP_THRESHOLD', default=64 * 1024 * 1024, cast=int)  # файлы больше — через mmap; 0 — без mmap
+FILE_CHECKSUM_MEMO_SIZE = config('FILE_CHECKSUM_MEMO_SIZE', default=100000, cast=int)  # запомненных сумм
+
+# Хранилище содержимого по SHA-256 (filemanager.services.blobstore)
+BLOB_STORE_ENABLED = config('BLOB_STORE_ENABLED', default=True, cast=bool)
+BLOB_STORE_ROOT = config('BLOB_STORE_ROOT', default=str(Path(MEDIA_ROOT) / 'blobs'))
+BLOB_STORE_GC_GRACE = config('BLOB_STORE_GC_GRACE', default=3600, cast=int)  # секунд до удаления блоба без ссылок
+
 # Allowed file types
 ALLOWED_FILE_TYPES = config('ALLOWED_FILE_TYPES', default='.txt,.pdf,.docx,.py,.js,.html,.css,.md,.json,.xml').split(',')
 
@@ -236,6 +247,70 @@ OLLAMA_BASE_URL = config('OLLAMA_BASE_URL', default='http://localhost:11434')
 OLLAMA_DEFAULT_MODEL = config('OLLAMA_DEFAULT_MODEL', default='llama3.2:1b')
 OLLAMA_TIMEOUT = config('OLLAMA_TIMEOUT', default=60, cast=int)
 OLLAMA_MAX_TOKENS = config('OLLAMA_MAX_TOKENS', default=4096, cast=int)
+OLLAMA_EMBEDDING_MODEL = config('OLLAMA_EMBEDDING_MODEL', default='nomic-embed-text')
+OLLAMA_POOL_MAX_CONNECTIONS = config('OLLAMA_POOL_MAX_CONNECTIONS', default=20, cast=int)
+OLLAMA_POOL_MAX_KEEPALIVE = config('OLLAMA_POOL_MAX_KEEPALIVE', default=10, cast=int)
+OLLAMA_POOL_KEEPALIVE_EXPIRY = config('OLLAMA_POOL_KEEPALIVE_EXPIRY', default=30, cast=int)  # секунд
+OLLAMA_RESPONSE_CACHE_BACKEND = config('OLLAMA_RESPONSE_CACHE_BACKEND', default='memory')  # memory | django | none
+OLLAMA_RESPONSE_CACHE_ALIAS = config('OLLAMA_RESPONSE_CACHE_ALIAS', default='default')  # алиас CACHES для backend=django
+OLLAMA_RESPONSE_CACHE_TTL = config('OLLAMA_RESPONSE_CACHE_TTL', default=24 * 3600, cast=int)
+OLLAMA_RESPONSE_CACHE_SIZE = config('OLLAMA_RESPONSE_CACHE_SIZE', default=1000, cast=int)
+OLLAMA_RESPONSE_CACHE_SEMANTIC = config('OLLAMA_RESPONSE_CACHE_SEMANTIC', default=False, cast=bool)
+OLLAMA_RESPONSE_CACHE_SIMILARITY = config('OLLAMA_RESPONSE_CACHE_SIMILARITY', default=0.97, cast=float)
+OLLAMA_ANALYSIS_ASYNC = config('OLLAMA_ANALYSIS_ASYNC', default=True, cast=bool)  # анализ в задаче Celery, ответ 202
+OLLAMA_MAX_CONCURRENCY = config('OLLAMA_MAX_CONCURRENCY', default=2, cast=int)  # одновременных запросов на модель
+# Лимиты для отдельных моделей: "llama3.2:1b=1,nomic-embed-text=4"
+OLLAMA_MODEL_CONCURRENCY = {
+    name.strip(): int(limit)
+    for name, _, limit in (
+        item.rpartition('=') for item in config('OLLAMA_MODEL_CONCURRENCY', default='').split(',') if '=' in item
+    )
+}
+OLLAMA_CHUNK_TOKENS = config('OLLAMA_CHUNK_TOKENS', default=2048, cast=int)  # размер части длинного документа
+OLLAMA_CHUNK_OVERLAP_TOKENS = config('OLLAMA_CHUNK_OVERLAP_TOKENS', default=128, cast=int)
+OLLAMA_REDUCE_TOKENS = config('OLLAMA_REDUCE_TOKENS', default=3072, cast=int)  # порог свертки изложений частей
+OLLAMA_CHARS_PER_TOKEN = config('OLLAMA_CHARS_PER_TOKEN', default=3.0, cast=float)  # оценка токенов по длине текста
+OLLAMA_PRELOAD_MODELS = config('OLLAMA_PRELOAD_MODELS', default=f'{OLLAMA_DEFAULT_MODEL},{OLLAMA_EMBEDDING_MODEL}')  # загрузка при старте воркера
+OLLAMA_PRELOAD_KEEP_ALIVE = config('OLLAMA_PRELOAD_KEEP_ALIVE', default='-1m')  # отрицательное значение — не выгружать
+OLLAMA_KEEP_ALIVE = config('OLLAMA_KEEP_ALIVE', default='30m')  # для остальных моделей
+OLLAMA_MAX_RESIDENT_MODELS = config('OLLAMA_MAX_RESIDENT_MODELS', default=2, cast=int)  # 0 — без ограничения
+OLLAMA_MODEL_USAGE_HALF_LIFE = config('OLLAMA_MODEL_USAGE_HALF_LIFE', default=600, cast=int)  # секунд, затухание частоты использования
+OLLAMA_METRICS_FLUSH_INTERVAL = config('OLLAMA_METRICS_FLUSH_INTERVAL', default=60, cast=int)  # секунд, запись метрик в БД; 0 — не записывать
+OLLAMA_HEALTH_TTL = config('OLLAMA_HEALTH_TTL', default=30, cast=int)  # секунд
+OLLAMA_BREAKER_FAILURE_THRESHOLD = config('OLLAMA_BREAKER_FAILURE_THRESHOLD', default=5, cast=int)
+OLLAMA_BREAKER_RESET_TIMEOUT = config('OLLAMA_BREAKER_RESET_TIMEOUT', default=30, cast=int)  # секунд до пробного запроса
+OLLAMA_BREAKER_HALF_OPEN_CALLS = config('OLLAMA_BREAKER_HALF_OPEN_CALLS', default=1, cast=int)
+
+# Archive Search Settings
+ARCHIVE_EMBEDDING_DTYPE = config('ARCHIVE_EMBEDDING_DTYPE', default='float32')  # float32 | float16
+ARCHIVE_VECTOR_INDEX_REFRESH_SECONDS = config('ARCHIVE_VECTOR_INDEX_REFRESH_SECONDS', default=60, cast=int)
+ARCHIVE_VECTOR_BACKEND = config('ARCHIVE_VECTOR_BACKEND', default='exact')  # exact | ivf | int8 | pq
+ARCHIVE_VECTOR_INDEX_DIR = config('ARCHIVE_VECTOR_INDEX_DIR', default=str(Path(MEDIA_ROOT) / 'archive_index'))
+ARCHIVE_IVF_NLIST = config('ARCHIVE_IVF_NLIST', default=0, cast=int)  # 0 = 4 * sqrt(N)
+ARCHIVE_IVF_NPROBE = config('ARCHIVE_IVF_NPROBE', default=8, cast=int)
+ARCHIVE_PQ_SUBSPACES = config('ARCHIVE_PQ_SUBSPACES', default=96, cast=int)  # байт на вектор для pq
+ARCHIVE_QUANTIZATION_RERANK = config('ARCHIVE_QUANTIZATION_RERANK', default=4, cast=int)  # кандидатов на k для пересчета
+ARCHIVE_QUANTIZATION_MIN_TRAIN = config('ARCHIVE_QUANTIZATION_MIN_TRAIN', default=1024, cast=int)
+ARCHIVE_FULLTEXT_SEARCH_LIMIT = config('ARCHIVE_FULLTEXT_SEARCH_LIMIT', default=500, cast=int)
+ARCHIVE_SEARCH_STREAM_SHARD_SIZE = config('ARCHIVE_SEARCH_STREAM_SHARD_SIZE', default=20000, cast=int)  # строк индекса на шаг
+ARCHIVE_RELATED_DOCUMENTS_COUNT = config('ARCHIVE_RELATED_DOCUMENTS_COUNT', default=10, cast=int)
+ARCHIVE_RELATED_BLOCK_SIZE = config('ARCHIVE_RELATED_BLOCK_SIZE', default=512, cast=int)  # строк матрицы за проход
+ARCHIVE_BULK_CHUNK_SIZE = config('ARCHIVE_BULK_CHUNK_SIZE', default=500, cast=int)  # файлов на транзакцию пакетного архивирования
+ARCHIVE_PIPELINE_HASH_WORKERS = config('ARCHIVE_PIPELINE_HASH_WORKERS', default=0, cast=int)  # потоков checksum задания; 0 — по числу ядер (до 8)
+ARCHIVE_PIPELINE_AI_WORKERS = config('ARCHIVE_PIPELINE_AI_WORKERS', default=0, cast=int)  # одновременных ИИ анализов; 0 — вдвое больше слотов модели
+ARCHIVE_PIPELINE_EMBEDDING_WORKERS = config('ARCHIVE_PIPELINE_EMBEDDING_WORKERS', default=2, cast=int)  # пакетов embeddings одновременно
+ARCHIVE_PIPELINE_BATCH_SIZE = config('ARCHIVE_PIPELINE_BATCH_SIZE', default=100, cast=int)  # документов на запись в БД
+ARCHIVE_PIPELINE_QUEUE_SIZE = config('ARCHIVE_PIPELINE_QUEUE_SIZE', default=256, cast=int)  # элементов в очереди между стадиями
+ARCHIVE_PIPELINE_FLUSH_INTERVAL = config('ARCHIVE_PIPELINE_FLUSH_INTERVAL', default=0.5, cast=float)  # секунд ожидания неполного пакета
+ARCHIVE_JOB_PROGRESS_INTERVAL = config('ARCHIVE_JOB_PROGRESS_INTERVAL', default=2.0, cast=float)  # секунд между записями хода задания
+ARCHIVE_JOB_PROGRESS_EVERY = config('ARCHIVE_JOB_PROGRESS_EVERY', default=100, cast=int)  # или после стольких файлов
+ARCHIVE_EMBEDDING_BATCH_SIZE = config('ARCHIVE_EMBEDDING_BATCH_SIZE', default=64, cast=int)
+ARCHIVE_EMBEDDING_TEXT_LIMIT = config('ARCHIVE_EMBEDDING_TEXT_LIMIT', default=8000, cast=int)  # символов на документ
+ARCHIVE_TEXT_EXTRACTION_WORKERS = config('ARCHIVE_TEXT_EXTRACTION_WORKERS', default=8, cast=int)
+ARCHIVE_EMBEDDING_VERSION = config('ARCHIVE_EMBEDDING_VERSION', default='1.0')
+ARCHIVE_EMBEDDING_CACHE_SIZE = config('ARCHIVE_EMBEDDING_CACHE_SIZE', default=10000, cast=int)  # записей в памяти процесса
+ARCHIVE_EMBEDDING_CACHE_ALIAS = config('ARCHIVE_EMBEDDING_CACHE_ALIAS', default='')  # алиас CACHES для общего кэша
+ARCHIVE_EMBEDDING_CACHE_TIMEOUT = config('ARCHIVE_EMBEDDING_CACHE_TIMEOUT', default=30 * 24 * 3600, cast=int)
 
 # File Storage Settings
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hello_world.settings")
 
 application = get_wsgi_application()
+
+from ai_integration.services.metrics import start_metrics_flusher  # noqa
+
+# Запись метрик вызовов Ollama в AIModelPerformance / AIUsageStatistics
+start_metrics_flusher()